@@ -1,9 +1,12 @@
-import re
+import hmac
 import asyncio
 import base64
+import hashlib
 from pyrogram import Client, enums
 from cache import user_file_count
-from config import API_ID, API_HASH, BOT_TOKEN
+from config import API_ID, API_HASH, BOT_TOKEN, MY_DOMAIN, STREAM_LINK_SECRET
+from scheduler import scheduler
+from normalize import sanitize_query
 
 class Bot(Client):
     def __init__(self, *args, **kwargs):
@@ -14,27 +17,41 @@ class Bot(Client):
         self.MAX_FILES_PER_SESSION = 10
         self.PAGE_SIZE = 10
 
+    async def invoke(self, query, *args, **kwargs):
+        # Every API call goes through the shared scheduler (rate limits, priorities, FloodWait retries)
+        return await scheduler.run(lambda: super(Bot, self).invoke(query, *args, **kwargs), query)
+
     def sanitize_query(self, query):
         """Sanitizes and normalizes a search query for consistent matching of 'and' and '&'."""
-        query = query.strip().lower()
-        query = re.sub(r"\s*&\s*", " and ", query)
-        query = re.sub(r"[:',]", "", query)
-        query = re.sub(r"[.\s_\-\(\)\[\]!]+", " ", query).strip()
-        return query
+        return sanitize_query(query)
 
     def remove_surrogates(self, text):
         return ''.join(c for c in text if not (0xD800 <= ord(c) <= 0xDFFF))
 
+    def _sign_file_link(self, payload):
+        digest = hmac.new(STREAM_LINK_SECRET.encode(), payload.encode(), hashlib.sha256).digest()
+        return base64.urlsafe_b64encode(digest[:16]).decode().rstrip("=")
+
     def encode_file_link(self, channel_id, message_id):
         raw = f"{channel_id}_{message_id}".encode()
-        return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+        payload = base64.urlsafe_b64encode(raw).decode().rstrip("=")
+        return f"{payload}.{self._sign_file_link(payload)}"
+
+    def decode_file_link(self, file_link):
+        """Inverse of encode_file_link. Raises ValueError for malformed or unsigned links."""
+        payload, _, signature = file_link.partition(".")
+        if not signature or not hmac.compare_digest(signature, self._sign_file_link(payload)):
+            raise ValueError(f"Invalid file link signature: {file_link}")
+        try:
+            padding = '=' * (-len(payload) % 4)
+            decoded = base64.urlsafe_b64decode(payload + padding).decode()
+            channel_id, message_id = map(int, decoded.split("_"))
+        except Exception as e:
+            raise ValueError(f"Invalid file link: {file_link}") from e
+        return channel_id, message_id
 
-    async def get_stream_link(self, channel_id, message_id):
-        # This is a placeholder. The actual implementation will depend on how
-        # you get the stream link from Telegram.
-        # You might need to use a method like `get_messages` and then access
-        # a `stream_url` attribute or something similar.
-        return f"https://t.me/c/{str(channel_id)[4:]}/{message_id}"
+    def get_stream_link(self, channel_id, message_id):
+        return f"{MY_DOMAIN}/player/{self.encode_file_link(channel_id, message_id)}"
 
 
 bot = Bot(
@@ -42,5 +59,7 @@ bot = Bot(
     api_id=API_ID,
     api_hash=API_HASH,
     bot_token=BOT_TOKEN,
-    parse_mode=enums.ParseMode.HTML
+    parse_mode=enums.ParseMode.HTML,
+    # FloodWait is handled by the scheduler, not by sleeping inside the session
+    sleep_threshold=0
 )
@@ -0,0 +1,205 @@
+"""
+Latency of /api/movies under concurrent clients, before and after user-001.
+
+Needs a reachable MongoDB (MONGO_URI or --mongo-uri). A scratch database is
+seeded with --docs TMDB entries and dropped afterwards. Both apps run under
+uvicorn on this process's event loop, as in bot.py, where the API shares
+the loop with the bot:
+
+  before  the old handler: synchronous pymongo find/count_documents on the loop
+  after   the current fast_api.get_movies on AsyncMongoClient
+
+Every client requests a random page, sort, category or search. The
+response and count caches are bypassed unless --with-cache is given, so
+each request reaches Mongo in both modes. "loop lag" is how late a 10 ms
+timer fires while the benchmark runs, i.e. how long the bot's own handlers
+would have been stalled.
+
+    python benchmarks/bench_api_movies.py --clients 200 --requests 20
+"""
+import os
+import re
+import time
+import random
+import asyncio
+import argparse
+
+import common
+import aiohttp
+import uvicorn
+from fastapi import FastAPI
+from pymongo import MongoClient, AsyncMongoClient, ASCENDING, DESCENDING
+
+import utility
+import fast_api
+
+WORDS = ["night", "dark", "love", "war", "city", "king", "last", "return", "star", "house"]
+
+
+def seed(uri, db_name, docs):
+    col = MongoClient(uri)[db_name]["tmdb"]
+    col.drop()
+    rng = random.Random(1)
+    col.insert_many([
+        {
+            "tmdb_id": i,
+            "tmdb_type": rng.choice(("movie", "tv")),
+            "title": " ".join(rng.sample(WORDS, 3)).title() + f" {i}",
+            "year": rng.randint(1970, 2025),
+            "rating": round(rng.uniform(1, 10), 1),
+            "description": "x" * 300,
+            "poster": f"/poster{i}.jpg",
+        }
+        for i in range(docs)
+    ])
+    # The tmdb indexes from db.INDEX_MANIFEST
+    col.create_index([("tmdb_id", ASCENDING), ("tmdb_type", ASCENDING)])
+    col.create_index([("year", DESCENDING), ("_id", DESCENDING)])
+    col.create_index([("rating", DESCENDING), ("_id", DESCENDING)])
+
+
+def before_app(uri, db_name):
+    """/api/movies as it was before user-001."""
+    tmdb_col = MongoClient(uri)[db_name]["tmdb"]
+    app = FastAPI()
+
+    @app.get("/api/movies")
+    async def get_movies(page: int = 1, search: str = None, category: str = None, sort: str = "year"):
+        page_size = 10
+        skip = (page - 1) * page_size
+        query = {}
+        if search:
+            query["title"] = {"$regex": re.escape(search), "$options": "i"}
+        if category:
+            query["tmdb_type"] = category
+        if sort == "rating":
+            sort_order = [("rating", -1), ("_id", -1)]
+        elif sort == "year":
+            sort_order = [("year", -1), ("_id", -1)]
+        else:
+            sort_order = [("_id", -1)]
+        movies = list(tmdb_col.find(query).sort(sort_order).skip(skip).limit(page_size))
+        total_movies = tmdb_col.count_documents(query)
+        for movie in movies:
+            movie["_id"] = str(movie["_id"])
+        return {
+            "movies": movies,
+            "total_pages": (total_movies + page_size - 1) // page_size,
+            "current_page": page,
+        }
+
+    return app
+
+
+class NoCache:
+    def get(self, key):
+        return None
+
+    def set(self, key, value):
+        pass
+
+
+def after_app(uri, db_name, with_cache):
+    """The current fast_api app, reading the scratch database."""
+    fast_api.tmdb_col = AsyncMongoClient(uri)[db_name]["tmdb"]
+    fast_api.api.dependency_overrides[fast_api.get_current_user] = lambda: 1
+    if not with_cache:
+        fast_api.search_cache = NoCache()
+        utility.count_cache = NoCache()
+    return fast_api.api
+
+
+def random_params(rng):
+    params = {"page": rng.randint(1, 20), "sort": rng.choice(("year", "rating", "recent"))}
+    roll = rng.random()
+    if roll < 0.3:
+        params["category"] = rng.choice(("movie", "tv"))
+    elif roll < 0.5:
+        params["search"] = rng.choice(WORDS)
+    return params
+
+
+async def measure_loop_lag(stop, lags, interval=0.01):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        lags.append(max(loop.time() - expected, 0.0))
+
+
+async def run_mode(label, app, args):
+    config = uvicorn.Config(app, host="127.0.0.1", port=args.port, loop="asyncio", log_level="warning")
+    server = uvicorn.Server(config)
+    serve_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    url = f"http://127.0.0.1:{args.port}/api/movies"
+    latencies = []
+    errors = 0
+    stop = asyncio.Event()
+    lags = []
+
+    async def client(session, rng):
+        nonlocal errors
+        for _ in range(args.requests):
+            started = time.perf_counter()
+            try:
+                async with session.get(url, params=random_params(rng)) as resp:
+                    await resp.read()
+                    if resp.status != 200:
+                        errors += 1
+            except aiohttp.ClientError:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    async def warm_up(session):
+        async with session.get(url) as resp:
+            await resp.read()
+
+    connector = aiohttp.TCPConnector(limit=args.clients)
+    headers = {"Authorization": "Bearer bench"}
+    try:
+        async with aiohttp.ClientSession(connector=connector, headers=headers) as session:
+            # Warm up connections and the Mongo pool
+            await asyncio.gather(*(warm_up(session) for _ in range(min(args.clients, 20))))
+            lag_task = asyncio.create_task(measure_loop_lag(stop, lags))
+            started = time.perf_counter()
+            await asyncio.gather(*(client(session, random.Random(i)) for i in range(args.clients)))
+            elapsed = time.perf_counter() - started
+            stop.set()
+            await lag_task
+    finally:
+        server.should_exit = True
+        await serve_task
+
+    print(common.summarize(f"{label:<6} latency", latencies))
+    print(f"{label:<6} {len(latencies) / elapsed:.0f} req/s, {errors} errors, "
+          f"loop lag max {max(lags, default=0) * 1000:.1f}ms "
+          f"p99 {common.percentile(lags, 99) * 1000:.1f}ms")
+
+
+async def main(args):
+    print(f"{args.clients} clients x {args.requests} requests, {args.docs} documents")
+    await run_mode("before", before_app(args.mongo_uri, args.db), args)
+    await run_mode("after", after_app(args.mongo_uri, args.db, args.with_cache), args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongo-uri", default=os.environ["MONGO_URI"])
+    parser.add_argument("--db", default="bench_sharing_bot", help="scratch database, dropped afterwards")
+    parser.add_argument("--docs", type=int, default=20000)
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=20, help="requests per client")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--with-cache", action="store_true", help="keep the response and count caches")
+    parser.add_argument("--keep", action="store_true", help="do not drop the scratch database")
+    args = parser.parse_args()
+
+    seed(args.mongo_uri, args.db, args.docs)
+    try:
+        asyncio.run(main(args))
+    finally:
+        if not args.keep:
+            MongoClient(args.mongo_uri).drop_database(args.db)
@@ -0,0 +1,115 @@
+"""
+normalize.py against the per-call regexes it replaced in user-025.
+
+The corpus is benchmarks/release_names.txt, one file name or caption per
+line, as posted in the source channels. The old implementations are
+copied here verbatim. Every name is first checked to give the same output
+both ways, then each function is timed over the corpus repeated to
+--names names.
+
+    python benchmarks/bench_normalize.py --names 10000 --repeat 5
+"""
+import os
+import re
+import timeit
+import argparse
+import itertools
+
+import common
+import normalize
+
+CORPUS = os.path.join(common.BENCH_DIR, "release_names.txt")
+
+
+# --- Before user-025 ---------------------------------------------------------
+
+def old_sanitize_query(query):
+    query = query.strip().lower()
+    query = re.sub(r"\s*&\s*", " and ", query)
+    query = re.sub(r"[:',]", "", query)
+    query = re.sub(r"[.\s_\-\(\)\[\]!]+", " ", query).strip()
+    return query
+
+
+def old_remove_extension(caption):
+    return re.sub(r'\.(mkv|mp4|webm).*$', '', caption, flags=re.IGNORECASE)
+
+
+def old_clean_file_name(name):
+    return old_remove_extension(re.sub(r"[',]", "", name.replace("&", "and")))
+
+
+def old_remove_unwanted(caption):
+    match = re.match(r'^(.*?\.(mkv|mp4|webm))', caption, flags=re.IGNORECASE)
+    return match.group(1) if match else caption
+
+
+def old_remove_redandent(filename):
+    filename = filename.replace("\n", "\\n")
+    patterns = [
+        r"^@[\w\.-]+?(?=_)",
+        r"_@[A-Za-z]+_|@[A-Za-z]+_|[\[\]\s@]*@[^.\s\[\]]+[\]\[\s@]*",
+        r"^[\w\.-]+?(?=_Uploads_)",
+        r"^(?:by|from)[\s_-]+[\w\.-]+?(?=_)",
+        r"^\[[\w\.-]+?\][\s_-]*",
+        r"^\([\w\.-]+?\)[\s_-]*",
+    ]
+    result = filename
+    for pattern in patterns:
+        if re.search(pattern, result):
+            result = re.sub(pattern, " ", result)
+            break
+    return re.sub(r"^[_\s-]+|[_\s-]+$", " ", result)
+
+
+def old_clean_and_tokenize(names):
+    return [(cleaned, old_sanitize_query(cleaned).split()) for cleaned in map(old_clean_file_name, names)]
+
+
+# -----------------------------------------------------------------------------
+
+PAIRS = [
+    ("sanitize_query", old_sanitize_query, normalize.sanitize_query),
+    ("clean_file_name", old_clean_file_name, normalize.clean_file_name),
+    ("keep_up_to_extension", old_remove_unwanted, normalize.keep_up_to_extension),
+    ("strip_uploader_tags", old_remove_redandent, normalize.strip_uploader_tags),
+]
+
+
+def load_corpus(path):
+    with open(path, encoding="utf-8") as f:
+        return [line.rstrip("\n") for line in f if line.strip()]
+
+
+def check_equivalence(names):
+    for label, old, new in PAIRS:
+        for name in names:
+            assert old(name) == new(name), f"{label} differs for {name!r}: {old(name)!r} != {new(name)!r}"
+
+
+def time_ms(func, repeat):
+    return min(timeit.repeat(func, number=1, repeat=repeat)) * 1000
+
+
+def main(args):
+    corpus = load_corpus(args.corpus)
+    check_equivalence(corpus)
+    names = list(itertools.islice(itertools.cycle(corpus), args.names))
+    print(f"{len(corpus)} distinct names, outputs identical; timing {len(names)} names, best of {args.repeat}")
+
+    for label, old, new in PAIRS:
+        before = time_ms(lambda: [old(name) for name in names], args.repeat)
+        after = time_ms(lambda: [new(name) for name in names], args.repeat)
+        print(f"  {label:<22} {before:7.1f} ms -> {after:7.1f} ms  ({before / after:.2f}x)")
+
+    before = time_ms(lambda: old_clean_and_tokenize(names), args.repeat)
+    after = time_ms(lambda: normalize.normalize_names(names), args.repeat)
+    print(f"  {'clean + tokenize':<22} {before:7.1f} ms -> {after:7.1f} ms  ({before / after:.2f}x, normalize_names)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=CORPUS)
+    parser.add_argument("--names", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    main(parser.parse_args())
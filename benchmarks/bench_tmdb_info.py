@@ -0,0 +1,164 @@
+"""
+Wall time of tmdb.get_info per title, before and after user-009.
+
+A local HTTP server stands in for TMDB and the IMDb mirror, answering every
+request after --latency seconds. "before" replays the old request pattern:
+details, images and videos awaited one after another, plus blocking
+requests.get calls for credits (and external_ids for TV) on the event loop.
+"after" is the current get_info, one append_to_response request.
+
+Each mode is timed for titles looked up one at a time and for --concurrency
+titles at once, which is where blocking calls on the loop show up.
+
+    python benchmarks/bench_tmdb_info.py --titles 40 --latency 0.08
+"""
+import time
+import asyncio
+import argparse
+import threading
+
+import common  # noqa: F401  (environment and sys.path)
+import requests
+from aiohttp import web
+
+import tmdb
+from http_client import http_client
+
+TMDB_HOST = "https://api.themoviedb.org"
+IMDB_HOST = "https://imdb.iamidiotareyoutoo.com"
+
+DETAILS = {
+    "id": 1, "title": "Bench Movie", "name": "Bench Show", "imdb_id": "tt0000001",
+    "release_date": "2024-01-01", "first_air_date": "2024-01-01", "runtime": 120,
+    "overview": "A movie used for benchmarking.", "poster_path": "/poster.jpg",
+    "genres": [{"name": "Drama"}], "spoken_languages": [{"name": "English"}],
+}
+IMAGES = {"backdrops": [{"file_path": "/backdrop.jpg"}]}
+VIDEOS = {"results": [{"site": "YouTube", "type": "Trailer", "key": "abc"}]}
+CREDITS = {"cast": [{"name": f"Actor {i}"} for i in range(10)], "crew": [{"name": "Director", "job": "Director"}]}
+EXTERNAL_IDS = {"imdb_id": "tt0000001"}
+IMDB = {
+    "short": {"name": "Bench Movie", "aggregateRating": {"ratingValue": 7.5}, "description": "Plot."},
+    "top": {"releaseYear": {"year": 2024}},
+}
+
+
+def run_fake_upstream(latency, ready):
+    """Serve the fake TMDB/IMDb API on its own loop and thread; sets ready[0] to the base URL."""
+    async def handle(request):
+        await asyncio.sleep(latency)
+        path = request.path
+        if path.endswith("/images"):
+            body = IMAGES
+        elif path.endswith("/videos"):
+            body = VIDEOS
+        elif path.endswith("/credits"):
+            body = CREDITS
+        elif path.endswith("/external_ids"):
+            body = EXTERNAL_IDS
+        elif path.startswith("/search"):
+            body = IMDB
+        else:
+            body = dict(DETAILS)
+            if "append_to_response" in request.query:
+                body.update(images=IMAGES, videos=VIDEOS, credits=CREDITS, external_ids=EXTERNAL_IDS)
+        return web.json_response(body)
+
+    async def serve():
+        app = web.Application()
+        app.router.add_get("/{tail:.*}", handle)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        ready[0] = f"http://127.0.0.1:{port}"
+        ready[1].set()
+        await asyncio.Event().wait()
+
+    asyncio.run(serve())
+
+
+def local(url, base):
+    return url.replace(TMDB_HOST, base).replace(IMDB_HOST, base)
+
+
+async def get_info_before(base, tmdb_type, tmdb_id):
+    """The request pattern of get_info before user-009."""
+    api_key = tmdb.TMDB_API_KEY
+    api_url = f"{base}/3/{tmdb_type}/{tmdb_id}?api_key={api_key}&language=en-US"
+    image_url = f"{base}/3/{tmdb_type}/{tmdb_id}/images?api_key={api_key}&language=en-US&include_image_language=en,hi"
+    _, data = await http_client.get_json(api_url, "tmdb")
+    _, images = await http_client.get_json(image_url, "tmdb")
+    # format_tmdb_info: blocking credits call, then external_ids for TV
+    requests.get(f"{base}/3/{tmdb_type}/{tmdb_id}/credits?api_key={api_key}&language=en-US").json()
+    if tmdb_type == "tv":
+        imdb_id = requests.get(f"{base}/3/tv/{tmdb_id}/external_ids?api_key={api_key}").json().get("imdb_id")
+    else:
+        imdb_id = data.get("imdb_id")
+    await tmdb.get_imdb_details(imdb_id)
+    _, video_data = await http_client.get_json(f"{base}/3/{tmdb_type}/{tmdb_id}/videos?api_key={api_key}", "tmdb")
+    return data, images, video_data
+
+
+async def get_info_after(base, tmdb_type, tmdb_id):
+    return await tmdb.get_info(tmdb_type, tmdb_id, use_cache=False)
+
+
+async def time_titles(fetch, base, titles, concurrency, tmdb_type):
+    """Returns (per-title seconds, total seconds) for `titles` lookups."""
+    semaphore = asyncio.Semaphore(concurrency)
+    per_title = []
+
+    async def one(tmdb_id):
+        async with semaphore:
+            started = time.perf_counter()
+            await fetch(base, tmdb_type, tmdb_id)
+            per_title.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(1, titles + 1)))
+    return per_title, time.perf_counter() - started
+
+
+async def main(args):
+    ready = [None, threading.Event()]
+    threading.Thread(target=run_fake_upstream, args=(args.latency, ready), daemon=True).start()
+    ready[1].wait()
+    base = ready[0]
+
+    # Point http_client at the fake upstream
+    original_request = http_client.request
+
+    async def request(method, url, upstream, params=None, parse="json"):
+        return await original_request(method, local(url, base), upstream, params=params, parse=parse)
+
+    async def cache_store(key, value):
+        pass
+
+    http_client.request = request
+    # Responses are not cached, so there is no need for Mongo
+    tmdb.cache_store = cache_store
+    await http_client.start()
+    try:
+        print(f"{args.titles} {args.type} titles, {args.latency * 1000:.0f} ms upstream latency")
+        for concurrency in (1, args.concurrency):
+            for label, fetch in (("before", get_info_before), ("after", get_info_after)):
+                per_title, total = await time_titles(fetch, base, args.titles, concurrency, args.type)
+                mean = sum(per_title) / len(per_title)
+                print(
+                    f"  concurrency={concurrency:<3} {label:<6} "
+                    f"{mean * 1000:7.1f} ms/title (mean), total {total:6.2f}s, "
+                    f"{args.titles / total:6.1f} titles/s"
+                )
+    finally:
+        await http_client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--titles", type=int, default=40)
+    parser.add_argument("--latency", type=float, default=0.08, help="seconds per upstream response")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--type", choices=("movie", "tv"), default="tv")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,48 @@
+"""
+Shared setup for the scripts in benchmarks/.
+
+Run them from the repository root, e.g. `python benchmarks/bench_normalize.py`.
+Settings that config.py requires get harmless defaults, so a config.env is
+only needed when a benchmark talks to a real service.
+"""
+import os
+import sys
+import math
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+
+os.environ.setdefault("API_ID", "12345")
+os.environ.setdefault("API_HASH", "0123456789abcdef0123456789abcdef")
+os.environ.setdefault("BOT_TOKEN", "123456:BENCH")
+os.environ.setdefault("OWNER_ID", "1")
+os.environ.setdefault("LOG_CHANNEL_ID", "-1000000000001")
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")
+os.environ.setdefault("TMDB_API_KEY", "bench")
+os.environ.setdefault("STREAM_DISK_CACHE_MB", "0")
+
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = math.ceil(pct / 100 * len(ordered))
+    return ordered[min(max(rank, 1), len(ordered)) - 1]
+
+
+def summarize(label, seconds):
+    """One line with count, mean and tail latencies (in ms) of `seconds`."""
+    if not seconds:
+        return f"{label}: no samples"
+    mean = sum(seconds) / len(seconds)
+    return (
+        f"{label}: n={len(seconds)} mean={mean * 1000:.1f}ms "
+        f"p50={percentile(seconds, 50) * 1000:.1f}ms "
+        f"p95={percentile(seconds, 95) * 1000:.1f}ms "
+        f"p99={percentile(seconds, 99) * 1000:.1f}ms "
+        f"max={max(seconds) * 1000:.1f}ms"
+    )
@@ -4,29 +4,44 @@ import uvicorn
 import logging
 
 from app import bot
-from db import files_col
-from utility import file_queue_worker, periodic_expiry_cleanup
+from broadcast import broadcaster
+from http_client import http_client
+from client_pool import client_pool
+from db import ensure_indexes, verify_query_plans
+from utility import start_file_workers, migrate_expiry_fields, load_allowed_channels, refresh_allowed_channels, build_search_index
 from fast_api import api
-from config import LOG_CHANNEL_ID
+from config import LOG_CHANNEL_ID, ALLOWED_CHANNELS_REFRESH_SECONDS
 from handlers import owner, user
 
 async def main():
     """
     Starts the bot and FastAPI server.
     """
-    if "file_name_text" not in [idx["name"] for idx in files_col.list_indexes()]:
-        files_col.create_index([("file_name", "text")])
-
+    await http_client.start()
+    await migrate_expiry_fields()
+    await ensure_indexes()
+    slow_queries = await verify_query_plans()
+    await load_allowed_channels()
     await bot.start()
+    await client_pool.start()
 
     bot.loop.create_task(start_fastapi())
-    bot.loop.create_task(file_queue_worker(bot))
-    bot.loop.create_task(periodic_expiry_cleanup())
+    bot.loop.create_task(build_search_index())
+    start_file_workers(bot)
+    if ALLOWED_CHANNELS_REFRESH_SECONDS > 0:
+        bot.loop.create_task(refresh_allowed_channels(ALLOWED_CHANNELS_REFRESH_SECONDS))
+    bot.loop.create_task(broadcaster.resume(bot))
 
     try:
         me = await bot.get_me()
         user_name = me.username or "Bot"
         await bot.send_message(LOG_CHANNEL_ID, f"✅ @{user_name} started and FastAPI server running.")
+        if slow_queries:
+            await bot.send_message(
+                LOG_CHANNEL_ID,
+                "⚠️ Hot queries without an index (COLLSCAN):\n" +
+                "\n".join(f"• {collection}: {where}" for collection, where in slow_queries)
+            )
         logging.info("Bot started and FastAPI server running.")
     except Exception as e:
         print(f"Failed to send startup message to log channel: {e}")
@@ -48,7 +63,9 @@ if __name__ == "__main__":
         bot.loop.run_until_complete(main())
         bot.loop.run_forever()
     except KeyboardInterrupt:
+        bot.loop.run_until_complete(client_pool.stop())
         bot.stop()
+        bot.loop.run_until_complete(http_client.close())
         tasks = asyncio.all_tasks(loop=bot.loop)
         for task in tasks:
             task.cancel()
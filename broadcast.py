@@ -0,0 +1,183 @@
+import time
+import asyncio
+import logging
+from pyrogram.errors import UserIsBlocked, InputUserDeactivated, PeerIdInvalid, UserIsBot
+from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+
+from config import (
+    LOG_CHANNEL_ID,
+    BROADCAST_MESSAGES_PER_SECOND,
+    BROADCAST_CONCURRENCY,
+    BROADCAST_CHUNK_SIZE,
+)
+from db import users_col
+from ratelimit import TokenBucket
+from scheduler import with_priority, BULK
+from utility import (
+    load_checkpoint,
+    save_checkpoint,
+    clear_checkpoint,
+    ProgressEditor,
+    call_with_bucket,
+    safe_api_call,
+)
+
+logger = logging.getLogger(__name__)
+
+BROADCAST_CHECKPOINT = "broadcast"
+DEAD_USER_ERRORS = (UserIsBlocked, InputUserDeactivated, PeerIdInvalid, UserIsBot)
+CANCEL_MARKUP = InlineKeyboardMarkup(
+    [[InlineKeyboardButton("Cancel", callback_data="cancel_broadcast")]]
+)
+
+
+class Broadcaster:
+    """
+    Sends one message to every user in users_col.
+
+    Recipients are read in _id order, BROADCAST_CHUNK_SIZE at a time, and
+    sent under one global token bucket. After each chunk, dead users are
+    deleted in bulk and the last _id is saved in checkpoints_col. A run
+    interrupted by a restart is picked up again by resume().
+    """
+
+    def __init__(self, rate=BROADCAST_MESSAGES_PER_SECOND, concurrency=BROADCAST_CONCURRENCY,
+                 chunk_size=BROADCAST_CHUNK_SIZE):
+        self.bucket = TokenBucket(rate)
+        self.concurrency = concurrency
+        self.chunk_size = chunk_size
+        self.running = False
+        self.cancelled = False
+
+    def cancel(self):
+        if not self.running:
+            return False
+        self.cancelled = True
+        return True
+
+    @with_priority(BULK)
+    async def start(self, client, source, status_message):
+        """Broadcast `source` (a Message) and report progress on `status_message`."""
+        # Claimed before the first await so a second /broadcast is refused
+        self.running = True
+        try:
+            job = {
+                "from_chat_id": source.chat.id,
+                "message_id": source.id,
+                "last_id": None,
+                "sent": 0,
+                "failed": 0,
+                "removed": 0,
+                "total": await users_col.count_documents({}),
+            }
+            await save_checkpoint(BROADCAST_CHECKPOINT, **job)
+            await self._run(client, source, status_message, job)
+        finally:
+            self.running = False
+
+    @with_priority(BULK)
+    async def resume(self, client):
+        """Continue a broadcast that was interrupted by a restart, if any."""
+        if self.running:
+            return
+        self.running = True
+        try:
+            job = await load_checkpoint(BROADCAST_CHECKPOINT)
+            if not job:
+                return
+            job.pop("_id", None)
+            job.pop("updated_at", None)
+            source = await safe_api_call(client.get_messages(job["from_chat_id"], job["message_id"]))
+            if not source or source.empty:
+                logger.warning("Broadcast source message is gone, dropping the saved broadcast.")
+                await clear_checkpoint(BROADCAST_CHECKPOINT)
+                return
+            status_message = await client.send_message(
+                LOG_CHANNEL_ID, "📢 Resuming interrupted broadcast...", reply_markup=CANCEL_MARKUP
+            )
+            await self._run(client, source, status_message, job)
+        except Exception as e:
+            logger.error(f"Error resuming broadcast: {e}")
+        finally:
+            self.running = False
+
+    async def _copy(self, source, user_id):
+        if source.forward_from_chat:
+            caption = source.caption.html if source.caption else ""
+            return await source.copy(
+                chat_id=user_id,
+                caption=f"{caption}\n\n✅ <b>Now Available!</b>",
+                reply_markup=source.reply_markup
+            )
+        return await source.copy(user_id)
+
+    async def _send(self, source, user_id, semaphore):
+        async with semaphore:
+            try:
+                await call_with_bucket(self.bucket, lambda: self._copy(source, user_id))
+                return "sent"
+            except DEAD_USER_ERRORS:
+                return "removed"
+            except Exception as e:
+                logger.error(f"Error broadcasting to {user_id}: {e}")
+                return "failed"
+
+    def _status_text(self, job, started, done_at_start, title):
+        elapsed = max(time.monotonic() - started, 1e-6)
+        done = job["sent"] + job["failed"] + job["removed"] - done_at_start
+        return (
+            f"{title}\n\n"
+            f"👥 Total Users: {job['total']}\n"
+            f"✅ Sent: {job['sent']}\n"
+            f"❌ Failed: {job['failed']}\n"
+            f"🗑️ Removed: {job['removed']}\n"
+            f"⚡ {done / elapsed:.1f} msgs/s"
+        )
+
+    async def _run(self, client, source, status_message, job):
+        """Send to the remaining users; the caller owns `running`."""
+        self.cancelled = False
+        semaphore = asyncio.Semaphore(self.concurrency)
+        progress = ProgressEditor(status_message, reply_markup=CANCEL_MARKUP)
+        started = time.monotonic()
+        done_at_start = job["sent"] + job["failed"] + job["removed"]
+        try:
+            while not self.cancelled:
+                query = {"_id": {"$gt": job["last_id"]}} if job["last_id"] is not None else {}
+                chunk = await users_col.find(query, {"_id": 1, "user_id": 1}) \
+                    .sort("_id", 1).limit(self.chunk_size).to_list(None)
+                if not chunk:
+                    break
+
+                results = await asyncio.gather(*(
+                    self._send(source, user["user_id"], semaphore) for user in chunk
+                ))
+                dead = [user["user_id"] for user, result in zip(chunk, results) if result == "removed"]
+                if dead:
+                    await users_col.delete_many({"user_id": {"$in": dead}})
+                for result in results:
+                    job[result] += 1
+                job["last_id"] = chunk[-1]["_id"]
+                await save_checkpoint(BROADCAST_CHECKPOINT, **job)
+                await progress.update(self._status_text(job, started, done_at_start, "📢 Broadcast in progress..."))
+
+            await clear_checkpoint(BROADCAST_CHECKPOINT)
+            if self.cancelled:
+                await safe_api_call(status_message.edit_text("📢 **Broadcast cancelled.**"))
+            else:
+                elapsed = max(time.monotonic() - started, 1e-6)
+                done = job["sent"] + job["failed"] + job["removed"] - done_at_start
+                await safe_api_call(status_message.edit_text(
+                    self._status_text(job, started, done_at_start, "✅ **Broadcast finished!**") +
+                    f"\n⏱️ {done} users in {elapsed:.0f}s, "
+                    f"{self.bucket.waited:.0f}s spent waiting on the rate limit"
+                ))
+        except Exception:
+            # The checkpoint is kept, so the broadcast resumes after a restart
+            await safe_api_call(status_message.edit_text(
+                self._status_text(job, started, done_at_start, "⚠️ **Broadcast stopped by an error.**")
+            ))
+            raise
+
+
+broadcaster = Broadcaster()
@@ -1,5 +1,6 @@
 
-from cachetools import TTLCache
+from datetime import datetime, timezone, timedelta
+from cachetools import TTLCache, LRUCache
 
 # Cache for user file counts
 user_file_count = TTLCache(maxsize=1000, ttl=3600)
@@ -7,8 +8,121 @@ user_file_count = TTLCache(maxsize=1000, ttl=3600)
 # Cache for query IDs
 query_id_map = TTLCache(maxsize=1000, ttl=300)
 
-# Cache for search API results
-search_api_cache = TTLCache(maxsize=100, ttl=300)
+# Memo of parsed (title, year, kind) -> TMDB search result for process_tmdb_info
+tmdb_title_memo = TTLCache(maxsize=5000, ttl=6 * 3600)
 
-# Cache for search results
-search_cache = TTLCache(maxsize=100, ttl=300)
+# (tmdb_id, tmdb_type) pairs known to be stored in tmdb_col
+tmdb_stored = TTLCache(maxsize=5000, ttl=6 * 3600)
+
+# user_id -> (first_name, loaded_at) for profile and comment endpoints
+user_name_cache = LRUCache(maxsize=10000)
+
+# user_ids whose name could not be fetched from Telegram; not retried until they expire
+user_name_failures = TTLCache(maxsize=10000, ttl=300)
+
+
+
+class ResultCache:
+    """
+    Bounded LRU+TTL cache for API results with generation-based invalidation.
+
+    Keys include the current generation, so invalidate() only bumps a counter
+    and stale entries age out through the LRU/TTL instead of being cleared.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self._entries = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, key):
+        return (self.generation, key)
+
+    def get(self, key):
+        value = self._entries.get(self._key(key))
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self._entries[self._key(key)] = value
+
+    def invalidate(self):
+        self.generation += 1
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "generation": self.generation,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+# Cache for search and listing API responses
+search_cache = ResultCache(maxsize=1000, ttl=300)
+
+# Cache for collection counts used by paginated endpoints
+count_cache = ResultCache(maxsize=500, ttl=60)
+
+
+class AuthCache:
+    """
+    Expiry-aware cache of authorization lookups keyed by user_id.
+
+    Authorized users are cached until their ``expiry``; unknown or expired
+    users are cached as negative entries for ``negative_ttl`` seconds.
+    """
+
+    def __init__(self, maxsize=10000, negative_ttl=60):
+        self._entries = LRUCache(maxsize=maxsize)
+        self.negative_ttl = negative_ttl
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id):
+        """Returns True/False for a cached decision, or None on a miss."""
+        entry = self._entries.get(user_id)
+        if entry is not None:
+            expiry, negative_until = entry
+            now = datetime.now(timezone.utc)
+            if expiry is not None and expiry > now:
+                self.hits += 1
+                return True
+            if negative_until is not None and negative_until > now:
+                self.hits += 1
+                return False
+            self._entries.pop(user_id, None)
+        self.misses += 1
+        return None
+
+    def set_authorized(self, user_id, expiry):
+        self._entries[user_id] = (expiry, None)
+
+    def set_unauthorized(self, user_id):
+        negative_until = datetime.now(timezone.utc) + timedelta(seconds=self.negative_ttl)
+        self._entries[user_id] = (None, negative_until)
+
+    def invalidate(self, user_id=None):
+        if user_id is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(user_id, None)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+# Cache for is_user_authorized lookups
+auth_cache = AuthCache()
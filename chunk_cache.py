@@ -0,0 +1,231 @@
+import os
+import mmap
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+
+from config import STREAM_MEMORY_CACHE_MB, STREAM_DISK_CACHE_MB, STREAM_CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+
+class MemoryTier:
+    """LRU of chunks bounded by total bytes."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._chunks = OrderedDict()
+
+    def get(self, key):
+        chunk = self._chunks.get(key)
+        if chunk is not None:
+            self._chunks.move_to_end(key)
+        return chunk
+
+    def put(self, key, chunk):
+        if len(chunk) > self.max_bytes:
+            return
+        old = self._chunks.pop(key, None)
+        if old is not None:
+            self.size -= len(old)
+        self._chunks[key] = chunk
+        self.size += len(chunk)
+        while self.size > self.max_bytes:
+            _, evicted = self._chunks.popitem(last=False)
+            self.size -= len(evicted)
+
+    def __contains__(self, key):
+        return key in self._chunks
+
+    def __len__(self):
+        return len(self._chunks)
+
+
+class CachedFile:
+    """One sparse file on disk holding the chunks of a single media file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.chunks = {}  # chunk index -> length
+        self.size = 0
+        self.hits = 0
+        self.last_access = time.monotonic()
+        self._map = None
+
+    def write(self, index, chunk, chunk_size):
+        mode = "r+b" if os.path.exists(self.path) else "wb"
+        with open(self.path, mode) as f:
+            f.seek(index * chunk_size)
+            f.write(chunk)
+        self.chunks[index] = len(chunk)
+        self.size += len(chunk)
+
+    def read(self, index, chunk_size):
+        offset = index * chunk_size
+        length = self.chunks[index]
+        if self._map is None or len(self._map) < offset + length:
+            # The file grew since it was mapped
+            self.close()
+            with open(self.path, "rb") as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map[offset:offset + length]
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+
+class DiskTier:
+    """
+    Size-capped chunk store under `root`, one sparse file per media file,
+    read through mmap. When full, whole files are evicted coldest first
+    (fewest hits, then least recently used), so a popular release keeps
+    all of its chunks while one-off views make room.
+    """
+
+    def __init__(self, root, max_bytes, chunk_size):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+        self.size = 0
+        self._files = {}
+        if max_bytes > 0:
+            os.makedirs(root, exist_ok=True)
+            # The chunk index lives in memory, so leftovers from a previous run are unusable
+            for name in os.listdir(root):
+                if name.endswith(".bin"):
+                    os.remove(os.path.join(root, name))
+
+    def _file(self, file_key, create=False):
+        cached = self._files.get(file_key)
+        if cached is None and create:
+            channel_id, message_id = file_key
+            cached = self._files[file_key] = CachedFile(
+                os.path.join(self.root, f"{channel_id}_{message_id}.bin")
+            )
+        return cached
+
+    def contains(self, key):
+        cached = self._file(key[:2])
+        return cached is not None and key[2] in cached.chunks
+
+    def get(self, key):
+        cached = self._file(key[:2])
+        if cached is None or key[2] not in cached.chunks:
+            return None
+        cached.hits += 1
+        cached.last_access = time.monotonic()
+        return cached.read(key[2], self.chunk_size)
+
+    def put(self, key, chunk):
+        if self.max_bytes <= 0 or len(chunk) > self.max_bytes:
+            return
+        if self.contains(key):
+            return
+        # Only create the file entry once there is room, so a failed put leaves nothing behind
+        if not self._evict(len(chunk), keep=key[:2]):
+            return
+        cached = self._file(key[:2], create=True)
+        cached.last_access = time.monotonic()
+        cached.write(key[2], chunk, self.chunk_size)
+        self.size += len(chunk)
+
+    def _evict(self, needed, keep):
+        """Make room for `needed` bytes; returns False if that is not possible."""
+        if self.size + needed <= self.max_bytes:
+            return True
+        candidates = sorted(
+            (item for item in self._files.items() if item[0] != keep),
+            key=lambda item: (item[1].hits, item[1].last_access)
+        )
+        for file_key, cached in candidates:
+            if self.size + needed <= self.max_bytes:
+                break
+            self._drop(file_key, cached)
+        return self.size + needed <= self.max_bytes
+
+    def _drop(self, file_key, cached):
+        cached.close()
+        try:
+            os.remove(cached.path)
+        except FileNotFoundError:
+            pass
+        self.size -= cached.size
+        del self._files[file_key]
+
+    def __len__(self):
+        return len(self._files)
+
+
+class ChunkCache:
+    """
+    Two-tier cache of media chunks keyed by (channel_id, message_id, index).
+
+    Memory hits are served directly; disk hits are read through mmap and
+    promoted to memory. Disk I/O runs in a worker thread.
+    """
+
+    def __init__(self, chunk_size, memory_bytes=STREAM_MEMORY_CACHE_MB * MB,
+                 disk_bytes=STREAM_DISK_CACHE_MB * MB, root=STREAM_CACHE_DIR):
+        self.memory = MemoryTier(memory_bytes)
+        self.disk = DiskTier(root, disk_bytes, chunk_size)
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.bytes_from_cache = 0
+        self.bytes_from_upstream = 0
+        # DiskTier keeps its index in plain dicts; serialize access from threads
+        self._disk_lock = asyncio.Lock()
+
+    def contains(self, key):
+        return key in self.memory or self.disk.contains(key)
+
+    async def get(self, key):
+        chunk = self.memory.get(key)
+        if chunk is not None:
+            self.memory_hits += 1
+            self.bytes_from_cache += len(chunk)
+            return chunk
+        if self.disk.contains(key):
+            async with self._disk_lock:
+                try:
+                    chunk = await asyncio.to_thread(self.disk.get, key)
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Chunk cache read failed for {key}: {e}")
+                    chunk = None
+            if chunk is not None:
+                self.disk_hits += 1
+                self.bytes_from_cache += len(chunk)
+                self.memory.put(key, chunk)
+                return chunk
+        self.misses += 1
+        return None
+
+    async def put(self, key, chunk):
+        self.bytes_from_upstream += len(chunk)
+        self.memory.put(key, chunk)
+        async with self._disk_lock:
+            try:
+                await asyncio.to_thread(self.disk.put, key, chunk)
+            except OSError as e:
+                logger.warning(f"Chunk cache write failed for {key}: {e}")
+
+    def stats(self):
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_chunks": len(self.memory),
+            "memory_bytes": self.memory.size,
+            "disk_files": len(self.disk),
+            "disk_bytes": self.disk.size,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+            "bytes_from_cache": self.bytes_from_cache,
+            "bytes_from_upstream": self.bytes_from_upstream,
+        }
@@ -0,0 +1,156 @@
+import time
+import logging
+from cachetools import TTLCache
+from pyrogram import Client
+from pyrogram.errors import FloodWait
+from pyrogram.file_id import FileId
+
+from config import API_ID, API_HASH, MULTI_BOT_TOKENS
+
+logger = logging.getLogger(__name__)
+
+
+class PooledClient:
+    """A client in the pool with its own load, FloodWait state and message cache."""
+
+    def __init__(self, name, client):
+        self.name = name
+        self.client = client
+        self.dc_id = None
+        self.active = 0
+        self.flood_until = 0.0
+        self.chunks = 0
+        self.bytes = 0
+        self.flood_waits = 0
+        self.errors = 0
+        # File references are per bot, so every client resolves messages itself
+        self.messages = TTLCache(maxsize=1000, ttl=30 * 60)
+
+    def available(self, now):
+        return now >= self.flood_until
+
+    def has_session(self, dc_id):
+        return dc_id is not None and (dc_id == self.dc_id or dc_id in self.client.media_sessions)
+
+    async def get_message(self, channel_id, message_id):
+        key = (channel_id, message_id)
+        message = self.messages.get(key)
+        if message is None:
+            message = await self.client.get_messages(channel_id, message_id)
+            if message is None or message.empty:
+                raise FileNotFoundError(f"Message {message_id} not found in {channel_id}")
+            self.messages[key] = message
+        return message
+
+    def stats(self, now):
+        return {
+            "dc_id": self.dc_id,
+            "active": self.active,
+            "flood_wait_for": round(max(self.flood_until - now, 0.0), 1),
+            "chunks": self.chunks,
+            "bytes": self.bytes,
+            "flood_waits": self.flood_waits,
+            "errors": self.errors,
+        }
+
+
+def media_dc_id(message):
+    media = message.document or message.video or message.audio
+    if media is None:
+        return None
+    try:
+        return FileId.decode(media.file_id).dc_id
+    except Exception:
+        return None
+
+
+class ClientPool:
+    """
+    Spreads media chunk downloads over the main bot and the helper bots
+    configured in MULTI_BOT_TOKENS.
+
+    Each chunk goes to the least-loaded client that is not in a FloodWait,
+    preferring clients that already have a session on the file's data
+    centre (their home DC or an open media session) so no new auth export
+    is needed. Helper bots must be members of the channels they stream from.
+    """
+
+    def __init__(self, primary, tokens=MULTI_BOT_TOKENS):
+        self.members = [PooledClient("main", primary)]
+        for i, token in enumerate(tokens, start=1):
+            # On-disk session in the working directory, like the main "bot"
+            # session, so restarts reuse the authorization and media DC keys
+            helper = Client(
+                f"helper_{i}",
+                api_id=API_ID,
+                api_hash=API_HASH,
+                bot_token=token,
+                no_updates=True,
+            )
+            self.members.append(PooledClient(f"helper_{i}", helper))
+
+    async def start(self):
+        """Start the helpers; the main bot is started by bot.main."""
+        for member in self.members:
+            try:
+                if member.name != "main":
+                    await member.client.start()
+                member.dc_id = await member.client.storage.dc_id()
+            except Exception as e:
+                logger.error(f"Failed to start pooled client {member.name}: {e}")
+                member.flood_until = float("inf")
+        logger.info(f"Client pool ready with {len(self.members)} clients.")
+
+    async def stop(self):
+        for member in self.members[1:]:
+            try:
+                await member.client.stop()
+            except Exception:
+                pass
+
+    def pick(self, dc_id=None, exclude=()):
+        now = time.monotonic()
+        candidates = [m for m in self.members if m.available(now) and m not in exclude]
+        if not candidates:
+            # Everyone is flood-waiting: take whoever is free first
+            candidates = [min((m for m in self.members if m not in exclude),
+                              key=lambda m: m.flood_until, default=self.members[0])]
+        return min(candidates, key=lambda m: (m.active, not m.has_session(dc_id)))
+
+    async def read_chunk(self, channel_id, message_id, index, primary_message=None):
+        """Fetch one 1 MiB chunk of a channel message's media through the pool."""
+        dc_id = media_dc_id(primary_message) if primary_message is not None else None
+        tried = []
+        while len(tried) < len(self.members):
+            member = self.pick(dc_id, exclude=tried)
+            tried.append(member)
+            member.active += 1
+            try:
+                message = await member.get_message(channel_id, message_id)
+                async for chunk in member.client.stream_media(message, offset=index, limit=1):
+                    member.chunks += 1
+                    member.bytes += len(chunk)
+                    return chunk
+                return b""
+            except FloodWait as e:
+                member.flood_waits += 1
+                member.flood_until = time.monotonic() + e.value
+                logger.warning(f"{member.name} got FloodWait of {e.value}s, trying another client")
+            except Exception as e:
+                member.errors += 1
+                logger.warning(f"{member.name} failed to fetch chunk {index} of {channel_id}/{message_id}: {e}")
+            finally:
+                member.active -= 1
+        raise IOError(f"No client could fetch chunk {index} of {channel_id}/{message_id}")
+
+    def stats(self):
+        now = time.monotonic()
+        return {member.name: member.stats(now) for member in self.members}
+
+
+def create_client_pool():
+    from app import bot
+    return ClientPool(bot)
+
+
+client_pool = create_client_pool()
@@ -40,19 +40,26 @@ except:
 
 load_dotenv('config.env', override=True)
 
+# A key left blank in config.env reads as '', so settings use `or default`
+# rather than a getenv default, which only applies to missing keys
+
 #TELEGRAM API
 API_ID = int(os.getenv('API_ID'))
 API_HASH = os.getenv('API_HASH')
 BOT_TOKEN = os.getenv('BOT_TOKEN')
+# Extra bot tokens (comma or space separated) used only to download streamed media
+MULTI_BOT_TOKENS = os.getenv('MULTI_BOT_TOKENS', '').replace(',', ' ').split()
+# Key for signing /player links (defaults to the bot token, which is already secret)
+STREAM_LINK_SECRET = os.getenv('STREAM_LINK_SECRET') or BOT_TOKEN or ''
 
 OWNER_ID = int(os.getenv('OWNER_ID'))
 BOT_USERNAME = os.getenv('BOT_USERNAME')
-UPDATE_CHANNEL_ID = int(os.getenv('UPDATE_CHANNEL_ID', 0))
-UPDATE_CHANNEL_ID2 = int(os.getenv('UPDATE_CHANNEL_ID2', 0))
+UPDATE_CHANNEL_ID = int(os.getenv('UPDATE_CHANNEL_ID') or 0)
+UPDATE_CHANNEL_ID2 = int(os.getenv('UPDATE_CHANNEL_ID2') or 0)
 TMDB_CHANNEL_ID = [int(x) for x in os.getenv('TMDB_CHANNEL_ID', '').replace(' ', '').split(',') if x]
 LOG_CHANNEL_ID = int(os.getenv('LOG_CHANNEL_ID'))
 BACKUP_CHANNEL = os.getenv('BACKUP_CHANNEL', '')
-SEND_UPDATES = os.getenv('SEND_UPDATES', 'True').lower() in ('true', '1', 't')
+SEND_UPDATES = (os.getenv('SEND_UPDATES') or 'True').lower() in ('true', '1', 't')
 
 MY_DOMAIN = os.getenv('MY_DOMAIN')
 CF_DOMAIN = os.getenv('CF_DOMAIN')
@@ -61,7 +68,56 @@ TOKEN_VALIDITY_SECONDS = 24 * 60 * 60  # 24 hours
 
 MONGO_URI = os.getenv("MONGO_URI")
 
+# "atlas" uses the Atlas Search index, "local" an in-process index for self-hosted Mongo
+SEARCH_BACKEND = (os.getenv('SEARCH_BACKEND') or 'atlas').strip().lower()
+
 TMDB_API_KEY = os.getenv('TMDB_API_KEY')
+TMDB_CACHE_TTL = int(os.getenv('TMDB_CACHE_TTL') or 7 * 24 * 60 * 60)  # 7 days
+TMDB_NEGATIVE_CACHE_TTL = int(os.getenv('TMDB_NEGATIVE_CACHE_TTL') or 24 * 60 * 60)  # 1 day
+
+# File processing pipeline
+FILE_METADATA_WORKERS = int(os.getenv('FILE_METADATA_WORKERS') or 4)
+FILE_PERSIST_WORKERS = int(os.getenv('FILE_PERSIST_WORKERS') or 2)
+FILE_QUEUE_MAXSIZE = int(os.getenv('FILE_QUEUE_MAXSIZE') or 500)
+PERSIST_BATCH_SIZE = int(os.getenv('PERSIST_BATCH_SIZE') or 100)
+PERSIST_FLUSH_MS = int(os.getenv('PERSIST_FLUSH_MS') or 500)
+
+# Outbound HTTP (TMDB, IMDb, shortener)
+HTTP_TIMEOUT = float(os.getenv('HTTP_TIMEOUT') or 15)
+HTTP_MAX_CONNECTIONS = int(os.getenv('HTTP_MAX_CONNECTIONS') or 100)
+HTTP_MAX_PER_HOST = int(os.getenv('HTTP_MAX_PER_HOST') or 10)
+HTTP_RETRIES = int(os.getenv('HTTP_RETRIES') or 3)
+
+# Telegram RPC scheduler: global and per-chat rates (requests/s), FloodWait retries
+SCHEDULER_GLOBAL_RATE = float(os.getenv('SCHEDULER_GLOBAL_RATE') or 30)
+SCHEDULER_CHAT_RATE = float(os.getenv('SCHEDULER_CHAT_RATE') or 1)
+SCHEDULER_CHAT_BURST = int(os.getenv('SCHEDULER_CHAT_BURST') or 3)
+SCHEDULER_FLOOD_RETRIES = int(os.getenv('SCHEDULER_FLOOD_RETRIES') or 3)
+SCHEDULER_MAX_INTERACTIVE_WAIT = int(os.getenv('SCHEDULER_MAX_INTERACTIVE_WAIT') or 30)
+
+# Bulk jobs (/index, /copy, broadcast)
+INDEX_BATCH_SIZE = int(os.getenv('INDEX_BATCH_SIZE') or 100)  # get_messages accepts up to 200 ids
+INDEX_CONCURRENCY = int(os.getenv('INDEX_CONCURRENCY') or 3)
+INDEX_BATCHES_PER_SECOND = float(os.getenv('INDEX_BATCHES_PER_SECOND') or 2)
+COPY_CONCURRENCY = int(os.getenv('COPY_CONCURRENCY') or 3)  # >1 may post copies slightly out of order
+COPY_MESSAGES_PER_SECOND = float(os.getenv('COPY_MESSAGES_PER_SECOND') or 1)
+# Telegram allows bots about 30 messages per second across all chats
+BROADCAST_MESSAGES_PER_SECOND = float(os.getenv('BROADCAST_MESSAGES_PER_SECOND') or 25)
+BROADCAST_CONCURRENCY = int(os.getenv('BROADCAST_CONCURRENCY') or 10)
+BROADCAST_CHUNK_SIZE = int(os.getenv('BROADCAST_CHUNK_SIZE') or 200)
+PROGRESS_EDIT_SECONDS = float(os.getenv('PROGRESS_EDIT_SECONDS') or 5)
+
+# Serve /player from files in this directory instead of Telegram (development and testing)
+STREAM_LOCAL_DIR = os.getenv('STREAM_LOCAL_DIR')
+
+# Streamed media chunk cache (memory LRU + disk store) and read-ahead in chunks
+STREAM_MEMORY_CACHE_MB = int(os.getenv('STREAM_MEMORY_CACHE_MB') or 256)
+STREAM_DISK_CACHE_MB = int(os.getenv('STREAM_DISK_CACHE_MB') or 2048)  # 0 disables the disk tier
+STREAM_CACHE_DIR = os.getenv('STREAM_CACHE_DIR') or 'downloads/stream_cache'
+STREAM_READ_AHEAD = int(os.getenv('STREAM_READ_AHEAD') or 2)
+
+# Reload the allowed channel set from Mongo every N seconds (0 = only at startup and on /add, /rm)
+ALLOWED_CHANNELS_REFRESH_SECONDS = int(os.getenv('ALLOWED_CHANNELS_REFRESH_SECONDS') or 0)
 
 #SHORTERNER API
 URLSHORTX_API_TOKEN = os.getenv('URLSHORTX_API_TOKEN')
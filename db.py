@@ -1,9 +1,14 @@
-from pymongo import MongoClient
+import logging
+from datetime import datetime, timezone
+from pymongo import AsyncMongoClient, IndexModel, ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
 from config import MONGO_URI
 
+logger = logging.getLogger(__name__)
 
-# MongoDB setup
-mongo = MongoClient(MONGO_URI)
+
+# MongoDB setup (async driver, so queries never block the shared event loop)
+mongo = AsyncMongoClient(MONGO_URI)
 db = mongo["sharing_bot"]
 files_col = db["files"]
 tmdb_col = db["tmdb"]
@@ -12,6 +17,119 @@ auth_users_col = db["auth_users"]
 allowed_channels_col = db["allowed_channels"]
 users_col = db["users"]
 comments_col = db["comments"]
+tmdb_cache_col = db["tmdb_cache"]
+checkpoints_col = db["checkpoints"]
+
+
+# Indexes every collection needs, applied idempotently at startup
+INDEX_MANIFEST = {
+    "files": [
+        IndexModel([("channel_id", ASCENDING), ("message_id", ASCENDING)]),
+        IndexModel([("file_name", ASCENDING)]),
+        IndexModel([("tmdb_id", ASCENDING), ("tmdb_type", ASCENDING)]),
+    ],
+    "tmdb": [
+        IndexModel([("tmdb_id", ASCENDING), ("tmdb_type", ASCENDING)]),
+        IndexModel([("year", DESCENDING), ("_id", DESCENDING)]),
+        IndexModel([("rating", DESCENDING), ("_id", DESCENDING)]),
+    ],
+    "tokens": [
+        IndexModel([("token_id", ASCENDING), ("user_id", ASCENDING)]),
+        IndexModel([("user_id", ASCENDING), ("expiry", ASCENDING)]),
+        IndexModel([("expiry", ASCENDING)], expireAfterSeconds=0),
+    ],
+    "auth_users": [
+        IndexModel([("user_id", ASCENDING), ("expiry", ASCENDING)]),
+        IndexModel([("expiry", ASCENDING)], expireAfterSeconds=0),
+    ],
+    "allowed_channels": [
+        IndexModel([("channel_id", ASCENDING)]),
+    ],
+    "users": [
+        IndexModel([("user_id", ASCENDING)]),
+    ],
+    "tmdb_cache": [
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0),
+    ],
+}
+
+# Hot queries that must be served by an index: (collection, filter, sort, where)
+HOT_QUERIES = [
+    ("files", {"channel_id": 0, "message_id": 0}, None, "upsert_file_info"),
+    ("files", {"file_name": {"$in": [""]}}, None, "find_duplicate_files"),
+    ("files", {"tmdb_id": 0, "tmdb_type": "movie"}, None, "get_movie_details"),
+    ("tmdb", {"tmdb_id": 0, "tmdb_type": "movie"}, None, "upsert_tmdb_info"),
+    ("tmdb", {}, [("year", -1), ("_id", -1)], "get_movies (sort=year)"),
+    ("tmdb", {}, [("rating", -1), ("_id", -1)], "get_movies (sort=rating)"),
+    ("users", {"user_id": 0}, None, "add_user"),
+    ("auth_users", {"user_id": 0, "expiry": {"$gt": "NOW"}}, None, "is_user_authorized"),
+    ("tokens", {"token_id": "", "user_id": 0, "expiry": {"$gt": "NOW"}}, None, "is_token_valid"),
+    ("tokens", {"user_id": 0, "expiry": {"$gt": "NOW"}}, None, "start_handler"),
+]
+
+
+async def ensure_indexes():
+    """Create every index in INDEX_MANIFEST. Existing indexes are left alone."""
+    for collection, models in INDEX_MANIFEST.items():
+        for model in models:
+            try:
+                await db[collection].create_indexes([model])
+            except OperationFailure as e:
+                spec = model.document
+                if e.code == 85 and "expireAfterSeconds" in spec:
+                    # Same keys without TTL: turn the existing index into a TTL index
+                    try:
+                        await db.command({
+                            "collMod": collection,
+                            "index": {"keyPattern": spec["key"], "expireAfterSeconds": spec["expireAfterSeconds"]},
+                        })
+                        continue
+                    except OperationFailure as mod_error:
+                        e = mod_error
+                # Usually an equivalent index already exists under another name
+                logger.warning(f"Could not create index {spec['name']} on {collection}: {e}")
+
+
+def _plan_stages(plan):
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for value in plan.values():
+            yield from _plan_stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from _plan_stages(item)
+
+
+def _with_now(value, now):
+    if value == "NOW":
+        return now
+    if isinstance(value, dict):
+        return {k: _with_now(v, now) for k, v in value.items()}
+    return value
+
+
+async def verify_query_plans():
+    """
+    Explain every query in HOT_QUERIES and return the ones whose winning
+    plan contains a COLLSCAN, as (collection, where) pairs.
+    """
+    now = datetime.now(timezone.utc)
+    offenders = []
+    for collection, query, sort, where in HOT_QUERIES:
+        command = {"find": collection, "filter": _with_now(query, now), "limit": 1}
+        if sort:
+            command["sort"] = dict(sort)
+        try:
+            explain = await db.command({"explain": command, "verbosity": "queryPlanner"})
+        except OperationFailure as e:
+            logger.warning(f"Could not explain {where} on {collection}: {e}")
+            continue
+        winning_plan = explain.get("queryPlanner", {}).get("winningPlan", {})
+        if "COLLSCAN" in _plan_stages(winning_plan):
+            logger.warning(f"COLLSCAN in hot query {where} on {collection}: {query}")
+            offenders.append((collection, where))
+    return offenders
 
 
 ''' JSON setup for Atlas Search'''
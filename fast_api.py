@@ -1,15 +1,19 @@
 import re
 import base64
+from urllib.parse import quote
 from fastapi import FastAPI, Request, Depends, HTTPException, status, Header
-from fastapi.responses import JSONResponse, HTMLResponse, RedirectResponse
+from fastapi.responses import JSONResponse, HTMLResponse, RedirectResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-from config import MY_DOMAIN, CF_DOMAIN
-from utility import is_user_authorized, get_user_firstname, build_search_pipeline
+from config import CF_DOMAIN
+from utility import is_user_authorized, get_user_firstname, fetch_page, cached_count, encode_cursor, decode_cursor, is_channel_allowed
 from db import tmdb_col, files_col, comments_col
+from search_engine import search_backend
+from streamer import media_streamer, parse_range
+from cache import search_cache
 from tmdb import POSTER_BASE_URL
 from app import bot
-from config import TMDB_CHANNEL_ID, OWNER_ID
+from config import TMDB_CHANNEL_ID, OWNER_ID, LOG_CHANNEL_ID
 from datetime import datetime, timezone
 from handlers.admin import router as admin_router
 from bson.objectid import ObjectId
@@ -39,7 +43,7 @@ async def get_current_user(authorization: str = Header(None)):
 
     try:
         user_id = int(token)
-        if not is_user_authorized(user_id):
+        if not await is_user_authorized(user_id):
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Authorization required — please verify through the bot first.")
         return user_id
     except (ValueError, TypeError):
@@ -62,7 +66,7 @@ async def api_authorize(request: Request):
             detail="Invalid User ID format.",
         )
 
-    if not is_user_authorized(user_id):
+    if not await is_user_authorized(user_id):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Authorization required — please verify through the bot first.",
@@ -81,7 +85,7 @@ async def get_user_me(user_id: int = Depends(get_current_user)):
 
 
 @api.get("/api/movies")
-async def get_movies(page: int = 1, search: str = None, category: str = None, sort: str = "year", user_id: int = Depends(get_current_user), tmdb_id: int = None, tmdb_type: str = None):
+async def get_movies(page: int = 1, search: str = None, category: str = None, sort: str = "year", user_id: int = Depends(get_current_user), tmdb_id: int = None, tmdb_type: str = None, cursor: str = None):
     page_size = 10
     skip = (page - 1) * page_size
 
@@ -103,22 +107,33 @@ async def get_movies(page: int = 1, search: str = None, category: str = None, so
         sort_order.append(("_id", -1))
     else:  # Default to recent
         sort_order.append(("_id", -1))
-    
-    movies = list(tmdb_col.find(query).sort(sort_order).skip(skip).limit(page_size))
-    total_movies = tmdb_col.count_documents(query)
+
+    cache_key = ("movies", search.strip().lower() if search else None, category, sort, tmdb_id, tmdb_type, page, cursor)
+    cached = search_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    try:
+        movies, next_cursor = await fetch_page(tmdb_col, query, sort_order, page_size, skip=skip, cursor=cursor)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    total_movies = await cached_count(tmdb_col, query)
 
     # Convert ObjectId to string
     for movie in movies:
         movie["_id"] = str(movie["_id"])
 
-    return {
+    response = {
         "movies": movies,
         "total_pages": (total_movies + page_size - 1) // page_size,
-        "current_page": page
+        "current_page": page,
+        "next": next_cursor
     }
+    search_cache.set(cache_key, response)
+    return response
 
 @api.get("/api/details/{tmdb_id}")
-async def get_movie_details(tmdb_id: str, tmdb_type: str, page: int = 1, user_id: int = Depends(get_current_user)):
+async def get_movie_details(tmdb_id: str, tmdb_type: str, page: int = 1, user_id: int = Depends(get_current_user), cursor: str = None):
     try:
         tmdb_id = int(tmdb_id)
     except (ValueError, TypeError):
@@ -127,75 +142,109 @@ async def get_movie_details(tmdb_id: str, tmdb_type: str, page: int = 1, user_id
     page_size = 10
     skip = (page - 1) * page_size
 
-    files = list(files_col.find({"tmdb_id": tmdb_id, "tmdb_type": tmdb_type}).skip(skip).limit(page_size))
-    total_files = files_col.count_documents({"tmdb_id": tmdb_id, "tmdb_type": tmdb_type})
+    cache_key = ("details", tmdb_id, tmdb_type, page, cursor)
+    cached = search_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    query = {"tmdb_id": tmdb_id, "tmdb_type": tmdb_type}
+    if cursor is None:
+        files = await files_col.find(query).skip(skip).limit(page_size).to_list(None)
+        next_cursor = None
+    else:
+        try:
+            files, next_cursor = await fetch_page(files_col, query, [("_id", 1)], page_size, cursor=cursor)
+        except ValueError:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    total_files = await cached_count(files_col, query)
 
     # Convert ObjectId to string and add stream URL
     for file in files:
         file["_id"] = str(file["_id"])
-        file["stream_url"] = f"{MY_DOMAIN}/player/{bot.encode_file_link(file['channel_id'], file['message_id'])}"
+        file["stream_url"] = bot.get_stream_link(file['channel_id'], file['message_id'])
 
-    return {
+    response = {
         "files": files,
         "total_pages": (total_files + page_size - 1) // page_size,
-        "current_page": page
+        "current_page": page,
+        "next": next_cursor
     }
+    search_cache.set(cache_key, response)
+    return response
 
 @api.get("/api/file/{file_id}")
 async def get_file_details(file_id: str, user_id: int = Depends(get_current_user)):
     try:
-        file = files_col.find_one({"_id": ObjectId(file_id)})
+        file = await files_col.find_one({"_id": ObjectId(file_id)})
         if not file:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found")
 
         file["_id"] = str(file["_id"])
-        file["stream_url"] = f"{MY_DOMAIN}/player/{bot.encode_file_link(file['channel_id'], file['message_id'])}"
+        file["stream_url"] = bot.get_stream_link(file['channel_id'], file['message_id'])
         return file
     except Exception:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid file ID")
 
 @api.get("/api/others")
-async def get_others(page: int = 1, search: str = None, sort: str = "recent", user_id: int = Depends(get_current_user)):
+async def get_others(page: int = 1, search: str = None, sort: str = "recent", user_id: int = Depends(get_current_user), cursor: str = None):
     page_size = 10
     skip = (page - 1) * page_size
 
     sort_order = [("_id", -1)] if sort == "recent" else [("_id", 1)]
+    sanitized_search = bot.sanitize_query(search) if search else None
 
-    if search:
-        sanitized_search = bot.sanitize_query(search)
-        pipeline = build_search_pipeline(sanitized_search, {"channel_id": {"$nin": TMDB_CHANNEL_ID}}, skip, page_size)
-        result = list(files_col.aggregate(pipeline))
-        files = result[0]['results'] if result and 'results' in result[0] else []
-        total_files = result[0]['totalCount'][0]['total'] if result and 'totalCount' in result[0] and result[0]['totalCount'] else 0
-    else:
-        query = {"channel_id": {"$nin": TMDB_CHANNEL_ID}}
-        files = list(files_col.find(query).sort(sort_order).skip(skip).limit(page_size))
-        total_files = files_col.count_documents(query)
+    cache_key = ("others", sanitized_search, sort, page, cursor)
+    cached = search_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    next_cursor = None
+    # Results served while the local index is still loading are partial
+    cacheable = search_backend.ready
+    try:
+        if search:
+            # Search results are ordered by relevance, so the cursor carries an offset
+            if cursor:
+                skip = max(int(decode_cursor(cursor)[0]), 0)
+            files, total_files = await search_backend.search(sanitized_search, {"channel_id": {"$nin": TMDB_CHANNEL_ID}}, skip, page_size)
+            if cursor is not None and skip + page_size < total_files:
+                next_cursor = encode_cursor([skip + page_size])
+        else:
+            query = {"channel_id": {"$nin": TMDB_CHANNEL_ID}}
+            files, next_cursor = await fetch_page(files_col, query, sort_order, page_size, skip=skip, cursor=cursor)
+            total_files = await cached_count(files_col, query)
+    except (ValueError, TypeError, IndexError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
 
     for file in files:
         file["_id"] = str(file["_id"])
-        file["stream_url"] = f"{MY_DOMAIN}/player/{bot.encode_file_link(file['channel_id'], file['message_id'])}"
+        file["stream_url"] = bot.get_stream_link(file['channel_id'], file['message_id'])
 
-    return {
+    response = {
         "files": files,
         "total_pages": (total_files + page_size - 1) // page_size,
-        "current_page": page
+        "current_page": page,
+        "next": next_cursor
     }
+    if cacheable:
+        search_cache.set(cache_key, response)
+    return response
 
 @api.post("/api/comments")
 async def create_comment(request: Request, user_id: int = Depends(get_current_user)):
     data = await request.json()
     comment_text = data.get("comment")
-    user_name = await get_user_firstname(user_id)
     if not comment_text:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Comment text cannot be empty.")
 
+    # The author's name is resolved when comments are read, so a name that
+    # is not known yet is not stored as "Anonymous"
     comment = {
-        "user_name": user_name,
+        "user_id": user_id,
         "comment": comment_text,
         "created_at": datetime.now(timezone.utc)
     }
-    comments_col.insert_one(comment)
+    await comments_col.insert_one(comment)
     return {"message": "Comment added successfully"}
 
 @api.get("/api/comments")
@@ -204,12 +253,16 @@ async def get_comments(page: int = 1, user_id: int = Depends(get_current_user)):
     skip = (page - 1) * page_size
 
     comments = []
-    for comment in comments_col.find().sort("_id", -1).skip(skip).limit(page_size):
+    async for comment in comments_col.find().sort("_id", -1).skip(skip).limit(page_size):
         comment["_id"] = str(comment["_id"])
+        # Comments written before user_id was stored only have user_name
+        author_id = comment.pop("user_id", None)
+        if author_id is not None:
+            comment["user_name"] = await get_user_firstname(author_id)
         comment["first_name"] = comment["user_name"]
         comments.append(comment)
 
-    total_comments = comments_col.count_documents({})
+    total_comments = await comments_col.count_documents({})
 
     return {
         "comments": comments,
@@ -217,25 +270,41 @@ async def get_comments(page: int = 1, user_id: int = Depends(get_current_user)):
         "current_page": page
     }
 
-'''
-@api.get("/player/{file_link}")
+
+@api.api_route("/player/{file_link}", methods=["GET", "HEAD"])
 async def stream_player(file_link: str, request: Request):
     try:
-        padding = '=' * (-len(file_link) % 4)
-        decoded = base64.urlsafe_b64decode(file_link + padding).decode()
-        channel_id, msg_id = map(int, decoded.split("_"))
-
-        # You might want to add authorization checks here
-
-        # Get the stream link from the bot
-        # This is a placeholder for the actual logic to get the stream link
-        stream_link = await bot.get_stream_link(channel_id, msg_id)
-
-        return RedirectResponse(url=stream_link)
-
-    except Exception as e:
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
-
-'''
+        channel_id, msg_id = bot.decode_file_link(file_link)
+        # Only stream from indexed channels and the log channel (owner uploads)
+        if not (is_channel_allowed(channel_id) or channel_id == LOG_CHANNEL_ID):
+            raise FileNotFoundError(channel_id)
+        info = await media_streamer.info(channel_id, msg_id)
+    except (ValueError, FileNotFoundError):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found")
+
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Content-Type": info.mime_type,
+    }
+    if info.file_name:
+        headers["Content-Disposition"] = f"inline; filename*=UTF-8''{quote(info.file_name)}"
 
+    try:
+        byte_range = parse_range(request.headers.get("range"), info.size)
+    except ValueError:
+        return Response(status_code=416, headers={"Content-Range": f"bytes */{info.size}"})
 
+    if byte_range is None:
+        start, end, status_code = 0, info.size - 1, 200
+    else:
+        (start, end), status_code = byte_range, 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{info.size}"
+    headers["Content-Length"] = str(max(end - start + 1, 0))
+
+    if request.method == "HEAD" or info.size == 0:
+        return Response(status_code=status_code, headers=headers)
+    return StreamingResponse(
+        media_streamer.iter_range(channel_id, msg_id, start, end),
+        status_code=status_code,
+        headers=headers,
+    )
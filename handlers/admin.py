@@ -1,9 +1,14 @@
 from fastapi import APIRouter, Depends, HTTPException, Header, status
 from fastapi.responses import FileResponse
 from db import tmdb_col, files_col
-from utility import is_user_authorized, build_search_pipeline
+from utility import is_user_authorized, invalidate_search_cache, get_pipeline_stats, forget_tmdb_entry
+from search_engine import search_backend
 from config import OWNER_ID
+from cache import auth_cache, search_cache
 from tmdb import get_info
+from http_client import http_client
+from scheduler import scheduler
+from streamer import media_streamer
 from app import bot
 from bson.objectid import ObjectId
 import logging
@@ -26,7 +31,7 @@ async def get_current_user(authorization: str = Header(None)):
 
     try:
         user_id = int(token)
-        if not is_user_authorized(user_id):
+        if not await is_user_authorized(user_id):
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Authorization required — please verify through the bot first.")
         return user_id
     except (ValueError, TypeError):
@@ -37,6 +42,17 @@ async def get_current_admin(user_id: int = Depends(get_current_user)):
         raise HTTPException(status_code=403, detail="Forbidden")
     return user_id
 
+@router.get("/metrics")
+async def get_metrics(admin_id: int = Depends(get_current_admin)):
+    return {
+        "auth_cache": auth_cache.stats(),
+        "search_cache": search_cache.stats(),
+        "file_pipeline": get_pipeline_stats(),
+        "http": http_client.stats(),
+        "telegram": scheduler.stats(),
+        "streaming": media_streamer.stats()
+    }
+
 @router.get("/tmdb")
 async def get_tmdb_entries(admin_id: int = Depends(get_current_admin), page: int = 1, search: str = None):
     page_size = 10
@@ -46,7 +62,7 @@ async def get_tmdb_entries(admin_id: int = Depends(get_current_admin), page: int
         query["title"] = {"$regex": search, "$options": "i"}
     
     entries = []
-    for entry in tmdb_col.find(query).skip(skip).limit(page_size):
+    async for entry in tmdb_col.find(query).skip(skip).limit(page_size):
         entries.append({
             "tmdb_id": entry.get("tmdb_id"),
             "title": entry.get("title"),
@@ -56,7 +72,7 @@ async def get_tmdb_entries(admin_id: int = Depends(get_current_admin), page: int
             "year": entry.get("year")
         })
     
-    total_entries = tmdb_col.count_documents(query)
+    total_entries = await tmdb_col.count_documents(query)
     total_pages = (total_entries + page_size - 1) // page_size
     
     return {
@@ -69,12 +85,17 @@ async def get_tmdb_entries(admin_id: int = Depends(get_current_admin), page: int
 async def get_files(admin_id: int = Depends(get_current_admin), page: int = 1, search: str = None):
     page_size = 10
     skip = (page - 1) * page_size
-    
+    sanitized_search = bot.sanitize_query(search) if search else None
+
+    cache_key = ("admin_files", sanitized_search, page)
+    cached = search_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    # Results served while the local index is still loading are partial
+    cacheable = search_backend.ready
     if search:
-        sanitized_search = bot.sanitize_query(search)
-        pipeline = build_search_pipeline(sanitized_search, {}, skip, page_size)
-        result = list(files_col.aggregate(pipeline))
-        files_data = result[0]['results'] if result and 'results' in result[0] else []
+        files_data, total_files = await search_backend.search(sanitized_search, {}, skip, page_size)
         files = []
         for file in files_data:
             files.append({
@@ -83,52 +104,59 @@ async def get_files(admin_id: int = Depends(get_current_admin), page: int = 1, s
                 "tmdb_id": file.get("tmdb_id"),
                 "poster_url": file.get("poster_url")
             })
-        total_files = result[0]['totalCount'][0]['total'] if result and 'totalCount' in result[0] and result[0]['totalCount'] else 0
     else:
         files = []
-        for file in files_col.find().skip(skip).limit(page_size):
+        async for file in files_col.find().skip(skip).limit(page_size):
             files.append({
                 "id": str(file.get("_id")),
                 "file_name": file.get("file_name"),
                 "tmdb_id": file.get("tmdb_id")
             })
-        total_files = files_col.count_documents({})
+        total_files = await files_col.count_documents({})
         
     total_pages = (total_files + page_size - 1) // page_size
-    
-    return {
+
+    response = {
         "files": files,
         "total_pages": total_pages,
         "current_page": page
     }
+    if cacheable:
+        search_cache.set(cache_key, response)
+    return response
 
 @router.post("/tmdb")
 async def add_tmdb_entry(data: dict, admin_id: int = Depends(get_current_admin)):
     tmdb_id = data.get("tmdb_id")
     tmdb_type = data.get("tmdb_type")
     file_ids = data.get("file_ids", [])
+    # "use_cache": false skips the cached TMDB response, e.g. to pick up corrected details
+    use_cache = data.get("use_cache", True) is not False
 
     try:
         tmdb_id = int(tmdb_id)
     except (ValueError, TypeError):
         raise HTTPException(status_code=400, detail="Invalid TMDB ID")
 
-    tmdb_info = await get_info(tmdb_type, tmdb_id)
+    tmdb_info = await get_info(tmdb_type, tmdb_id, use_cache=use_cache)
     if not tmdb_info or "message" in tmdb_info and tmdb_info["message"].startswith("Error"):
         raise HTTPException(status_code=404, detail="TMDB ID not found")
 
-    tmdb_col.update_one({"tmdb_id": tmdb_id, "tmdb_type": tmdb_type}, {"$set": tmdb_info}, upsert=True)
+    await tmdb_col.update_one({"tmdb_id": tmdb_id, "tmdb_type": tmdb_type}, {"$set": tmdb_info}, upsert=True)
 
     if file_ids:
         for file_id in file_ids:
-            files_col.update_one({"_id": ObjectId(file_id)}, {"$set": {"tmdb_id": tmdb_id, "tmdb_type": tmdb_type}})
+            await files_col.update_one({"_id": ObjectId(file_id)}, {"$set": {"tmdb_id": tmdb_id, "tmdb_type": tmdb_type}})
 
+    invalidate_search_cache()
     return {"status": "success"}
 
 @router.delete("/tmdb/{tmdb_id}")
 async def delete_tmdb_entry(tmdb_id: int, admin_id: int = Depends(get_current_admin)):
-    tmdb_col.delete_one({"tmdb_id": tmdb_id})
-    files_col.update_many({"tmdb_id": tmdb_id}, {"$unset": {"tmdb_id": "", "tmdb_type": ""}})
+    await tmdb_col.delete_one({"tmdb_id": tmdb_id})
+    forget_tmdb_entry(tmdb_id)
+    await files_col.update_many({"tmdb_id": tmdb_id}, {"$unset": {"tmdb_id": "", "tmdb_type": ""}})
+    invalidate_search_cache()
     return {"status": "success"}
 
 @router.put("/tmdb/{tmdb_id}")
@@ -139,11 +167,14 @@ async def update_tmdb_entry(tmdb_id: int, data: dict, admin_id: int = Depends(ge
         "plot": data.get("plot"),
         "year": data.get("year")
     }
-    tmdb_col.update_one({"tmdb_id": tmdb_id}, {"$set": update_data})
+    await tmdb_col.update_one({"tmdb_id": tmdb_id}, {"$set": update_data})
+    invalidate_search_cache()
     return {"status": "success"}
 
 @router.put("/files/{file_id}")
 async def update_file_poster(file_id: str, data: dict, admin_id: int = Depends(get_current_admin)):
     poster_url = data.get("poster_url")
-    files_col.update_one({"_id": ObjectId(file_id)}, {"$set": {"poster_url": poster_url}})
+    await files_col.update_one({"_id": ObjectId(file_id)}, {"$set": {"poster_url": poster_url}})
+    await search_backend.refresh({"_id": ObjectId(file_id)})
+    invalidate_search_cache()
     return {"status": "success"}
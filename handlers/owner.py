@@ -1,21 +1,27 @@
 
 import os
 import sys
+import time
 import logging
 from bson import ObjectId
-from pyrogram.errors import UserIsBlocked, InputUserDeactivated, ListenerTimeout, PeerIdInvalid, UserIsBot
 
 from pyrogram import filters, enums
 from pyrogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton
 
-from config import OWNER_ID, LOG_CHANNEL_ID, UPDATE_CHANNEL_ID, MY_DOMAIN, SEND_UPDATES
+from config import OWNER_ID, LOG_CHANNEL_ID, UPDATE_CHANNEL_ID, SEND_UPDATES, COPY_CONCURRENCY, COPY_MESSAGES_PER_SECOND
+from ratelimit import TokenBucket
+from cache import auth_cache, search_cache
+from search_engine import search_backend
 from db import files_col, allowed_channels_col, auth_users_col, users_col, tmdb_col, db
 import asyncio
 from utility import (
     extract_channel_and_msg_id,
-    get_allowed_channels,
+    is_channel_allowed,
+    add_allowed_channel,
+    remove_allowed_channel,
     queue_file_for_processing,
     get_queue_size,
+    get_pipeline_stats,
     invalidate_search_cache,
     auto_delete_message,
     safe_api_call,
@@ -24,13 +30,23 @@ from utility import (
     human_readable_size,
     extract_tmdb_link,
     get_info, 
-    upsert_tmdb_info
+    upsert_tmdb_info,
+    forget_tmdb_entry,
+    load_checkpoint,
+    save_checkpoint,
+    clear_checkpoint,
+    ProgressEditor,
+    PipelineTracker,
+    iter_message_batches,
+    get_messages_batch,
+    call_with_bucket
 )
 from app import bot
+from scheduler import scheduler, with_priority, BULK
+from broadcast import broadcaster, CANCEL_MARKUP
 
 logger = logging.getLogger(__name__)
 
-broadcasting = False
 
 @bot.on_message(filters.private & (filters.document | filters.video))
 async def del_file_handler(client, message):
@@ -41,17 +57,18 @@ async def del_file_handler(client, message):
             channel_id = message.forward_from_chat.id if message.forward_from_chat else None
             msg_id = message.forward_from_message_id if message.forward_from_message_id else None
             if channel_id and msg_id:
-                file_doc = files_col.find_one({"channel_id": channel_id, "message_id": msg_id})
+                file_doc = await files_col.find_one({"channel_id": channel_id, "message_id": msg_id})
                 if not file_doc:
                     reply = await message.reply_text("No file found with that name in the database.")
                     return
-                result = files_col.delete_one({"channel_id": channel_id, "message_id": msg_id})
+                result = await files_col.delete_one({"channel_id": channel_id, "message_id": msg_id})
+                await search_backend.remove(channel_id, msg_id)
+                invalidate_search_cache()
                 if result.deleted_count > 0:
                     reply = await message.reply_text(f"Database record deleted. File name: {file_doc['file_name']}")
         else:
             cpy_msg = await message.copy(LOG_CHANNEL_ID)
-            file_link = bot.encode_file_link(cpy_msg.chat.id, cpy_msg.id)
-            stream_url = f"{MY_DOMAIN}/player/{file_link}"
+            stream_url = bot.get_stream_link(cpy_msg.chat.id, cpy_msg.id)
             buttons = [
                 [
                     InlineKeyboardButton("▶️ Stream", url=stream_url)
@@ -68,6 +85,7 @@ async def del_file_handler(client, message):
         await message.reply_text(f"An error occurred: {e}")
 
 @bot.on_message(filters.command("copy") & filters.private & filters.user(OWNER_ID))
+@with_priority(BULK)
 async def copy_file_handler(client, message):
     try:
         if len(message.command) != 4:
@@ -94,62 +112,168 @@ async def copy_file_handler(client, message):
         end_id = max(start_msg_id, end_msg_id)
         total = end_id - start_id + 1
 
+        # Resume an interrupted run between the same channels and range
+        checkpoint_key = f"copy:{source_channel_id}:{dest_channel_id}"
+        checkpoint = await load_checkpoint(checkpoint_key)
+        resume_from = start_id
+        stats = {"copied": 0, "failed": 0, "checked": 0}
+        pending_ids = []
+        if checkpoint and checkpoint.get("start_id") == start_id and checkpoint.get("end_id") == end_id:
+            resume_from = checkpoint["last_id"] + 1
+            stats["copied"] = checkpoint.get("copied", 0)
+            stats["failed"] = checkpoint.get("failed", 0)
+            pending_ids = checkpoint.get("pending_ids", [])
+
         status_msg = await message.reply_text(
             f"🔁 <b>Copying messages from ID <code>{start_id}</code> to <code>{end_id}</code>...</b>\n"
-            f"📦 <i>Total messages to check: {total}</i>"
+            f"📦 <i>Total messages to check: {total}</i>" +
+            (f"\n♻️ Resuming from <code>{resume_from}</code>" if resume_from > start_id else "")
         )
+        progress = ProgressEditor(status_msg)
+        bucket = TokenBucket(COPY_MESSAGES_PER_SECOND)
+        started = time.monotonic()
+        copied_this_run = 0
+
+        # batch_end -> media still being copied and the copies made so far, in source order
+        batches = {}
+        advance_lock = asyncio.Lock()
+        work = asyncio.Queue(maxsize=COPY_CONCURRENCY * 4)
+
+        # Copies already in the destination whose files are not persisted yet
+        # are kept in the checkpoint as pending_ids and queued again on resume
+        tracker = PipelineTracker()
+        dest_ids = {}
+        copied_through = resume_from - 1
+
+        def checkpoint_fields():
+            persisted = tracker.persisted_through
+            for batch_end in [k for k in dest_ids if persisted is not None and k <= persisted]:
+                del dest_ids[batch_end]
+            return dict(
+                start_id=start_id, end_id=end_id, last_id=copied_through,
+                pending_ids=[msg_id for batch_end in tracker.unfinished() for msg_id in dest_ids[batch_end]],
+                copied=stats["copied"], failed=stats["failed"]
+            )
 
-        count = 0
-        failed = 0
-
-        async with bot.copy_lock:
-            for idx, msg_id in enumerate(range(start_id, end_id + 1), start=1):
+        async def queue_copies(batch_end, copied_msgs):
+            dest_ids[batch_end] = [copied_msg.id for copied_msg in copied_msgs]
+            for copied_msg in copied_msgs:
+                await queue_file_for_processing(
+                    copied_msg,
+                    channel_id=dest_channel_id,
+                    reply_func=message.reply_text,
+                    duplicate=True,
+                    on_done=tracker.track(batch_end)
+                )
+            tracker.seal(batch_end)
+
+        async def advance():
+            """Queue the copies of every finished leading batch and move the checkpoint past them."""
+            nonlocal copied_through
+            async with advance_lock:
+                last_id = None
+                while batches:
+                    batch_end, batch = next(iter(batches.items()))
+                    if batch["remaining"]:
+                        break
+                    del batches[batch_end]
+                    await queue_copies(batch_end, sorted(batch["copied"], key=lambda m: m.id))
+                    last_id = batch_end
+                if last_id is not None:
+                    copied_through = last_id
+                    await save_checkpoint(checkpoint_key, **checkpoint_fields())
+
+        # Upserts are keyed by message, so queuing a stored copy again is harmless
+        if pending_ids:
+            copied_msgs = []
+            for i in range(0, len(pending_ids), 200):
+                copied_msgs += await get_messages_batch(client, dest_channel_id, pending_ids[i:i + 200], bucket)
+            await queue_copies(copied_through, copied_msgs)
+
+        async def sender():
+            nonlocal copied_this_run
+            while True:
+                item = await work.get()
+                if item is None:
+                    return
+                batch_end, msg = item
+                media = msg.document or msg.video or msg.audio
+                caption = remove_unwanted(msg.caption or getattr(media, "file_name", "No Caption"))
+                batch = batches[batch_end]
                 try:
-                    msg = await safe_api_call(client.get_messages(source_channel_id, msg_id))
-                    if not msg:
-                        continue
-
-                    media = msg.document or msg.video or msg.audio
-                    if not media:
-                        continue
-
-                    caption = msg.caption or getattr(media, "file_name", "No Caption")
-                    caption = remove_unwanted(caption)
-
-                    copied_msg = await safe_api_call(client.copy_message(
+                    copied_msg = await call_with_bucket(bucket, lambda: client.copy_message(
                         chat_id=dest_channel_id,
                         from_chat_id=source_channel_id,
-                        message_id=msg_id,
+                        message_id=msg.id,
                         caption=f"<b>{caption}</b>"
                     ))
-
-                    count += 1
-
-                    if copied_msg:
-                        await queue_file_for_processing(
-                            copied_msg,
-                            channel_id=dest_channel_id,
-                            reply_func=message.reply_text,
-                            duplicate=True
-                        )
-
-                    if idx % 10 == 0 or idx == total:
-                        await safe_api_call(status_msg.edit_text(
-                            f"🔁 <b>Copying in progress...</b>\n"
-                            f"✅ <b>{count}</b> files copied so far.\n"
-                            f"📂 <i>{idx}/{total} messages checked</i>"
-                        ))
-
+                    batch["copied"].append(copied_msg)
+                    stats["copied"] += 1
+                    copied_this_run += 1
                 except Exception as copy_error:
-                    failed += 1
-                    logger.warning(f"[copy_file_handler] Failed to copy message {msg_id}: {copy_error}")
-                    continue
+                    stats["failed"] += 1
+                    logger.warning(f"[copy_file_handler] Failed to copy message {msg.id}: {copy_error}")
+                batch["remaining"] -= 1
+                if not batch["remaining"]:
+                    try:
+                        await advance()
+                    except Exception as e:
+                        logger.error(f"[copy_file_handler] Failed to record progress: {e}")
+
+        fetch_error = None
+        fetched_until = resume_from - 1
+        async with bot.copy_lock:
+            senders = [asyncio.create_task(sender()) for _ in range(max(COPY_CONCURRENCY, 1))]
+            try:
+                try:
+                    async for batch_end, messages in iter_message_batches(
+                        client, source_channel_id, resume_from, end_id, batch_size=200
+                    ):
+                        media_msgs = [msg for msg in messages if msg.document or msg.video or msg.audio]
+                        batches[batch_end] = {"remaining": len(media_msgs), "copied": []}
+                        stats["checked"] = batch_end - start_id + 1
+                        fetched_until = batch_end
+                        if not media_msgs:
+                            await advance()
+                        for msg in media_msgs:
+                            await work.put((batch_end, msg))
+                        elapsed = max(time.monotonic() - started, 1e-6)
+                        await progress.update(
+                            f"🔁 <b>Copying in progress...</b>\n"
+                            f"✅ <b>{stats['copied']}</b> files copied so far.\n"
+                            f"📂 <i>{stats['checked']}/{total} messages checked</i>\n"
+                            f"⚡ {copied_this_run / elapsed:.2f} msgs/s"
+                        )
+                except Exception as e:
+                    # Finish the batches already fetched; the checkpoint stops before the failed one
+                    fetch_error = e
+                    logger.error(f"[copy_file_handler] Stopping, could not fetch messages: {e}")
+                for _ in senders:
+                    await work.put(None)
+                await asyncio.gather(*senders)
+            finally:
+                for task in senders:
+                    task.cancel()
+            await advance()
+
+        if fetch_error is not None:
+            await safe_api_call(status_msg.edit_text(
+                f"⚠️ <b>Copy stopped:</b> could not fetch messages after <code>{fetched_until}</code>.\n"
+                f"✅ <b>{stats['copied']}</b> files copied so far.\n"
+                f"Run the same /copy command again to resume.\n\n<code>{fetch_error}</code>"
+            ))
+            invalidate_search_cache()
+            asyncio.create_task(settle_checkpoint(checkpoint_key, tracker, checkpoint_fields, complete=False))
+            return
+        asyncio.create_task(settle_checkpoint(checkpoint_key, tracker, checkpoint_fields, complete=True))
 
+        elapsed = max(time.monotonic() - started, 1e-6)
         await safe_api_call(status_msg.edit_text(
             f"✅ <b>Copy completed!</b>\n\n"
-            f"📦 <b>Total files copied:</b> {count}\n"
-            f"❌ <b>Failed to copy:</b> {failed}\n"
-            f"📂 <i>Total messages checked:</i> {total}"
+            f"📦 <b>Total files copied:</b> {stats['copied']}\n"
+            f"❌ <b>Failed to copy:</b> {stats['failed']}\n"
+            f"📂 <i>Total messages checked:</i> {total}\n"
+            f"⚡ <i>{copied_this_run / elapsed:.2f} msgs/s</i>"
         ))
         invalidate_search_cache()
     except Exception as e:
@@ -160,7 +284,15 @@ async def watch_queue(reply, total_files):
     last_message = ""
     while get_queue_size() > 0:
         processed_files = total_files - get_queue_size()
-        current_message = f"🔁 <b>Processing files...</b> {processed_files}/{total_files} processed."
+        stats = get_pipeline_stats()
+        current_message = (
+            f"🔁 <b>Processing files...</b> {processed_files}/{total_files} processed.\n"
+            f"🔎 Metadata: {stats['queues']['metadata']} queued, "
+            f"{stats['stages']['metadata']['throughput_per_sec']:.2f}/s\n"
+            f"💾 Persist: {stats['queues']['persist']} queued, "
+            f"{stats['stages']['persist']['throughput_per_sec']:.2f}/s "
+            f"(batch {stats['flushes']['persist']['avg_size']:.0f}, {stats['flushes']['persist']['avg_ms']:.0f} ms)"
+        )
         if last_message != current_message:
             await safe_api_call(reply.edit_text(current_message))
             last_message = current_message
@@ -172,7 +304,25 @@ async def watch_queue(reply, total_files):
         
     invalidate_search_cache()
 
+async def settle_checkpoint(checkpoint_key, tracker, fields, complete):
+    """
+    Once every file a bulk job queued has left the pipeline, clear its
+    checkpoint if the run completed with everything stored; otherwise save
+    `fields()`, which reflects what was persisted, so a rerun resumes there.
+    """
+    try:
+        await tracker.drained()
+        if complete and not tracker.failed:
+            await clear_checkpoint(checkpoint_key)
+            return
+        if tracker.failed:
+            logger.warning(f"[{checkpoint_key}] Some queued files were not stored; keeping the checkpoint for a rerun")
+        await save_checkpoint(checkpoint_key, **fields())
+    except Exception as e:
+        logger.error(f"[{checkpoint_key}] Failed to record progress: {e}")
+
 @bot.on_message(filters.command("index") & filters.private & filters.user(OWNER_ID))
+@with_priority(BULK)
 async def index_channel_files(client, message):
     try:
         args = message.command
@@ -195,41 +345,74 @@ async def index_channel_files(client, message):
             return
 
         channel_id = start_channel_id
-        allowed_channels = await get_allowed_channels()
-        if channel_id not in allowed_channels:
+        if not is_channel_allowed(channel_id):
             await message.reply_text("❌ <b>This channel is not allowed for indexing.</b>")
             return
 
         start_id = min(start_msg_id, end_msg_id)
         end_id = max(start_msg_id, end_msg_id)
 
-        reply = await message.reply_text(f"🔁 <b>Indexing files from <code>{start_id}</code> to <code>{end_id}</code>...</b>\n"
-                                       f"Duplicates allowed: {dup}")
-
-        batch_size = 50
+        # Resume an interrupted run over the same range
+        checkpoint_key = f"index:{channel_id}"
+        checkpoint = await load_checkpoint(checkpoint_key)
+        resume_from = start_id
         count = 0
-        for batch_start in range(start_id, end_id + 1, batch_size):
-            batch_end = min(batch_start + batch_size - 1, end_id)
-            ids = list(range(batch_start, batch_end + 1))
-            messages = []
-            try:
-                messages = await safe_api_call(client.get_messages(channel_id, ids))
-            except Exception as e:
-                logger.warning(f"Could not get messages in batch {batch_start}-{batch_end}: {e}")
-
-            for msg in messages:
-                if not msg:
-                    continue
-                if msg.document or msg.video or msg.audio or msg.photo:
-                    await queue_file_for_processing(
-                        msg,
-                        channel_id=channel_id,
-                        reply_func=reply.edit_text,
-                        duplicate=dup
-                    )
-                    count += 1
-            await safe_api_call(reply.edit_text(f"🔁 <b>Indexing in progress...</b> {count} files queued so far."))
+        if (checkpoint and checkpoint.get("start_id") == start_id
+                and checkpoint.get("end_id") == end_id and checkpoint.get("dup") == dup):
+            resume_from = checkpoint["last_id"] + 1
+            count = checkpoint.get("queued", 0)
+
+        reply = await message.reply_text(f"🔁 <b>Indexing files from <code>{start_id}</code> to <code>{end_id}</code>...</b>\n"
+                                       f"Duplicates allowed: {dup}" +
+                                       (f"\n♻️ Resuming from <code>{resume_from}</code>" if resume_from > start_id else ""))
+        progress = ProgressEditor(reply)
+
+        # The checkpoint only moves past a batch once its files are persisted,
+        # so files still in the pipeline are fetched again after a restart
+        tracker = PipelineTracker()
+        queued_through = {resume_from - 1: count}
+
+        def checkpoint_fields():
+            persisted = tracker.persisted_through
+            if persisted is None:
+                persisted = resume_from - 1
+            for batch_end in [k for k in queued_through if k < persisted]:
+                del queued_through[batch_end]
+            return dict(start_id=start_id, end_id=end_id, dup=dup, last_id=persisted, queued=queued_through[persisted])
+
+        last_id = resume_from - 1
+        try:
+            async for batch_end, messages in iter_message_batches(client, channel_id, resume_from, end_id):
+                for msg in messages:
+                    if msg.document or msg.video or msg.audio or msg.photo:
+                        await queue_file_for_processing(
+                            msg,
+                            channel_id=channel_id,
+                            reply_func=reply.edit_text,
+                            duplicate=dup,
+                            on_done=tracker.track(batch_end)
+                        )
+                        count += 1
+                tracker.seal(batch_end)
+                queued_through[batch_end] = count
+                await save_checkpoint(checkpoint_key, **checkpoint_fields())
+                last_id = batch_end
+                await progress.update(
+                    f"🔁 <b>Indexing in progress...</b> {count} files queued so far.\n"
+                    f"📂 <i>{batch_end - start_id + 1}/{end_id - start_id + 1} messages checked</i>"
+                )
+        except Exception as e:
+            # The checkpoint catches up with the queued batches as they are persisted
+            logger.error(f"[index_channel_files] Stopping, could not fetch messages: {e}")
+            await safe_api_call(reply.edit_text(
+                f"⚠️ <b>Indexing stopped:</b> could not fetch messages after <code>{last_id}</code>.\n"
+                f"{count} files queued so far.\n"
+                f"Run the same /index command again to resume.\n\n<code>{e}</code>"
+            ))
+            asyncio.create_task(settle_checkpoint(checkpoint_key, tracker, checkpoint_fields, complete=False))
+            return
 
+        asyncio.create_task(settle_checkpoint(checkpoint_key, tracker, checkpoint_fields, complete=True))
         asyncio.create_task(watch_queue(reply, count))
     except Exception as e:
         logger.error(f"[index_channel_files] Error: {e}")
@@ -249,7 +432,9 @@ async def delete_command(client, message):
             try:
                 # Try TMDB first
                 tmdb_type, tmdb_id = await extract_tmdb_link(user_input)
-                result = tmdb_col.delete_one({"tmdb_type": tmdb_type, "tmdb_id": tmdb_id})
+                result = await tmdb_col.delete_one({"tmdb_type": tmdb_type, "tmdb_id": tmdb_id})
+                forget_tmdb_entry(tmdb_id, tmdb_type)
+                invalidate_search_cache()
                 if result.deleted_count > 0:
                     await message.reply_text(f"Database record deleted: {tmdb_type}/{tmdb_id}.")
                 else:
@@ -258,7 +443,9 @@ async def delete_command(client, message):
                 # Not a TMDB link, try Telegram
                 try:
                     channel_id, msg_id = extract_channel_and_msg_id(user_input)
-                    result = files_col.delete_one({"channel_id": channel_id, "message_id": msg_id})
+                    result = await files_col.delete_one({"channel_id": channel_id, "message_id": msg_id})
+                    await search_backend.remove(channel_id, msg_id)
+                    invalidate_search_cache()
                     if result.deleted_count > 0:
                         await message.reply_text(f"Deleted file with message ID {msg_id} in channel {channel_id}.")
                     else:
@@ -279,10 +466,12 @@ async def delete_command(client, message):
                     return
                 if start_msg_id > end_msg_id:
                     start_msg_id, end_msg_id = end_msg_id, start_msg_id
-                result = files_col.delete_many({
+                result = await files_col.delete_many({
                     "channel_id": channel_id,
                     "message_id": {"$gte": start_msg_id, "$lte": end_msg_id}
                 })
+                await search_backend.remove_range(channel_id, start_msg_id, end_msg_id)
+                invalidate_search_cache()
                 await message.reply_text(f"Deleted {result.deleted_count} files from {start_msg_id} to {end_msg_id} in channel {channel_id}.")
             except ValueError as e:
                 await message.reply_text(f"Error: Invalid Telegram link provided for range deletion. {e}")
@@ -329,11 +518,7 @@ async def add_channel_handler(client, message: Message):
     try:
         channel_id = int(message.command[1])
         channel_name = " ".join(message.command[2:])
-        allowed_channels_col.update_one(
-            {"channel_id": channel_id},
-            {"$set": {"channel_id": channel_id, "channel_name": channel_name}},
-            upsert=True
-        )
+        await add_allowed_channel(channel_id, channel_name)
         await message.reply_text(f"✅ Channel {channel_id} ({channel_name}) added to allowed channels.")
     except ValueError:
         await message.reply_text("Invalid channel ID.")
@@ -348,8 +533,7 @@ async def remove_channel_handler(client, message: Message):
         return
     try:
         channel_id = int(message.command[1])
-        result = allowed_channels_col.delete_one({"channel_id": channel_id})
-        if result.deleted_count:
+        if await remove_allowed_channel(channel_id):
             await message.reply_text(f"✅ Channel {channel_id} removed from allowed channels.")
         else:
             await message.reply_text("❌ Channel not found in allowed channels.")
@@ -361,78 +545,25 @@ async def remove_channel_handler(client, message: Message):
 
 @bot.on_message(filters.command("broadcast") & filters.chat(LOG_CHANNEL_ID))
 async def broadcast_handler(client, message: Message):
-    global broadcasting
-    if message.reply_to_message:
-        if broadcasting:
-            await message.reply_text("already broadcasting")
-            return
-        users = list(users_col.find({}, {"_id": 0, "user_id": 1}))
-        total_users = len(users)
-        sent_count = 0
-        failed_count = 0
-        removed_count = 0
-        broadcasting = True
-
+    if not message.reply_to_message:
+        return
+    if broadcaster.running:
+        await message.reply_text("already broadcasting")
+        return
+    try:
         status_message = await message.reply_text(
-            f"📢 Broadcast in progress...\n\n"
-            f"👥 Total Users: {total_users}\n"
-            f"✅ Sent: {sent_count}\n"
-            f"❌ Failed: {failed_count}\n"
-            f"🗑️ Removed: {removed_count}",
-            reply_markup=InlineKeyboardMarkup(
-                [[InlineKeyboardButton("Cancel", callback_data="cancel_broadcast")]]
-            )
+            "📢 Broadcast in progress...",
+            reply_markup=CANCEL_MARKUP
         )
-
-        for i, user in enumerate(users):
-            if not broadcasting:
-                await status_message.edit_text("📢 **Broadcast cancelled.**")
-                break
-            try:
-                msg = message.reply_to_message
-                if msg.forward_from_chat:
-                    await safe_api_call(msg.copy(chat_id=user["user_id"],
-                                                 caption=f"{msg.caption.html}\n\n✅ <b>Now Available!</b>",
-                                                 reply_markup=msg.reply_markup
-                                                 ))
-                else:
-                    await safe_api_call(msg.copy(user["user_id"]))
-                sent_count += 1
-            except (UserIsBlocked, InputUserDeactivated, PeerIdInvalid, UserIsBot):
-                users_col.delete_one({"user_id": user["user_id"]})
-                removed_count += 1
-            except Exception as e:
-                failed_count += 1
-                logger.error(f"Error broadcasting to {user['user_id']}: {e}")
-
-            if i % 10 == 0:
-                await status_message.edit_text(
-                    f"📢 Broadcast in progress...\n\n"
-                    f"👥 Total Users: {total_users}\n"
-                    f"✅ Sent: {sent_count}\n"
-                    f"❌ Failed: {failed_count}\n"
-                    f"🗑️ Removed: {removed_count}",
-                    reply_markup=InlineKeyboardMarkup(
-                        [[InlineKeyboardButton("Cancel", callback_data="cancel_broadcast")]]
-                    )
-                )
-        else:
-            await status_message.edit_text(
-                f"✅ Broadcast finished!**\n\n"
-                f"👥 Total Users: {total_users}\n"
-                f"✅ Sent: {sent_count}\n"
-                f"❌ Failed: {failed_count}\n"
-                f"🗑️ Removed: {removed_count}"
-            )
-
-        broadcasting = False
+        await broadcaster.start(client, message.reply_to_message, status_message)
+    except Exception as e:
+        logger.error(f"Error in broadcast_handler: {e}")
+        await safe_api_call(message.reply_text(f"❌ Broadcast failed: {e}"))
 
 
 @bot.on_callback_query(filters.regex("cancel_broadcast"))
 async def cancel_broadcast_handler(client, query):
-    global broadcasting
-    if broadcasting:
-        broadcasting = False
+    if broadcaster.cancel():
         await query.answer("Cancelling broadcast...", show_alert=True)
     else:
         await query.answer("No broadcast in progress.", show_alert=True)
@@ -452,31 +583,43 @@ async def send_log_file(client, message: Message):
 @bot.on_message(filters.command("stats") & filters.private & filters.user(OWNER_ID))
 async def stats_command(client, message: Message):
     try:
-        total_auth_users = auth_users_col.count_documents({})
-        total_users = users_col.count_documents({})
+        total_auth_users = await auth_users_col.count_documents({})
+        total_users = await users_col.count_documents({})
 
         pipeline = [
             {"$group": {"_id": None, "total": {"$sum": "$file_size"}}}
         ]
-        result = list(files_col.aggregate(pipeline))
+        result = await (await files_col.aggregate(pipeline)).to_list(None)
         total_storage = result[0]["total"] if result else 0
 
-        stats = db.command("dbstats")
+        stats = await db.command("dbstats")
         db_storage = stats.get("storageSize", 0)
 
         channel_pipeline = [
             {"$group": {"_id": "$channel_id", "count": {"$sum": 1}}},
             {"$sort": {"count": -1}}
         ]
-        channel_counts = list(files_col.aggregate(channel_pipeline))
+        channel_counts = await (await files_col.aggregate(channel_pipeline)).to_list(None)
         channel_docs = allowed_channels_col.find({}, {"_id": 0, "channel_id": 1, "channel_name": 1})
-        channel_names = {c["channel_id"]: c.get("channel_name", "") for c in channel_docs}
+        channel_names = {c["channel_id"]: c.get("channel_name", "") async for c in channel_docs}
 
         text = (
             f"<b>Total auth users:</b> {total_auth_users} / {total_users}\n"
             f"<b>Files size:</b> {human_readable_size(total_storage)}\n"
             f"<b>Database storage used:</b> {db_storage / (1024 * 1024):.2f} MB\n"
         )
+        auth_stats = auth_cache.stats()
+        search_stats = search_cache.stats()
+        rpc_stats = scheduler.stats()["priorities"]
+        text += (
+            f"<b>Auth cache:</b> {auth_stats['hits']} hits / {auth_stats['misses']} misses "
+            f"({auth_stats['hit_ratio'] * 100:.1f}%)\n"
+            f"<b>Search cache:</b> {search_stats['hits']} hits / {search_stats['misses']} misses "
+            f"({search_stats['hit_ratio'] * 100:.1f}%)\n"
+            f"<b>API calls:</b> " + ", ".join(
+                f"{name} {s['calls']} ({s['flood_waits']} FloodWait)" for name, s in rpc_stats.items()
+            ) + "\n"
+        )
 
         if not channel_counts:
             text += " <b>No files indexed yet.</b>"
@@ -494,14 +637,18 @@ async def stats_command(client, message: Message):
 @bot.on_message(filters.private & filters.command("sd") & filters.user(OWNER_ID))
 async def sd_command(client, message):
     try:
-        args = message.text.split(maxsplit=3)
+        args = message.text.split()
+        # A trailing "nocache" fetches fresh details instead of the cached TMDB response
+        use_cache = args[-1].lower() != "nocache"
+        if not use_cache:
+            args.pop()
         if len(args) < 3:
-            await message.reply_text("Usage: /sd <tmdb_link> <start_link> [end_link]")
+            await message.reply_text("Usage: /sd <tmdb_link> <start_link> [end_link] [nocache]")
             return
 
         tmdb_link = args[1]
         start_link = args[2]
-        end_link = args[3] if len(args) > 3 else None
+        end_link = " ".join(args[3:]) or None
 
         try:
             tmdb_type, tmdb_id = await extract_tmdb_link(tmdb_link)
@@ -509,7 +656,7 @@ async def sd_command(client, message):
             await message.reply_text(f"Invalid TMDB link: {e}")
             return
 
-        info = await get_info(tmdb_type, tmdb_id)
+        info = await get_info(tmdb_type, tmdb_id, use_cache=use_cache)
         poster_url = info.get('poster_url')
         poster_path = info.get('poster_path')
         trailer_url = info.get('trailer_url')
@@ -519,7 +666,7 @@ async def sd_command(client, message):
         rating = info.get('rating')
         plot = info.get("plot")
         imdb_id = info.get("imdb_id")
-        upsert_tmdb_info(tmdb_id, tmdb_type, poster_path, name, year, rating, plot, trailer_url, imdb_id)
+        await upsert_tmdb_info(tmdb_id, tmdb_type, poster_path, name, year, rating, plot, trailer_url, imdb_id)
 
         keyboard = InlineKeyboardMarkup(
             [[InlineKeyboardButton("🎥 Trailer", url=trailer_url)]]) if trailer_url else None
@@ -550,13 +697,14 @@ async def sd_command(client, message):
             if start_msg_id > end_msg_id:
                 start_msg_id, end_msg_id = end_msg_id, start_msg_id
 
-            result = files_col.update_many(
+            result = await files_col.update_many(
                 {
                     "channel_id": start_channel_id,
                     "message_id": {"$gte": start_msg_id, "$lte": end_msg_id}
                 },
                 {"$set": {"tmdb_id": tmdb_id, "tmdb_type": tmdb_type}}
             )
+            invalidate_search_cache()
             await message.reply_text(f"✅ Successfully added {result.modified_count} files with TMDB ID {tmdb_id} ({tmdb_type}).")
         else:
             # Single file update
@@ -566,10 +714,11 @@ async def sd_command(client, message):
                 await message.reply_text(f"Invalid Telegram link: {e}")
                 return
 
-            result = files_col.update_one(
+            result = await files_col.update_one(
                 {"channel_id": channel_id, "message_id": msg_id},
                 {"$set": {"tmdb_id": tmdb_id, "tmdb_type": tmdb_type}}
             )
+            invalidate_search_cache()
             if result.modified_count > 0:
                 await message.reply_text(f"✅ Successfully added 1 file with TMDB ID {tmdb_id} ({tmdb_type}).")
             else:
@@ -641,7 +790,7 @@ async def block_user_handler(client, message: Message):
         return
     try:
         user_id = int(args[1])
-        users_col.update_one(
+        await users_col.update_one(
             {"user_id": user_id},
             {"$set": {"blocked": True}},
             upsert=True
@@ -661,7 +810,7 @@ async def unblock_user_handler(client, message: Message):
         return
     try:
         user_id = int(args[1])
-        users_col.update_one(
+        await users_col.update_one(
             {"user_id": user_id},
             {"$set": {"blocked": False}},
             upsert=True
@@ -684,14 +833,16 @@ async def add_poster_handler(_, message: Message):
         channel_id, msg_id = extract_channel_and_msg_id(file_link)
         poster_url = args[2].strip()
 
-        file_record = files_col.find_one({"channel_id": channel_id, "message_id": msg_id})
+        file_record = await files_col.find_one({"channel_id": channel_id, "message_id": msg_id})
         if not file_record:
             await message.reply_text("❌ No file record found with the provided link.")
             return
-        files_col.update_one(
+        await files_col.update_one(
             {"channel_id": channel_id, "message_id": msg_id},
             {"$set": {"poster_url": poster_url}}
         )
+        await search_backend.refresh({"channel_id": channel_id, "message_id": msg_id})
+        invalidate_search_cache()
         await message.reply_text(f"✅ Poster URL added to file {file_record['file_name']}.")
     except Exception as e:
         await message.reply_text(f"❌ Failed to add poster URL: {e}")
@@ -0,0 +1,144 @@
+import time
+import random
+import asyncio
+import logging
+import aiohttp
+from config import HTTP_TIMEOUT, HTTP_MAX_CONNECTIONS, HTTP_MAX_PER_HOST, HTTP_RETRIES
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, float("inf"))
+
+
+class UpstreamStats:
+    """Request counters and a latency histogram for one upstream."""
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.statuses = {}
+        self.total_seconds = 0.0
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+
+    def observe(self, seconds, status=None):
+        self.requests += 1
+        self.total_seconds += seconds
+        if status is None:
+            self.errors += 1
+        else:
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+
+    def as_dict(self):
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "retries": self.retries,
+            "statuses": self.statuses,
+            "avg_seconds": round(self.total_seconds / self.requests, 4) if self.requests else 0.0,
+            "latency_histogram": {
+                ("+Inf" if bound == float("inf") else str(bound)): count
+                for bound, count in zip(LATENCY_BUCKETS, self.buckets)
+            },
+        }
+
+
+class HttpClient:
+    """
+    Shared aiohttp client for all outbound HTTP (TMDB, IMDb, URL shortener).
+
+    One pooled session is created by start() in bot.main and closed on
+    shutdown. Requests are retried with backoff on 429/5xx and network
+    errors, and counted per upstream.
+    """
+
+    def __init__(self, timeout=HTTP_TIMEOUT, limit=HTTP_MAX_CONNECTIONS,
+                 limit_per_host=HTTP_MAX_PER_HOST, retries=HTTP_RETRIES, backoff=0.5):
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.retries = retries
+        self.backoff = backoff
+        self.upstreams = {}
+        self._session = None
+
+    async def start(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                ttl_dns_cache=300,
+            )
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def _stats(self, upstream):
+        stats = self.upstreams.get(upstream)
+        if stats is None:
+            stats = self.upstreams[upstream] = UpstreamStats()
+        return stats
+
+    def _retry_delay(self, attempt, retry_after=None):
+        if retry_after:
+            try:
+                return min(float(retry_after), 30.0)
+            except ValueError:
+                pass
+        return self.backoff * (2 ** attempt) + random.uniform(0, self.backoff)
+
+    async def request(self, method, url, upstream, params=None, parse="json"):
+        """
+        Perform a request and return (status, body).
+
+        `parse` is "json" or "text". The body is None if it cannot be parsed.
+        Network errors are re-raised once all retries are used up.
+        """
+        session = await self.start()
+        stats = self._stats(upstream)
+        for attempt in range(self.retries + 1):
+            started = time.monotonic()
+            try:
+                async with session.request(method, url, params=params) as resp:
+                    if parse == "json":
+                        try:
+                            body = await resp.json(content_type=None)
+                        except ValueError:
+                            body = None
+                    else:
+                        body = await resp.text()
+                    stats.observe(time.monotonic() - started, resp.status)
+                    if resp.status not in RETRY_STATUSES or attempt == self.retries:
+                        return resp.status, body
+                    delay = self._retry_delay(attempt, resp.headers.get("Retry-After"))
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                stats.observe(time.monotonic() - started)
+                if attempt == self.retries:
+                    raise
+                delay = self._retry_delay(attempt)
+                logger.warning(f"{upstream} request failed ({e}), retrying in {delay:.1f}s")
+            stats.retries += 1
+            await asyncio.sleep(delay)
+
+    async def get_json(self, url, upstream, params=None):
+        return await self.request("GET", url, upstream, params=params, parse="json")
+
+    async def get_text(self, url, upstream, params=None):
+        return await self.request("GET", url, upstream, params=params, parse="text")
+
+    def stats(self):
+        return {name: stats.as_dict() for name, stats in self.upstreams.items()}
+
+
+http_client = HttpClient()
@@ -0,0 +1,77 @@
+import re
+
+# Token separators: those of the `custom_filename` analyzer in Atlas.txt, plus "!"
+# which search queries have always dropped
+SEPARATORS = re.compile(r"[\s._\-()\[\]!]+")
+
+# Video extension and anything after it
+EXTENSION_TAIL = re.compile(r"\.(mkv|mp4|webm).*$", re.IGNORECASE)
+# Everything up to and including the video extension
+UP_TO_EXTENSION = re.compile(r"^(.*?\.(mkv|mp4|webm))", re.IGNORECASE)
+
+# Uploader tags, tried in order; only the first pattern that matches is removed
+UPLOADER_PATTERNS = [
+    re.compile(r"^@[\w\.-]+?(?=_)"),
+    re.compile(r"_@[A-Za-z]+_|@[A-Za-z]+_|[\[\]\s@]*@[^.\s\[\]]+[\]\[\s@]*"),
+    re.compile(r"^[\w\.-]+?(?=_Uploads_)"),
+    re.compile(r"^(?:by|from)[\s_-]+[\w\.-]+?(?=_)"),
+    re.compile(r"^\[[\w\.-]+?\][\s_-]*"),
+    re.compile(r"^\([\w\.-]+?\)[\s_-]*"),
+]
+EDGE_SEPARATORS = re.compile(r"^[_\s-]+|[_\s-]+$")
+
+
+def tokenize(text):
+    """Split text into lowercase search tokens. Used for indexing and queries alike."""
+    return [token for token in SEPARATORS.split(text.lower()) if token]
+
+
+def sanitize_query(query):
+    """Normalize a search query so 'and'/'&' and punctuation match the indexed names."""
+    query = query.replace("&", " and ").replace(":", "").replace("'", "").replace(",", "")
+    return " ".join(tokenize(query))
+
+
+def strip_extension(name):
+    return EXTENSION_TAIL.sub("", name)
+
+
+def keep_up_to_extension(caption):
+    match = UP_TO_EXTENSION.match(caption)
+    return match.group(1) if match else caption
+
+
+def clean_file_name(name):
+    """The form file names are stored in: '&' spelled out, quotes/commas and extension dropped."""
+    return strip_extension(name.replace("&", "and").replace("'", "").replace(",", ""))
+
+
+def strip_uploader_tags(filename):
+    """Remove the first kind of uploader tag found in a file name, keeping the title."""
+    result = filename.replace("\n", "\\n")
+    for pattern in UPLOADER_PATTERNS:
+        # Most names carry no tag, and a failed search is cheaper than a failed sub
+        if pattern.search(result):
+            result = pattern.sub(" ", result)
+            break
+    return EDGE_SEPARATORS.sub(" ", result)
+
+
+def normalize_names(names):
+    """
+    Batch form of clean_file_name + tokenize: returns a (clean_name, tokens)
+    pair for every name, with the hot functions bound once for the loop.
+    """
+    clean, split = clean_file_name, SEPARATORS.split
+    results = []
+    append = results.append
+    for name in names:
+        cleaned = clean(name)
+        append((cleaned, [token for token in split(cleaned.lower()) if token]))
+    return results
+
+
+def tokenize_many(texts):
+    """tokenize() over many texts in one call."""
+    split = SEPARATORS.split
+    return [[token for token in split(text.lower()) if token] for text in texts]
@@ -0,0 +1,54 @@
+import time
+import asyncio
+
+
+class TokenBucket:
+    """
+    Async token bucket: `rate` tokens per second, bursts up to `capacity`.
+
+    acquire() waits until enough tokens are available. pause() blocks every
+    caller for a while, e.g. after Telegram answers with a FloodWait.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(rate, 1))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.waited = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, tokens=1):
+        async with self._lock:
+            started = time.monotonic()
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self._refill(now)
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    break
+                await asyncio.sleep((tokens - self.tokens) / self.rate)
+            self.waited += time.monotonic() - started
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        # Start refilling from empty once the pause is over
+        self.tokens = 0.0
+        self.updated = self.paused_until
+
+    def stats(self):
+        return {
+            "rate": self.rate,
+            "capacity": self.capacity,
+            "tokens": round(self.tokens, 2),
+            "paused_for": round(max(self.paused_until - time.monotonic(), 0.0), 2),
+            "waited_seconds": round(self.waited, 2),
+        }
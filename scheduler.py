@@ -0,0 +1,219 @@
+import time
+import heapq
+import asyncio
+import logging
+import functools
+import itertools
+import contextvars
+from cachetools import LRUCache
+from pyrogram.errors import FloodWait
+
+from config import (
+    SCHEDULER_GLOBAL_RATE,
+    SCHEDULER_CHAT_RATE,
+    SCHEDULER_CHAT_BURST,
+    SCHEDULER_FLOOD_RETRIES,
+    SCHEDULER_MAX_INTERACTIVE_WAIT,
+)
+from ratelimit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Priority classes, lower is served first
+INTERACTIVE = 0
+DEFAULT = 1
+BULK = 2
+PRIORITY_NAMES = {INTERACTIVE: "interactive", DEFAULT: "default", BULK: "bulk"}
+
+# Priority of the RPCs made by the current task (and the tasks it creates)
+rpc_priority = contextvars.ContextVar("rpc_priority", default=INTERACTIVE)
+
+# Methods that post into a chat and therefore count against its per-chat limit
+CHAT_LIMITED_METHODS = frozenset({
+    "SendMessage", "SendMedia", "SendMultiMedia", "ForwardMessages", "EditMessage",
+})
+
+
+def with_priority(level):
+    """Run a coroutine function with every RPC it makes scheduled at `level`."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            token = rpc_priority.set(level)
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                rpc_priority.reset(token)
+        return wrapper
+    return decorator
+
+
+def chat_key(query):
+    """Identify the chat a raw API call posts into, or None if it is not chat-limited."""
+    if type(query).__name__ not in CHAT_LIMITED_METHODS:
+        return None
+    peer = getattr(query, "peer", None) or getattr(query, "to_peer", None)
+    if peer is None:
+        return None
+    for attr in ("channel_id", "user_id", "chat_id"):
+        value = getattr(peer, attr, None)
+        if value is not None:
+            return (attr, value)
+    return None
+
+
+class PriorityStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.flood_waits = 0
+        self.flood_wait_seconds = 0
+        self.queued_seconds = 0.0
+
+    def as_dict(self):
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "flood_waits": self.flood_waits,
+            "flood_wait_seconds": self.flood_wait_seconds,
+            "avg_queued_ms": round(self.queued_seconds / self.calls * 1000, 2) if self.calls else 0.0,
+        }
+
+
+class RequestScheduler:
+    """
+    Admission control for every Telegram RPC the bot makes.
+
+    Calls take a token from a global bucket; waiting calls are admitted in
+    priority order, so interactive replies overtake queued broadcast/copy
+    traffic. Calls that post into a chat also take a token from that chat's
+    bucket. FloodWait is retried after the requested delay, pausing the
+    chat in the meantime; for non-chat calls only the same method at the
+    same priority is paused, so a bulk job's FloodWait does not hold up
+    interactive traffic. This is the only layer that retries FloodWait.
+    """
+
+    def __init__(self, rate=SCHEDULER_GLOBAL_RATE, chat_rate=SCHEDULER_CHAT_RATE,
+                 chat_burst=SCHEDULER_CHAT_BURST, flood_retries=SCHEDULER_FLOOD_RETRIES,
+                 max_interactive_wait=SCHEDULER_MAX_INTERACTIVE_WAIT):
+        self.rate = float(rate)
+        self.capacity = max(self.rate, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.flood_retries = flood_retries
+        self.max_interactive_wait = max_interactive_wait
+        self.chat_buckets = LRUCache(maxsize=10000)
+        # (method name, priority) -> monotonic time its FloodWait ends
+        self.method_pauses = LRUCache(maxsize=1000)
+        self.stats_by_priority = {level: PriorityStats() for level in PRIORITY_NAMES}
+        self._waiters = []
+        self._seq = itertools.count()
+        self._dispatcher = None
+
+    def _refill(self, now):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def _try_take(self):
+        now = time.monotonic()
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    async def _acquire_global(self, priority):
+        if not self._waiters and self._try_take():
+            return
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = loop.create_task(self._dispatch())
+        await future
+
+    async def _dispatch(self):
+        while self._waiters:
+            if self._waiters[0][2].done():
+                # Cancelled while waiting
+                heapq.heappop(self._waiters)
+                continue
+            if self._try_take():
+                _, _, future = heapq.heappop(self._waiters)
+                future.set_result(None)
+                continue
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def _chat_bucket(self, key):
+        bucket = self.chat_buckets.get(key)
+        if bucket is None:
+            bucket = self.chat_buckets[key] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    def pause_method(self, key, seconds):
+        self.method_pauses[key] = max(self.method_pauses.get(key, 0.0), time.monotonic() + seconds)
+
+    async def _wait_method(self, key):
+        paused_until = self.method_pauses.get(key)
+        if paused_until is not None:
+            delay = paused_until - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+    async def run(self, make_call, query=None, priority=None):
+        """Await make_call() once admitted, retrying it after FloodWait."""
+        priority = rpc_priority.get() if priority is None else priority
+        stats = self.stats_by_priority[priority]
+        key = chat_key(query)
+        method_key = (type(query).__name__, priority)
+        for attempt in range(self.flood_retries + 1):
+            queued_at = time.monotonic()
+            if key is not None:
+                await self._chat_bucket(key).acquire()
+            else:
+                await self._wait_method(method_key)
+            await self._acquire_global(priority)
+            stats.calls += 1
+            stats.queued_seconds += time.monotonic() - queued_at
+            try:
+                return await make_call()
+            except FloodWait as e:
+                stats.flood_waits += 1
+                stats.flood_wait_seconds += e.value
+                if key is not None:
+                    self._chat_bucket(key).pause(e.value)
+                else:
+                    self.pause_method(method_key, e.value)
+                if attempt == self.flood_retries or (
+                        priority == INTERACTIVE and e.value > self.max_interactive_wait):
+                    raise
+                logger.warning(
+                    f"FloodWait of {e.value}s on {type(query).__name__}, "
+                    f"retrying ({PRIORITY_NAMES[priority]}, attempt {attempt + 1})"
+                )
+            except Exception:
+                stats.errors += 1
+                raise
+
+    def stats(self):
+        now = time.monotonic()
+        return {
+            "rate": self.rate,
+            "tokens": round(self.tokens, 2),
+            "paused_methods": {
+                f"{method}/{PRIORITY_NAMES[level]}": round(until - now, 2)
+                for (method, level), until in list(self.method_pauses.items()) if until > now
+            },
+            "queued": len(self._waiters),
+            "chats_tracked": len(self.chat_buckets),
+            "priorities": {
+                PRIORITY_NAMES[level]: stats.as_dict()
+                for level, stats in self.stats_by_priority.items()
+            },
+        }
+
+
+scheduler = RequestScheduler()
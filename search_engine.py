@@ -0,0 +1,302 @@
+import re
+import math
+import logging
+from collections import Counter
+from db import files_col
+from config import SEARCH_BACKEND
+from normalize import tokenize, tokenize_many
+
+logger = logging.getLogger(__name__)
+
+SEARCH_PROJECTION = {
+    "_id": 1,
+    "file_name": 1,
+    "file_size": 1,
+    "file_format": 1,
+    "message_id": 1,
+    "channel_id": 1,
+    "poster_url": 1,
+}
+
+def build_search_pipeline(query, match_query, skip, limit):
+    # Split the query string into words
+    terms = query.strip().lower().split()
+
+    # Create a separate `text` clause for each term
+    must_clauses = [
+        {
+            "text": {
+                "query": term,
+                "path": "file_name"
+            }
+        }
+        for term in terms
+    ]
+
+    # Build search stage with compound.must
+    search_stage = {
+        "$search": {
+            "index": "default",
+            "compound": {
+                "must": must_clauses
+            }
+        }
+    }
+
+    # Match allowed channel IDs
+    match_stage = {
+        "$match": match_query
+    }
+
+    # Project only necessary fields and search score
+    project_stage = {
+        "$project": {
+            **SEARCH_PROJECTION,
+            "score": {"$meta": "searchScore"}
+        }
+    }
+
+    # Sort results by score and then file name
+    sort_stage = {
+        "$sort": {
+            "score": -1,
+            "_id": -1
+        }
+    }
+
+    # Facet: paginated results and total count
+    facet_stage = {
+        "$facet": {
+            "results": [
+                project_stage,
+                sort_stage,
+                {"$skip": skip},
+                {"$limit": limit}
+            ],
+            "totalCount": [
+                {"$count": "total"}
+            ]
+        }
+    }
+
+    return [search_stage, match_stage, facet_stage]
+
+
+class AtlasSearchBackend:
+    """Runs searches against the Atlas Search `default` index."""
+
+    name = "atlas"
+    # The index lives in Atlas, so results are complete from the start
+    ready = True
+
+    async def build(self):
+        pass
+
+    async def add(self, file_info):
+        pass
+
+    async def remove(self, channel_id, message_id):
+        pass
+
+    async def remove_range(self, channel_id, start_id, end_id):
+        pass
+
+    async def refresh(self, query):
+        pass
+
+    async def search(self, query, match_query, skip, limit):
+        """Returns (files, total_count) for a sanitized query."""
+        pipeline = build_search_pipeline(query, match_query, skip, limit)
+        result = await (await files_col.aggregate(pipeline)).to_list(None)
+        files = result[0]['results'] if result and 'results' in result[0] else []
+        total = result[0]['totalCount'][0]['total'] if result and 'totalCount' in result[0] and result[0]['totalCount'] else 0
+        return files, total
+
+
+def _channel_predicate(match_query):
+    """Turns the channel filters used by the API into a predicate on channel_id."""
+    if not match_query:
+        return lambda channel_id: True
+    if set(match_query) != {"channel_id"}:
+        raise ValueError(f"Unsupported filter for local search: {match_query}")
+    condition = match_query["channel_id"]
+    if not isinstance(condition, dict):
+        return lambda channel_id: channel_id == condition
+    if "$nin" in condition:
+        excluded = frozenset(condition["$nin"])
+        return lambda channel_id: channel_id not in excluded
+    if "$in" in condition:
+        included = frozenset(condition["$in"])
+        return lambda channel_id: channel_id in included
+    raise ValueError(f"Unsupported filter for local search: {match_query}")
+
+
+class LocalSearchBackend:
+    """
+    In-process inverted index over files_col.file_name with BM25 scoring.
+
+    Documents are keyed by (channel_id, message_id), the same identity used
+    by upsert_file_info, so re-indexing a message replaces its entry.
+    """
+
+    name = "local"
+
+    def __init__(self, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.ready = False
+        self._docs = {}
+        self._doc_terms = {}
+        self._postings = {}
+        self._total_length = 0
+
+    def __len__(self):
+        return len(self._docs)
+
+    def _index(self, doc, tokens=None):
+        key = (doc["channel_id"], doc["message_id"])
+        self._unindex(key)
+        terms = Counter(tokenize(doc.get("file_name") or "") if tokens is None else tokens)
+        self._docs[key] = {field: doc.get(field) for field in SEARCH_PROJECTION}
+        self._doc_terms[key] = terms
+        self._total_length += sum(terms.values())
+        for term, tf in terms.items():
+            self._postings.setdefault(term, {})[key] = tf
+
+    def _index_batch(self, docs):
+        for doc, tokens in zip(docs, tokenize_many([doc["file_name"] for doc in docs])):
+            self._index(doc, tokens)
+
+    def _unindex(self, key):
+        terms = self._doc_terms.pop(key, None)
+        if terms is None:
+            return
+        self._docs.pop(key, None)
+        self._total_length -= sum(terms.values())
+        for term in terms:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(key, None)
+                if not postings:
+                    del self._postings[term]
+
+    async def build(self):
+        """Load every file from Mongo into the index; searches go to Mongo until it is done."""
+        self.ready = False
+        self._docs.clear()
+        self._doc_terms.clear()
+        self._postings.clear()
+        self._total_length = 0
+        batch = []
+        async for doc in files_col.find({}, SEARCH_PROJECTION):
+            if doc.get("file_name"):
+                batch.append(doc)
+            if len(batch) >= 1000:
+                self._index_batch(batch)
+                batch = []
+        self._index_batch(batch)
+        self.ready = True
+        logger.info(f"Local search index built with {len(self._docs)} files.")
+
+    async def add(self, file_info):
+        """Index a file after it has been upserted into files_col."""
+        key = (file_info["channel_id"], file_info["message_id"])
+        doc = dict(file_info)
+        if doc.get("_id") is None:
+            existing = self._docs.get(key)
+            if existing is not None:
+                doc["_id"] = existing["_id"]
+            else:
+                stored = await files_col.find_one(
+                    {"channel_id": key[0], "message_id": key[1]}, {"_id": 1}
+                )
+                doc["_id"] = stored["_id"] if stored else None
+        if doc.get("file_name"):
+            self._index(doc)
+
+    async def remove(self, channel_id, message_id):
+        self._unindex((channel_id, message_id))
+
+    async def remove_range(self, channel_id, start_id, end_id):
+        for key in [k for k in self._docs if k[0] == channel_id and start_id <= k[1] <= end_id]:
+            self._unindex(key)
+
+    async def refresh(self, query):
+        """Re-read the files matching `query` from Mongo into the index."""
+        async for doc in files_col.find(query, SEARCH_PROJECTION):
+            if doc.get("file_name"):
+                self._index(doc)
+
+    def _score(self, key, terms, avg_length):
+        length = sum(self._doc_terms[key].values())
+        n_docs = len(self._docs)
+        score = 0.0
+        for term in terms:
+            postings = self._postings.get(term)
+            tf = postings.get(key) if postings else None
+            if not tf:
+                continue
+            idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            norm = tf + self.k1 * (1 - self.b + self.b * length / avg_length)
+            score += idf * tf * (self.k1 + 1) / norm
+        return score
+
+    async def _search_mongo(self, query, match_query, skip, limit):
+        """Unranked substring search on files_col, used while the index is being built."""
+        words = query.strip().lower().split()
+        mongo_query = dict(match_query)
+        if words:
+            mongo_query["$and"] = [
+                {"file_name": {"$regex": re.escape(word), "$options": "i"}} for word in words
+            ]
+        cursor = files_col.find(mongo_query, SEARCH_PROJECTION).sort("_id", -1).skip(skip).limit(limit)
+        files = await cursor.to_list(None)
+        return files, await files_col.count_documents(mongo_query)
+
+    async def search(self, query, match_query, skip, limit):
+        """
+        Returns (files, total_count) for a sanitized query. Until build() has
+        finished the results come from Mongo instead and are not ranked, so
+        callers should not cache them while `ready` is False.
+        """
+        if not self.ready:
+            return await self._search_mongo(query, match_query, skip, limit)
+
+        allowed = _channel_predicate(match_query)
+        candidates = None
+        query_terms = set()
+        # Each whitespace-separated word must match, like compound.must in Atlas
+        for word in query.strip().lower().split():
+            tokens = tokenize(word)
+            if not tokens:
+                continue
+            query_terms.update(tokens)
+            matched = set()
+            for token in tokens:
+                matched.update(self._postings.get(token, ()))
+            candidates = matched if candidates is None else candidates & matched
+            if not candidates:
+                return [], 0
+
+        if not candidates:
+            return [], 0
+
+        avg_length = (self._total_length / len(self._docs)) or 1
+        scored = [
+            (self._score(key, query_terms, avg_length), key)
+            for key in candidates
+            if allowed(key[0])
+        ]
+        scored.sort(key=lambda item: (item[0], str(self._docs[item[1]]["_id"])), reverse=True)
+        page = scored[skip:skip + limit]
+        files = [dict(self._docs[key], score=score) for score, key in page]
+        return files, len(scored)
+
+
+def create_search_backend(name=SEARCH_BACKEND):
+    if name == "local":
+        return LocalSearchBackend()
+    return AtlasSearchBackend()
+
+
+search_backend = create_search_backend()
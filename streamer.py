@@ -0,0 +1,215 @@
+import os
+import asyncio
+import logging
+import mimetypes
+from cachetools import TTLCache
+
+from config import STREAM_LOCAL_DIR, STREAM_READ_AHEAD
+from chunk_cache import ChunkCache
+from utility import single_flight
+
+logger = logging.getLogger(__name__)
+
+# Telegram serves files in 1 MiB parts; stream_media offsets and limits count these
+CHUNK_SIZE = 1024 * 1024
+
+
+class MediaInfo:
+    def __init__(self, size, mime_type="application/octet-stream", file_name=None):
+        self.size = size
+        self.mime_type = mime_type or "application/octet-stream"
+        self.file_name = file_name
+
+
+class TelegramMediaSource:
+    """
+    Reads media chunks of channel messages through Telegram's file API.
+    Metadata comes from the main bot; chunks are spread over `pool`.
+    """
+
+    def __init__(self, client, pool):
+        self.client = client
+        self.pool = pool
+        # Messages carry the file reference; it stays valid for a while
+        self._messages = TTLCache(maxsize=1000, ttl=30 * 60)
+        self._inflight = {}
+
+    async def _get_message(self, channel_id, message_id):
+        key = (channel_id, message_id)
+        message = self._messages.get(key)
+        if message is None:
+            message = await single_flight(
+                self._inflight, key, lambda: self.client.get_messages(channel_id, message_id)
+            )
+            if message is None or message.empty:
+                raise FileNotFoundError(f"Message {message_id} not found in {channel_id}")
+            self._messages[key] = message
+        return message
+
+    async def info(self, channel_id, message_id):
+        message = await self._get_message(channel_id, message_id)
+        media = message.document or message.video or message.audio
+        if media is None:
+            raise FileNotFoundError(f"Message {message_id} in {channel_id} has no streamable media")
+        return MediaInfo(media.file_size, getattr(media, "mime_type", None), getattr(media, "file_name", None))
+
+    async def read_chunk(self, channel_id, message_id, index):
+        message = await self._get_message(channel_id, message_id)
+        return await self.pool.read_chunk(channel_id, message_id, index, primary_message=message)
+
+
+class LocalMediaSource:
+    """
+    Serves files named `<channel_id>_<message_id>` from a directory. Used to
+    exercise the streaming endpoint without Telegram.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, channel_id, message_id):
+        return os.path.join(self.root, f"{channel_id}_{message_id}")
+
+    async def info(self, channel_id, message_id):
+        path = self._path(channel_id, message_id)
+        if not os.path.isfile(path):
+            raise FileNotFoundError(path)
+        return MediaInfo(os.path.getsize(path), mimetypes.guess_type(path)[0], os.path.basename(path))
+
+    def _read(self, path, index):
+        with open(path, "rb") as f:
+            f.seek(index * CHUNK_SIZE)
+            return f.read(CHUNK_SIZE)
+
+    async def read_chunk(self, channel_id, message_id, index):
+        return await asyncio.to_thread(self._read, self._path(channel_id, message_id), index)
+
+
+def parse_range(header, size):
+    """
+    Parse a single `bytes=` Range header into an inclusive (start, end).
+
+    Returns None when the whole file should be served, and raises ValueError
+    when the range cannot be satisfied.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start_text, _, end_text = header[len("bytes="):].strip().partition("-")
+    try:
+        if not start_text:
+            # Suffix range: the last N bytes
+            length = int(end_text)
+        else:
+            start = int(start_text)
+            end = int(end_text) if end_text else size - 1
+    except ValueError:
+        return None
+    if not start_text:
+        if length <= 0:
+            raise ValueError(f"Range {header} is an empty suffix")
+        return max(size - length, 0), size - 1
+    if start >= size or end < start:
+        raise ValueError(f"Range {header} not satisfiable for size {size}")
+    return start, min(end, size - 1)
+
+
+class MediaStreamer:
+    """
+    Turns byte ranges into chunk-aligned reads from a media source.
+
+    Each connection holds at most one chunk at a time, and concurrent
+    readers of the same chunk share a single upstream fetch. Chunks are
+    kept in a ChunkCache, and the next `read_ahead` chunks of a range are
+    fetched in the background while the current one is sent.
+    """
+
+    def __init__(self, source, chunk_size=CHUNK_SIZE, cache=None, read_ahead=STREAM_READ_AHEAD):
+        self.source = source
+        self.chunk_size = chunk_size
+        self.cache = cache
+        self.read_ahead = read_ahead
+        self._inflight = {}
+        self.chunks_fetched = 0
+        self.chunks_shared = 0
+        self.bytes_served = 0
+
+    async def info(self, channel_id, message_id):
+        return await self.source.info(channel_id, message_id)
+
+    async def _fetch(self, key):
+        self.chunks_fetched += 1
+        chunk = await self.source.read_chunk(*key)
+        if self.cache is not None:
+            await self.cache.put(key, chunk)
+        return chunk
+
+    def _start_fetch(self, key):
+        # A separate task, so a viewer disconnecting does not cancel the fetch for the others
+        task = asyncio.ensure_future(self._fetch(key))
+        self._inflight[key] = task
+        task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return task
+
+    async def get_chunk(self, channel_id, message_id, index):
+        key = (channel_id, message_id, index)
+        task = self._inflight.get(key)
+        if task is not None:
+            self.chunks_shared += 1
+            return await asyncio.shield(task)
+        if self.cache is not None:
+            chunk = await self.cache.get(key)
+            if chunk is not None:
+                return chunk
+            # Another viewer may have started the fetch while the disk tier was read
+            task = self._inflight.get(key)
+        return await asyncio.shield(task or self._start_fetch(key))
+
+    def _prefetch(self, channel_id, message_id, first, last):
+        for index in range(first, min(first + self.read_ahead, last + 1)):
+            key = (channel_id, message_id, index)
+            if key in self._inflight or (self.cache is not None and self.cache.contains(key)):
+                continue
+            self._start_fetch(key).add_done_callback(_log_prefetch_error)
+
+    async def iter_range(self, channel_id, message_id, start, end):
+        """Yield the bytes start..end (inclusive) of a file."""
+        first = start // self.chunk_size
+        last = end // self.chunk_size
+        for index in range(first, last + 1):
+            chunk = await self.get_chunk(channel_id, message_id, index)
+            if self.read_ahead > 0:
+                self._prefetch(channel_id, message_id, index + 1, last)
+            chunk_start = index * self.chunk_size
+            lo = max(start - chunk_start, 0)
+            hi = min(end - chunk_start + 1, len(chunk))
+            if lo >= hi:
+                break
+            self.bytes_served += hi - lo
+            yield chunk[lo:hi]
+
+    def stats(self):
+        return {
+            "chunks_fetched": self.chunks_fetched,
+            "chunks_shared": self.chunks_shared,
+            "bytes_served": self.bytes_served,
+            "inflight": len(self._inflight),
+            "cache": self.cache.stats() if self.cache is not None else None,
+            "clients": self.source.pool.stats() if hasattr(self.source, "pool") else None,
+        }
+
+
+def _log_prefetch_error(task):
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning(f"Read-ahead fetch failed: {task.exception()}")
+
+
+def create_media_streamer(local_dir=STREAM_LOCAL_DIR):
+    cache = ChunkCache(CHUNK_SIZE)
+    if local_dir:
+        return MediaStreamer(LocalMediaSource(local_dir), cache=cache)
+    from app import bot
+    from client_pool import client_pool
+    return MediaStreamer(TelegramMediaSource(bot, client_pool), cache=cache)
+
+
+media_streamer = create_media_streamer()
@@ -0,0 +1,15 @@
+import os
+import sys
+
+# The bot reads its settings from the environment at import time
+os.environ.setdefault("API_ID", "12345")
+os.environ.setdefault("API_HASH", "0123456789abcdef0123456789abcdef")
+os.environ.setdefault("BOT_TOKEN", "123456:TEST")
+os.environ.setdefault("OWNER_ID", "1")
+os.environ.setdefault("LOG_CHANNEL_ID", "-1000000000001")
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")
+os.environ.setdefault("STREAM_DISK_CACHE_MB", "0")
+# Small enough for the burst tests to overflow it
+os.environ.setdefault("FILE_QUEUE_MAXSIZE", "100")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,104 @@
+import time
+import asyncio
+from types import SimpleNamespace
+
+import utility
+from handlers import user
+
+BURST = 500
+CHANNEL_ID = -1001234567890
+
+
+class EmptyCursor:
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        raise StopAsyncIteration
+
+
+class FakeFilesCol:
+    def find(self, *args, **kwargs):
+        return EmptyCursor()
+
+
+def channel_message(message_id):
+    document = SimpleNamespace(
+        file_name=f"Some.Release.{message_id}.2024.1080p.WEB-DL.mkv",
+        file_size=1024 * 1024,
+        mime_type="video/x-matroska",
+    )
+    return SimpleNamespace(
+        id=message_id,
+        chat=SimpleNamespace(id=CHANNEL_ID),
+        caption=None,
+        document=document,
+        video=None,
+        audio=None,
+        photo=None,
+    )
+
+
+def test_search_invalidation_is_coalesced(monkeypatch):
+    monkeypatch.setattr(utility, "SEARCH_INVALIDATE_DELAY", 0.05)
+    invalidations = []
+    monkeypatch.setattr(utility, "invalidate_search_cache", lambda: invalidations.append(time.monotonic()))
+
+    async def scenario():
+        for _ in range(BURST):
+            utility.schedule_search_cache_invalidation()
+        await asyncio.sleep(0.2)
+
+    asyncio.run(scenario())
+    assert len(invalidations) == 1
+
+
+def test_channel_burst(monkeypatch):
+    monkeypatch.setattr(utility, "SEARCH_INVALIDATE_DELAY", 0.05)
+    monkeypatch.setattr(utility, "PERSIST_FLUSH_MS", 10)
+    monkeypatch.setattr(utility, "files_col", FakeFilesCol())
+    monkeypatch.setattr(user, "is_channel_allowed", lambda channel_id: True)
+
+    invalidations = []
+    monkeypatch.setattr(utility, "invalidate_search_cache", lambda: invalidations.append(time.monotonic()))
+
+    persisted = []
+
+    async def bulk_upsert_file_info(file_infos):
+        persisted.extend(file_info["message_id"] for file_info in file_infos)
+        return {}
+
+    async def add(doc):
+        pass
+
+    monkeypatch.setattr(utility, "bulk_upsert_file_info", bulk_upsert_file_info)
+    monkeypatch.setattr(utility.search_backend, "add", add)
+
+    async def scenario():
+        workers = utility.start_file_workers(SimpleNamespace(loop=asyncio.get_running_loop()))
+        try:
+            latencies = []
+            for message_id in range(1, BURST + 1):
+                started = time.perf_counter()
+                await user.channel_file_handler(None, channel_message(message_id))
+                latencies.append(time.perf_counter() - started)
+            overflowed = utility.overflowed_files
+
+            await asyncio.wait_for(utility.file_queue.join(), timeout=30)
+            await asyncio.sleep(0.2)
+            return latencies, overflowed
+        finally:
+            for task in workers:
+                task.cancel()
+
+    latencies, overflowed = asyncio.run(scenario())
+
+    # The burst is bigger than the queue, so some posts waited in the overflow
+    # buffer instead of blocking the handler
+    assert overflowed > 0
+    assert max(latencies) < 0.05
+    assert sorted(persisted) == list(range(1, BURST + 1))
+    assert utility.get_queue_size() == 0
+    assert not utility.inflight_file_names
+    # One search cache invalidation for the whole burst
+    assert len(invalidations) == 1
@@ -0,0 +1,143 @@
+import base64
+
+import pytest
+from bson import ObjectId
+
+from utility import encode_cursor, decode_cursor, keyset_filter
+
+YEAR_DESC = [("year", -1), ("_id", -1)]
+YEAR_ASC = [("year", 1), ("_id", 1)]
+
+
+def rank(value):
+    # Mongo's order across the types `year` and `rating` hold: null < numbers < strings
+    if value is None:
+        return 0
+    return 1 if isinstance(value, (int, float)) else 2
+
+
+def mongo_sorted(docs, sort_order):
+    result = list(docs)
+    # Stable sorts, least significant key first
+    for field, direction in reversed(sort_order):
+        result.sort(key=lambda doc: (rank(doc.get(field)), doc.get(field) or 0), reverse=direction == -1)
+    return result
+
+
+def compare(value, op, operand):
+    # Comparison operators only match values in the operand's type bracket
+    if value is None or rank(value) != rank(operand):
+        return False
+    return value < operand if op == "$lt" else value > operand
+
+
+def matches(doc, query):
+    """The subset of the Mongo query language keyset_filter produces."""
+    if "$or" in query:
+        return any(matches(doc, clause) for clause in query["$or"])
+    for field, condition in query.items():
+        value = doc.get(field)
+        if isinstance(condition, dict):
+            if "$exists" in condition:
+                if (field in doc) != condition["$exists"]:
+                    return False
+            elif "$type" in condition:
+                if value is None or rank(value) != {"number": 1, "string": 2}[condition["$type"]]:
+                    return False
+            else:
+                (op, operand), = condition.items()
+                if not compare(value, op, operand):
+                    return False
+        elif value != condition:
+            return False
+    return True
+
+
+def test_keyset_filter_int_descending():
+    assert keyset_filter(YEAR_DESC, [2020, 5]) == {"$or": [
+        {"year": {"$lt": 2020}},
+        {"year": None},
+        {"year": 2020, "_id": {"$lt": 5}},
+    ]}
+
+
+def test_keyset_filter_int_ascending():
+    assert keyset_filter(YEAR_ASC, [2020, 5]) == {"$or": [
+        {"year": {"$gt": 2020}},
+        {"year": {"$type": "string"}},
+        {"year": 2020, "_id": {"$gt": 5}},
+    ]}
+
+
+def test_keyset_filter_str():
+    assert keyset_filter(YEAR_DESC, ["2020-2021", 5]) == {"$or": [
+        {"year": {"$lt": "2020-2021"}},
+        {"year": None},
+        {"year": {"$type": "number"}},
+        {"year": "2020-2021", "_id": {"$lt": 5}},
+    ]}
+    assert keyset_filter(YEAR_ASC, ["2020-2021", 5]) == {"$or": [
+        {"year": {"$gt": "2020-2021"}},
+        {"year": "2020-2021", "_id": {"$gt": 5}},
+    ]}
+
+
+def test_keyset_filter_none():
+    # Nothing sorts below null, so descending only continues within the nulls
+    assert keyset_filter(YEAR_DESC, [None, 5]) == {"$or": [
+        {"year": None, "_id": {"$lt": 5}},
+    ]}
+    assert keyset_filter(YEAR_ASC, [None, 5]) == {"$or": [
+        {"year": {"$type": "number"}},
+        {"year": {"$type": "string"}},
+        {"year": None, "_id": {"$gt": 5}},
+    ]}
+
+
+@pytest.mark.parametrize("sort_order", [YEAR_DESC, YEAR_ASC, [("rating", -1), ("_id", -1)]])
+def test_keyset_pages_cover_mixed_types_in_order(sort_order):
+    field = sort_order[0][0]
+    values = [None, 1999, 2020, 2020, 7.5, "2019-2020", "2021", None, 2020, "2021"]
+    docs = [{"_id": i, field: value} for i, value in enumerate(values)]
+    expected = mongo_sorted(docs, sort_order)
+
+    # Walk the collection one document at a time, as a page size of 1 would
+    seen = [expected[0]]
+    while len(seen) < len(docs):
+        last = seen[-1]
+        after = keyset_filter(sort_order, [last.get(f) for f, _ in sort_order])
+        remaining = mongo_sorted([doc for doc in docs if matches(doc, after)], sort_order)
+        assert remaining, f"keyset after {last} lost documents"
+        seen.append(remaining[0])
+    assert seen == expected
+
+    last = expected[-1]
+    after = keyset_filter(sort_order, [last.get(f) for f, _ in sort_order])
+    assert not [doc for doc in docs if matches(doc, after)]
+
+
+def test_keyset_filter_rejects_wrong_length():
+    with pytest.raises(ValueError):
+        keyset_filter(YEAR_DESC, [2020])
+
+
+def test_cursor_round_trip_with_object_id():
+    values = [2020, ObjectId("65f0c0ffee0000000000abcd")]
+    token = encode_cursor(values)
+    assert "=" not in token
+    assert decode_cursor(token) == values
+    for values in ([None, ObjectId()], ["2019-2020", ObjectId()], [7.5, ObjectId()], [40]):
+        assert decode_cursor(encode_cursor(values)) == values
+
+
+@pytest.mark.parametrize("token", [
+    "not a cursor!",
+    "@@@@",
+    base64.urlsafe_b64encode(b"{not json").decode(),
+    # Valid JSON, but not a list of sort values
+    base64.urlsafe_b64encode(b'{"year": 2020}').decode().rstrip("="),
+    base64.urlsafe_b64encode(b"\xff\xfe").decode(),
+])
+def test_decode_cursor_rejects_malformed_tokens(token):
+    with pytest.raises(ValueError):
+        decode_cursor(token)
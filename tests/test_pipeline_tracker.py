@@ -0,0 +1,47 @@
+import asyncio
+
+from utility import PipelineTracker
+
+
+def test_checkpoint_waits_for_every_file_of_a_batch():
+    tracker = PipelineTracker()
+    first = [tracker.track(100) for _ in range(2)]
+    tracker.seal(100)
+    second = tracker.track(200)
+    tracker.seal(200)
+    assert tracker.persisted_through is None
+
+    # A later batch finishing first does not move the checkpoint past an earlier one
+    second()
+    assert tracker.persisted_through is None
+    first[0]()
+    assert tracker.persisted_through is None
+    first[1]()
+    assert tracker.persisted_through == 200
+    assert tracker.unfinished() == []
+
+
+def test_empty_batches_and_unsealed_batches():
+    tracker = PipelineTracker()
+    tracker.seal(100)
+    assert tracker.persisted_through == 100
+
+    done = tracker.track(200)
+    done()
+    # More files may still be tracked for 200 until it is sealed
+    assert tracker.persisted_through == 100
+    tracker.seal(200)
+    assert tracker.persisted_through == 200
+
+
+def test_failed_batch_holds_the_checkpoint():
+    tracker = PipelineTracker()
+    tracker.track(100)(False)
+    tracker.seal(100)
+    tracker.track(200)()
+    tracker.seal(200)
+
+    assert tracker.failed
+    assert tracker.persisted_through is None
+    assert tracker.unfinished() == [100, 200]
+    asyncio.run(asyncio.wait_for(tracker.drained(), 1))
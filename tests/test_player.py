@@ -0,0 +1,142 @@
+import asyncio
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+import fast_api
+import streamer
+from app import bot
+from config import LOG_CHANNEL_ID
+from streamer import CHUNK_SIZE, parse_range
+
+MESSAGE_ID = 7
+# Two and a half chunks, so ranges can start, end and cross inside chunks
+SIZE = CHUNK_SIZE * 2 + CHUNK_SIZE // 2
+DATA = bytes(i % 251 for i in range(SIZE))
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    with open(os.path.join(tmp_path, f"{LOG_CHANNEL_ID}_{MESSAGE_ID}"), "wb") as f:
+        f.write(DATA)
+    # What STREAM_LOCAL_DIR selects at import time
+    monkeypatch.setattr(fast_api, "media_streamer", streamer.create_media_streamer(local_dir=str(tmp_path)))
+    with TestClient(fast_api.api) as test_client:
+        yield test_client
+
+
+def player_url(channel_id=LOG_CHANNEL_ID, message_id=MESSAGE_ID):
+    return f"/player/{bot.encode_file_link(channel_id, message_id)}"
+
+
+def test_full_file(client):
+    resp = client.get(player_url())
+    assert resp.status_code == 200
+    assert resp.headers["accept-ranges"] == "bytes"
+    assert resp.headers["content-length"] == str(SIZE)
+    assert "content-range" not in resp.headers
+    assert resp.content == DATA
+
+
+@pytest.mark.parametrize("header, start, end", [
+    ("bytes=0-99", 0, 99),
+    # Crossing the first chunk boundary
+    (f"bytes={CHUNK_SIZE - 10}-{CHUNK_SIZE + 9}", CHUNK_SIZE - 10, CHUNK_SIZE + 9),
+    # Exactly the second chunk
+    (f"bytes={CHUNK_SIZE}-{2 * CHUNK_SIZE - 1}", CHUNK_SIZE, 2 * CHUNK_SIZE - 1),
+    # Open-ended, from inside the second chunk to the end
+    (f"bytes={CHUNK_SIZE + 1}-", CHUNK_SIZE + 1, SIZE - 1),
+    # The end is clamped to the file size
+    (f"bytes={SIZE - 5}-{SIZE + 100}", SIZE - 5, SIZE - 1),
+    # Suffix ranges: the last N bytes, or the whole file when N exceeds it
+    ("bytes=-500", SIZE - 500, SIZE - 1),
+    (f"bytes=-{SIZE * 2}", 0, SIZE - 1),
+])
+def test_ranges(client, header, start, end):
+    resp = client.get(player_url(), headers={"Range": header})
+    assert resp.status_code == 206
+    assert resp.headers["content-range"] == f"bytes {start}-{end}/{SIZE}"
+    assert resp.headers["content-length"] == str(end - start + 1)
+    assert resp.content == DATA[start:end + 1]
+
+
+@pytest.mark.parametrize("header", [f"bytes={SIZE}-", f"bytes={SIZE + 10}-{SIZE + 20}", "bytes=-0"])
+def test_unsatisfiable_range(client, header):
+    resp = client.get(player_url(), headers={"Range": header})
+    assert resp.status_code == 416
+    assert resp.headers["content-range"] == f"bytes */{SIZE}"
+
+
+def test_head(client):
+    resp = client.head(player_url())
+    assert resp.status_code == 200
+    assert resp.headers["content-length"] == str(SIZE)
+    assert resp.content == b""
+
+    resp = client.head(player_url(), headers={"Range": "bytes=10-19"})
+    assert resp.status_code == 206
+    assert resp.headers["content-range"] == f"bytes 10-19/{SIZE}"
+    assert resp.headers["content-length"] == "10"
+    assert resp.content == b""
+
+
+def test_tampered_signature(client):
+    payload, _, signature = bot.encode_file_link(LOG_CHANNEL_ID, MESSAGE_ID).partition(".")
+    forged = signature[:-1] + ("A" if signature[-1] != "A" else "B")
+    assert client.get(f"/player/{payload}.{forged}").status_code == 404
+    assert client.get(f"/player/{payload}").status_code == 404
+
+
+def test_missing_file_and_disallowed_channel(client):
+    assert client.get(player_url(message_id=MESSAGE_ID + 1)).status_code == 404
+    assert client.get(player_url(channel_id=-1009999999999)).status_code == 404
+
+
+def test_parse_range():
+    assert parse_range(None, 100) is None
+    assert parse_range("items=0-10", 100) is None
+    # Multiple ranges and malformed numbers fall back to the whole file
+    assert parse_range("bytes=0-1,5-6", 100) is None
+    assert parse_range("bytes=a-b", 100) is None
+    assert parse_range("bytes=10-20", 100) == (10, 20)
+    assert parse_range("bytes=10-", 100) == (10, 99)
+    assert parse_range("bytes=90-200", 100) == (90, 99)
+    assert parse_range("bytes=-10", 100) == (90, 99)
+    assert parse_range("bytes=-200", 100) == (0, 99)
+    for header in ("bytes=100-", "bytes=20-10", "bytes=-0"):
+        with pytest.raises(ValueError):
+            parse_range(header, 100)
+
+
+class MemorySource:
+    def __init__(self, data, chunk_size):
+        self.data = data
+        self.chunk_size = chunk_size
+        self.reads = []
+
+    async def read_chunk(self, channel_id, message_id, index):
+        self.reads.append(index)
+        return self.data[index * self.chunk_size:(index + 1) * self.chunk_size]
+
+
+@pytest.mark.parametrize("start, end, chunks", [
+    (0, 99, list(range(10))),
+    (0, 9, [0]),
+    (9, 10, [0, 1]),
+    (10, 19, [1]),
+    (15, 15, [1]),
+    (23, 61, [2, 3, 4, 5, 6]),
+    (95, 99, [9]),
+])
+def test_iter_range_slices_at_chunk_boundaries(start, end, chunks):
+    source = MemorySource(DATA[:100], chunk_size=10)
+    media = streamer.MediaStreamer(source, chunk_size=10, read_ahead=0)
+
+    async def read():
+        return [part async for part in media.iter_range(1, 2, start, end)]
+
+    parts = asyncio.run(read())
+    assert b"".join(parts) == DATA[start:end + 1]
+    assert source.reads == chunks
+    assert len(parts) == len(chunks)
@@ -0,0 +1,33 @@
+import asyncio
+
+import tmdb
+
+
+def test_get_info_returns_error_on_timeout(monkeypatch):
+    async def get_json(url, upstream, params=None):
+        raise asyncio.TimeoutError()
+
+    monkeypatch.setattr(tmdb.http_client, "get_json", get_json)
+
+    info = asyncio.run(tmdb.get_info("movie", 1, use_cache=False))
+    assert info["poster_url"] is None
+    assert info["message"].startswith("Error")
+
+
+def test_get_info_caches_briefly_without_imdb_details(monkeypatch):
+    async def get_json(url, upstream, params=None):
+        if upstream == "imdb":
+            return 503, None
+        return 200, {"id": 1, "title": "Movie", "imdb_id": "tt0000001", "overview": "Plot."}
+
+    stored = []
+
+    async def cache_store(key, value, ttl=None):
+        stored.append(ttl)
+
+    monkeypatch.setattr(tmdb.http_client, "get_json", get_json)
+    monkeypatch.setattr(tmdb, "cache_store", cache_store)
+
+    info = asyncio.run(tmdb.get_info("movie", 1, use_cache=False))
+    assert info["title"] == "Movie"
+    assert stored == [tmdb.TMDB_NEGATIVE_CACHE_TTL]
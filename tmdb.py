@@ -1,9 +1,52 @@
 import re
+import asyncio
 import aiohttp
-from config import TMDB_API_KEY, logger
+from datetime import datetime, timezone, timedelta
+from config import TMDB_API_KEY, TMDB_CACHE_TTL, TMDB_NEGATIVE_CACHE_TTL, logger
+from db import tmdb_cache_col
+from http_client import http_client
 
 POSTER_BASE_URL = 'https://image.tmdb.org/t/p/original'
 
+# =========================
+# Persistent response cache
+# =========================
+# Entries live in tmdb_cache_col as {_id: key, value, expires_at}. A value of
+# None is a negative entry ("not found") and uses the shorter negative TTL.
+# Mongo drops expired entries through the TTL index in db.INDEX_MANIFEST.
+
+def search_cache_key(kind, title, year=None):
+    title = ' '.join(str(title).lower().split())
+    return f"search:{kind}:{title}:{year or ''}"
+
+def info_cache_key(tmdb_type, tmdb_id):
+    return f"info:{tmdb_type}:{tmdb_id}"
+
+async def cache_lookup(key):
+    """Returns (hit, value) for a cached response."""
+    try:
+        doc = await tmdb_cache_col.find_one(
+            {"_id": key, "expires_at": {"$gt": datetime.now(timezone.utc)}}
+        )
+    except Exception as e:
+        logger.error(f"TMDB cache lookup failed for {key}: {e}")
+        return False, None
+    if doc is None:
+        return False, None
+    return True, doc.get("value")
+
+async def cache_store(key, value, ttl=None):
+    if ttl is None:
+        ttl = TMDB_CACHE_TTL if value is not None else TMDB_NEGATIVE_CACHE_TTL
+    try:
+        await tmdb_cache_col.update_one(
+            {"_id": key},
+            {"$set": {"value": value, "expires_at": datetime.now(timezone.utc) + timedelta(seconds=ttl)}},
+            upsert=True
+        )
+    except Exception as e:
+        logger.error(f"TMDB cache store failed for {key}: {e}")
+
 async def get_imdb_details(imdb_id):
     """
     Fetch rating and plot using IMDb ID.
@@ -11,39 +54,39 @@ async def get_imdb_details(imdb_id):
     if not imdb_id:
         return {}
     try:
-        url = f"https://imdb.iamidiotareyoutoo.com/search?tt={imdb_id}"
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as resp:
-                if resp.status != 200:
-                    logger.warning(f"IMDB returned error for {imdb_id}: {data.get('Error')}")
-                    return {}
-                data = await resp.json()
-                return{
-                    "name": data.get("short").get("name"),
-                    "rating": data.get("short").get("aggregateRating").get("ratingValue"),
-                    "year": data.get("top").get("releaseYear").get("year"),
-                    "plot": data.get("short").get("description")
-                }
-            
+        url = "https://imdb.iamidiotareyoutoo.com/search"
+        status, data = await http_client.get_json(url, "imdb", params={"tt": imdb_id})
+        if status != 200 or not data:
+            logger.warning(f"IMDB returned error for {imdb_id}: {status}")
+            return {}
+        return{
+            "name": data.get("short").get("name"),
+            "rating": data.get("short").get("aggregateRating").get("ratingValue"),
+            "year": data.get("top").get("releaseYear").get("year"),
+            "plot": data.get("short").get("description")
+        }
+
     except Exception as e:
         logger.error(f"IMDb API error: {e}")
         return {}
     
-def get_cast_and_crew(tmdb_type, movie_id):
+def get_cast_and_crew(data):
     """
-    Fetches the cast and crew details (starring actors and director) for a movie or TV show.
+    Extracts the cast and crew details (starring actors and director) from the
+    `credits` appended to a movie or TV show details response.
     """
-    import requests
-    cast_crew_url = f'https://api.themoviedb.org/3/{tmdb_type}/{movie_id}/credits?api_key={TMDB_API_KEY}&language=en-US'
-    response = requests.get(cast_crew_url)
-    cast_crew_data = response.json()
+    cast_crew_data = data.get('credits') or {}
 
     starring = [member['name'] for member in cast_crew_data.get('cast', [])[:5]]
     director = next((member['name'] for member in cast_crew_data.get('crew', []) if member['job'] == 'Director'), "")
     return {"starring": starring, "director": director}
 
 async def format_tmdb_info(tmdb_type, movie_id, data):
-    cast_crew = get_cast_and_crew(tmdb_type, movie_id)
+    """
+    Returns (message, title, rating, year, plot, imdb_id, imdb_ok); imdb_ok is
+    False when the title has an IMDb id but its details could not be fetched.
+    """
+    cast_crew = get_cast_and_crew(data)
 
     if tmdb_type == 'movie':
         imdb_id = data.get('imdb_id')
@@ -77,10 +120,10 @@ async def format_tmdb_info(tmdb_type, movie_id, data):
         message += f"<b>🎬 Director:</b> {director}\n" if director else ""
         message += f"<b>🎭 Stars:</b> {starring}\n" if starring else ""
 
-        return message.strip(), title, rating, release_year, plot, imdb_id
+        return message.strip(), title, rating, release_year, plot, imdb_id, bool(imdb_info) or not imdb_id
 
     elif tmdb_type == 'tv':
-        imdb_id = get_tv_imdb_id_sync(movie_id)
+        imdb_id = (data.get('external_ids') or {}).get('imdb_id')
         imdb_info = await get_imdb_details(imdb_id) if imdb_id else {}
 
         title = imdb_info.get('name') or data.get('name')
@@ -111,51 +154,55 @@ async def format_tmdb_info(tmdb_type, movie_id, data):
         message += f"<b>🎬 Director:</b> {director}\n" if director else ""
         message += f"<b>🎭 Stars:</b> {starring}\n" if starring else ""
 
-        return message.strip(), title, rating, release_year, plot, imdb_id
+        return message.strip(), title, rating, release_year, plot, imdb_id, bool(imdb_info) or not imdb_id
     else:
         return "Unknown type. Unable to format information."
     
 
-def get_tv_imdb_id_sync(tv_id):
-    import requests
-    url = f"https://api.themoviedb.org/3/tv/{tv_id}/external_ids?api_key={TMDB_API_KEY}"
-    resp = requests.get(url)
-    data = resp.json()
-    return data.get("imdb_id")
+async def get_info(tmdb_type, tmdb_id, use_cache=True):
+    cache_key = info_cache_key(tmdb_type, tmdb_id)
+    if use_cache:
+        hit, cached = await cache_lookup(cache_key)
+        if hit and cached is not None:
+            return cached
 
-async def get_info(tmdb_type, tmdb_id):
-    api_url = f"https://api.themoviedb.org/3/{tmdb_type}/{tmdb_id}?api_key={TMDB_API_KEY}&language=en-US"
-    image_url = f'https://api.themoviedb.org/3/{tmdb_type}/{tmdb_id}/images?api_key={TMDB_API_KEY}&language=en-US&include_image_language=en,hi'
+    # One request for details, images, videos, credits and external ids
+    api_url = f"https://api.themoviedb.org/3/{tmdb_type}/{tmdb_id}"
+    params = {
+        "api_key": TMDB_API_KEY,
+        "language": "en-US",
+        "include_image_language": "en,hi",
+        "append_to_response": "images,videos,credits,external_ids",
+    }
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(api_url) as detail_response:
-                data = await detail_response.json()
-                async with session.get(image_url) as movie_response:
-                    images = await movie_response.json()
-                message, title, rating, release_year, plot, imdb_id = await format_tmdb_info(tmdb_type, tmdb_id, data)
-
-                poster_path = data.get('poster_path', None)
-                if 'backdrops' in images and images['backdrops']:
-                    backdrop_path = images['backdrops'][0]['file_path']
-                else:
-                    backdrop_path = None
-                path = backdrop_path or poster_path
-                poster_url = f"https://image.tmdb.org/t/p/original{path}" if path else None
-
-                video_url = f'https://api.themoviedb.org/3/{tmdb_type}/{tmdb_id}/videos?api_key={TMDB_API_KEY}'
-                async with session.get(video_url) as video_response:
-                    video_data = await video_response.json()
-                    trailer_url = None
-                    for video in video_data.get('results', []):
-                        if video['site'] == 'YouTube' and video['type'] == 'Trailer':
-                            trailer_url = f"https://www.youtube.com/watch?v={video['key']}"
-                            break
-
-                return {"message": message, "poster_url": poster_url, "poster_path": poster_path, 
-                        "title": title, "rating": rating, "year": release_year, "plot": plot, "trailer_url": trailer_url, "imdb_id": imdb_id}
-    except aiohttp.ClientError as e:
-        logger.error(f"Error fetching TMDB data: {e}")
-    return {"message": f"Error: {str(e)}", "poster_url": None, "poster_path": None}
+        status, data = await http_client.get_json(api_url, "tmdb", params=params)
+        data = data or {}
+        images = data.get('images') or {}
+        message, title, rating, release_year, plot, imdb_id, imdb_ok = await format_tmdb_info(tmdb_type, tmdb_id, data)
+
+        poster_path = data.get('poster_path', None)
+        if 'backdrops' in images and images['backdrops']:
+            backdrop_path = images['backdrops'][0]['file_path']
+        else:
+            backdrop_path = None
+        path = backdrop_path or poster_path
+        poster_url = f"https://image.tmdb.org/t/p/original{path}" if path else None
+
+        trailer_url = None
+        for video in (data.get('videos') or {}).get('results', []):
+            if video['site'] == 'YouTube' and video['type'] == 'Trailer':
+                trailer_url = f"https://www.youtube.com/watch?v={video['key']}"
+                break
+
+        info = {"message": message, "poster_url": poster_url, "poster_path": poster_path, 
+                "title": title, "rating": rating, "year": release_year, "plot": plot, "trailer_url": trailer_url, "imdb_id": imdb_id}
+        if status == 200:
+            # Without the IMDb details, keep the entry only briefly so they are retried
+            await cache_store(cache_key, info, ttl=None if imdb_ok else TMDB_NEGATIVE_CACHE_TTL)
+        return info
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logger.error(f"Error fetching TMDB data: {e!r}")
+        return {"message": f"Error: {str(e)}", "poster_url": None, "poster_path": None}
 
 def truncate_overview(overview):
     """
@@ -173,51 +220,65 @@ def truncate_overview(overview):
     return overview
 
 async def get_movie_id(movie_name, release_year=None):
-    tmdb_search_url = f'https://api.themoviedb.org/3/search/movie?api_key={TMDB_API_KEY}&query={movie_name}'
+    cache_key = search_cache_key("movie", movie_name, release_year)
+    hit, cached = await cache_lookup(cache_key)
+    if hit:
+        return cached
+
+    tmdb_search_url = 'https://api.themoviedb.org/3/search/movie'
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(tmdb_search_url) as search_response:
-                search_data = await search_response.json()
-                if search_data.get('results'):
-                    results = search_data['results']
-                    if release_year:
-                        # Filter by release year if provided
-                        results = [
-                            result for result in results
-                            if 'release_date' in result and result['release_date'] and result['release_date'][:4] == str(release_year)
-                        ]
-                    if results:
-                        result = results[0]
-                        return {
-                            "id": result['id'],
-                            "media_type": "movie"
-                        }
-        return None
+        status, search_data = await http_client.get_json(
+            tmdb_search_url, "tmdb", params={"api_key": TMDB_API_KEY, "query": movie_name}
+        )
+        result = None
+        if search_data and search_data.get('results'):
+            results = search_data['results']
+            if release_year:
+                # Filter by release year if provided
+                results = [
+                    result for result in results
+                    if 'release_date' in result and result['release_date'] and result['release_date'][:4] == str(release_year)
+                ]
+            if results:
+                result = {
+                    "id": results[0]['id'],
+                    "media_type": "movie"
+                }
+        if status == 200:
+            await cache_store(cache_key, result)
+        return result
     except Exception as e:
         logger.error(f"Error fetching TMDb movie by name: {e}")
         return
 
 async def get_tv_id(tv_name, first_air_year=None):
-    tmdb_search_url = f'https://api.themoviedb.org/3/search/tv?api_key={TMDB_API_KEY}&query={tv_name}'
+    cache_key = search_cache_key("tv", tv_name, first_air_year)
+    hit, cached = await cache_lookup(cache_key)
+    if hit:
+        return cached
+
+    tmdb_search_url = 'https://api.themoviedb.org/3/search/tv'
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(tmdb_search_url) as search_response:
-                search_data = await search_response.json()
-                if search_data.get('results'):
-                    results = search_data['results']
-                    if first_air_year:
-                        # Filter by first air year if provided
-                        results = [
-                            result for result in results
-                            if 'first_air_date' in result and result['first_air_date'] and result['first_air_date'][:4] == str(first_air_year)
-                        ]
-                    if results:
-                        result = results[0]
-                        return {
-                            "id": result['id'],
-                            "media_type": "tv"
-                        }
-        return None
+        status, search_data = await http_client.get_json(
+            tmdb_search_url, "tmdb", params={"api_key": TMDB_API_KEY, "query": tv_name}
+        )
+        result = None
+        if search_data and search_data.get('results'):
+            results = search_data['results']
+            if first_air_year:
+                # Filter by first air year if provided
+                results = [
+                    result for result in results
+                    if 'first_air_date' in result and result['first_air_date'] and result['first_air_date'][:4] == str(first_air_year)
+                ]
+            if results:
+                result = {
+                    "id": results[0]['id'],
+                    "media_type": "tv"
+                }
+        if status == 200:
+            await cache_store(cache_key, result)
+        return result
     except Exception as e:
         logger.error(f"Error fetching TMDb TV by name: {e}")
         return
@@ -264,7 +325,5 @@ def format_duration(duration):
     
 async def get_tv_imdb_id(tv_id):
     url = f"https://api.themoviedb.org/3/tv/{tv_id}/external_ids?api_key={TMDB_API_KEY}"
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url) as resp:
-            data = await resp.json()
-            return data.get("imdb_id")
+    _, data = await http_client.get_json(url, "tmdb")
+    return (data or {}).get("imdb_id")
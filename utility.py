@@ -1,18 +1,21 @@
 
+import io
 import re
-import aiohttp
 import asyncio
 import base64
 import uuid
 import time
 import PTN
-import os
 import logging
+from collections import deque, Counter
+from bson import json_util
 from datetime import datetime, timezone, timedelta
 from pyrogram.errors import (FloodWait, UserNotParticipant, UserIsBlocked,
                               InputUserDeactivated, PeerIdInvalid, UserIsBot, 
                               ChatAdminRequired)
 from pyrogram import enums
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
 from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton, User
 from db import (
     allowed_channels_col,
@@ -20,10 +23,17 @@ from db import (
     tokens_col,
     auth_users_col,
     files_col,
-    tmdb_col
+    tmdb_col,
+    checkpoints_col
 )
 from config import *
+from cache import auth_cache, count_cache, search_cache, tmdb_title_memo, tmdb_stored, user_name_cache, user_name_failures
 from tmdb import get_movie_id, get_tv_id, get_info
+from search_engine import search_backend
+from http_client import http_client
+from normalize import clean_file_name, strip_extension, keep_up_to_extension, strip_uploader_tags
+from ratelimit import TokenBucket
+from scheduler import with_priority, DEFAULT, BULK
 from mutagen.mp3 import MP3
 from mutagen.flac import FLAC
 from mutagen.mp4 import MP4
@@ -36,112 +46,135 @@ from mutagen import File as MutagenFile
 
 TOKEN_VALIDITY_SECONDS = 24 * 60 * 60  # 24 hours
 AUTO_DELETE_SECONDS = 2 * 60
-
-# Simple in-memory cache: {(q, channel_id): (timestamp, results)}
-search_api_cache = {}
-CACHE_TTL = 300  # 5 minutes
+USER_NAME_REFRESH_SECONDS = 24 * 60 * 60
+# Telegram file parts; stream_media offsets count these
+MEDIA_CHUNK_SIZE = 1024 * 1024
+# Give up on embedded covers that would need more than this many chunks
+AUDIO_COVER_MAX_CHUNKS = 8
 
 logger = logging.getLogger(__name__)
 
-def get_cache_key(q, channel_id):
-    return (q.strip().lower(), channel_id)
-
-# CACHE FOR SEARCH RESULTS
-search_cache = {}
-SEARCH_CACHE_TTL = 300  # seconds (5 minutes)
-
-def make_search_cache_key(query, page, channel_id=None):
-    return (query.lower(), page, channel_id)
-
-def get_cached_search(query, page, channel_id=None):
-    key = make_search_cache_key(query, page, channel_id)
-    entry = search_cache.get(key)
-    if entry and (time.time() - entry['time'] < SEARCH_CACHE_TTL):
-        return entry['files'], entry['total_files']
-    if entry:
-        del search_cache[key]
-    return None, None
-
-def set_cached_search(query, page, channel_id, files, total_files):
-    key = make_search_cache_key(query, page, channel_id)
-    search_cache[key] = {
-        'files': files,
-        'total_files': total_files,
-        'time': time.time()
-    }
-
 def invalidate_search_cache():
-    search_cache.clear()
-    search_api_cache.clear()
-
-def build_search_pipeline(query, match_query, skip, limit):
-    # Split the query string into words
-    terms = query.strip().lower().split()
-
-    # Create a separate `text` clause for each term
-    must_clauses = [
-        {
-            "text": {
-                "query": term,
-                "path": "file_name"
-            }
-        }
-        for term in terms
-    ]
+    """Invalidate cached search/listing results by bumping the cache generation."""
+    search_cache.invalidate()
+    count_cache.invalidate()
+
+# Debounced invalidation for the ingest path: a burst of persisted files
+# results in one invalidation SEARCH_INVALIDATE_DELAY seconds after the last
+# one, but never later than SEARCH_INVALIDATE_MAX_DELAY after the first.
+SEARCH_INVALIDATE_DELAY = 2
+SEARCH_INVALIDATE_MAX_DELAY = 10
+_invalidate_handle = None
+_invalidate_first_request = 0.0
+
+def _run_scheduled_invalidation():
+    global _invalidate_handle
+    _invalidate_handle = None
+    invalidate_search_cache()
+
+def schedule_search_cache_invalidation():
+    """Request a coalesced invalidate_search_cache() on the running loop."""
+    global _invalidate_handle, _invalidate_first_request
+    loop = asyncio.get_running_loop()
+    now = loop.time()
+    if _invalidate_handle is None:
+        _invalidate_first_request = now
+    elif now - _invalidate_first_request < SEARCH_INVALIDATE_MAX_DELAY:
+        _invalidate_handle.cancel()
+    else:
+        return
+    _invalidate_handle = loop.call_later(SEARCH_INVALIDATE_DELAY, _run_scheduled_invalidation)
 
-    # Build search stage with compound.must
-    search_stage = {
-        "$search": {
-            "index": "default",
-            "compound": {
-                "must": must_clauses
-            }
-        }
-    }
+# =========================
+# Pagination Utilities
+# =========================
 
-    # Match allowed channel IDs
-    match_stage = {
-        "$match": match_query
-    }
+def encode_cursor(values):
+    """Encode the sort key of the last document on a page as an opaque token."""
+    raw = json_util.dumps(values).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
 
-    # Project only necessary fields and search score
-    project_stage = {
-        "$project": {
-            "_id": 1,
-            "file_name": 1,
-            "file_size": 1,
-            "file_format": 1,
-            "message_id": 1,
-            "channel_id": 1,
-            "poster_url": 1,
-            "score": {"$meta": "searchScore"}
-        }
-    }
-
-    # Sort results by score and then file name
-    sort_stage = {
-        "$sort": {
-            "score": -1,
-            "_id": -1
-        }
-    }
+def decode_cursor(token):
+    """Decode a token from encode_cursor. Raises ValueError if it is malformed."""
+    try:
+        padding = '=' * (-len(token) % 4)
+        values = json_util.loads(base64.urlsafe_b64decode(token + padding).decode())
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list):
+        raise ValueError("Invalid cursor")
+    return values
+
+def _bson_rank(value):
+    # Mongo sorts mixed types as null < numbers < strings; `year` and `rating`
+    # hold all three, so a keyset has to step across type brackets too.
+    if value is None:
+        return 0
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return 1
+    if isinstance(value, str):
+        return 2
+    return None
 
-    # Facet: paginated results and total count
-    facet_stage = {
-        "$facet": {
-            "results": [
-                project_stage,
-                sort_stage,
-                {"$skip": skip},
-                {"$limit": limit}
-            ],
-            "totalCount": [
-                {"$count": "total"}
-            ]
-        }
-    }
+_RANK_CLAUSES = [
+    lambda field: {field: None},
+    lambda field: {field: {"$type": "number"}},
+    lambda field: {field: {"$type": "string"}},
+]
 
-    return [search_stage, match_stage, facet_stage]
+def keyset_filter(sort_order, last_values):
+    """
+    Build a filter matching documents that sort strictly after `last_values`
+    for the given sort order, e.g. [("year", -1), ("_id", -1)].
+    """
+    if len(last_values) != len(sort_order):
+        raise ValueError("Invalid cursor")
+    clauses = []
+    for i, ((field, direction), value) in enumerate(zip(sort_order, last_values)):
+        equal_prefix = {f: v for (f, _), v in zip(sort_order[:i], last_values[:i])}
+        op = "$lt" if direction == -1 else "$gt"
+        if value is not None:
+            clauses.append({**equal_prefix, field: {op: value}})
+        rank = _bson_rank(value)
+        if field != "_id" and rank is not None:
+            later_ranks = range(rank) if direction == -1 else range(rank + 1, len(_RANK_CLAUSES))
+            for r in later_ranks:
+                clauses.append({**equal_prefix, **_RANK_CLAUSES[r](field)})
+    return {"$or": clauses} if clauses else {"_id": {"$exists": False}}
+
+async def fetch_page(col, query, sort_order, page_size, skip=0, cursor=None):
+    """
+    Fetch one page of `col`. With `cursor=None` this pages with skip/limit;
+    otherwise it pages by keyset ("" for the first page) and also returns the
+    token for the next page, or None when there are no more documents.
+    """
+    if cursor is None:
+        docs = await col.find(query).sort(sort_order).skip(skip).limit(page_size).to_list(None)
+        return docs, None
+
+    find_query = query
+    if cursor:
+        after = keyset_filter(sort_order, decode_cursor(cursor))
+        find_query = {"$and": [query, after]} if query else after
+
+    docs = await col.find(find_query).sort(sort_order).limit(page_size + 1).to_list(None)
+    next_cursor = None
+    if len(docs) > page_size:
+        docs = docs[:page_size]
+        next_cursor = encode_cursor([docs[-1].get(field) for field, _ in sort_order])
+    return docs, next_cursor
+
+async def cached_count(col, query):
+    """Count documents matching `query`, cached briefly per collection and filter."""
+    key = (col.name, json_util.dumps(query, sort_keys=True))
+    total = count_cache.get(key)
+    if total is None:
+        if query:
+            total = await col.count_documents(query)
+        else:
+            total = await col.estimated_document_count()
+        count_cache.set(key, total)
+    return total
 
 # =========================
 # Channel & User Utilities
@@ -150,59 +183,119 @@ def build_search_pipeline(query, match_query, skip, limit):
 async def get_allowed_channels():
     return [
         doc["channel_id"]
-        for doc in allowed_channels_col.find({}, {"_id": 0, "channel_id": 1})
+        async for doc in allowed_channels_col.find({}, {"_id": 0, "channel_id": 1})
     ]
 
-def add_user(user_id):
+# In-memory copy of allowed_channels_col, replaced as a whole on every change
+allowed_channel_ids = frozenset()
+
+def is_channel_allowed(channel_id):
+    return channel_id in allowed_channel_ids
+
+async def load_allowed_channels():
+    global allowed_channel_ids
+    allowed_channel_ids = frozenset(await get_allowed_channels())
+    return allowed_channel_ids
+
+async def add_allowed_channel(channel_id, channel_name):
+    global allowed_channel_ids
+    await allowed_channels_col.update_one(
+        {"channel_id": channel_id},
+        {"$set": {"channel_id": channel_id, "channel_name": channel_name}},
+        upsert=True
+    )
+    allowed_channel_ids = allowed_channel_ids | {channel_id}
+
+async def remove_allowed_channel(channel_id):
+    """Returns True if the channel was in allowed_channels_col."""
+    global allowed_channel_ids
+    result = await allowed_channels_col.delete_one({"channel_id": channel_id})
+    allowed_channel_ids = allowed_channel_ids - {channel_id}
+    return bool(result.deleted_count)
+
+async def refresh_allowed_channels(interval):
+    """Periodically reload the set so changes made by other instances are picked up."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await load_allowed_channels()
+        except Exception as e:
+            logger.error(f"Error refreshing allowed channels: {e}")
+
+async def build_search_index(retry_delay=60):
+    """
+    Build the search backend's index, retrying until it succeeds. Cached
+    results computed while it was loading are dropped once it is ready.
+    """
+    while True:
+        try:
+            await search_backend.build()
+        except Exception as e:
+            logger.error(f"Error building the search index, retrying in {retry_delay}s: {e}")
+            await asyncio.sleep(retry_delay)
+            continue
+        invalidate_search_cache()
+        return
+
+async def add_user(user_id, first_name=None):
     """
     Add a user to users_col only if not already present.
-    Stores user_id, joined_date (UTC), and blocked status.
+    Stores user_id, first_name, joined_date (UTC), and blocked status, and
+    keeps first_name up to date for existing users.
     Returns the user document with an extra key '_new' (True if newly added).
     """
-    user_doc = users_col.find_one({"user_id": user_id})
+    user_doc = await users_col.find_one({"user_id": user_id})
     
     if not user_doc:
         user_doc = {
             "user_id": user_id,
+            "first_name": first_name,
             "joined": datetime.now(timezone.utc),
             "blocked": False
         }
 
-        users_col.insert_one(user_doc)
+        await users_col.insert_one(user_doc)
 
         user_doc["_new"] = True
     else:
+        if first_name and user_doc.get("first_name") != first_name:
+            await users_col.update_one({"user_id": user_id}, {"$set": {"first_name": first_name}})
+            user_doc["first_name"] = first_name
         user_doc["_new"] = False
-    
+
+    if first_name:
+        user_name_cache[user_id] = (first_name, time.monotonic())
+        user_name_failures.pop(user_id, None)
     return user_doc
 
 
-def authorize_user(user_id):
+async def authorize_user(user_id):
     """Authorize a user for 24 hours."""
     expiry = datetime.now(timezone.utc) + timedelta(seconds=TOKEN_VALIDITY_SECONDS)
-    auth_users_col.update_one(
+    await auth_users_col.update_one(
         {"user_id": user_id},
         {"$set": {"expiry": expiry}},
         upsert=True
     )
+    auth_cache.set_authorized(user_id, expiry)
 
-def is_user_authorized(user_id):
+async def is_user_authorized(user_id):
     if user_id == OWNER_ID:
         return True
     """Check if a user is authorized."""
-    doc = auth_users_col.find_one({"user_id": user_id})
+    cached = auth_cache.get(user_id)
+    if cached is not None:
+        return cached
+    doc = await auth_users_col.find_one(
+        {"user_id": user_id, "expiry": {"$gt": datetime.now(timezone.utc)}}
+    )
     if not doc:
+        auth_cache.set_unauthorized(user_id)
         return False
     expiry = doc["expiry"]
-    if isinstance(expiry, str):
-        try:
-            expiry = datetime.fromisoformat(expiry)
-        except Exception:
-            return False
-    if isinstance(expiry, datetime) and expiry.tzinfo is None:
+    if expiry.tzinfo is None:
         expiry = expiry.replace(tzinfo=timezone.utc)
-    if expiry < datetime.now(timezone.utc):
-        return False
+    auth_cache.set_authorized(user_id, expiry)
     return True
 
 async def get_user_link(user: User) -> str:
@@ -219,27 +312,65 @@ async def get_user_link(user: User) -> str:
     else:
         return first_name
 
-async def get_user_firstname(user_id: int) -> str:
-    """Gets a user's first name from the bot's API."""
+_user_name_refreshing = set()
+
+async def refresh_user_firstname(user_id: int):
+    """Fetch a user's first name from Telegram and store it in users_col."""
     from app import bot
     try:
-        if user_id == OWNER_ID:
-          return "ADMIN"
         user = await bot.get_users(user_id)
-        return user.first_name
+        user_name_cache[user_id] = (user.first_name or "Anonymous", time.monotonic())
+        if user.first_name:
+            await users_col.update_one({"user_id": user_id}, {"$set": {"first_name": user.first_name}})
     except Exception as e:
         logger.error(f"Error getting user's first name: {e}")
+        user_name_failures[user_id] = True
+    finally:
+        _user_name_refreshing.discard(user_id)
+
+def schedule_user_firstname_refresh(user_id: int):
+    if user_id not in _user_name_refreshing and user_id not in user_name_failures:
+        _user_name_refreshing.add(user_id)
+        asyncio.get_running_loop().create_task(refresh_user_firstname(user_id))
+
+async def get_user_firstname(user_id: int) -> str:
+    """
+    Gets a user's first name from the in-memory cache or users_col.
+    Telegram is only queried in the background, when the name is missing
+    or older than USER_NAME_REFRESH_SECONDS. Users whose lookup failed are
+    answered as "Anonymous" until the failure expires from user_name_failures.
+    """
+    if user_id == OWNER_ID:
+        return "ADMIN"
+    cached = user_name_cache.get(user_id)
+    if cached is not None:
+        first_name, loaded_at = cached
+        if time.monotonic() - loaded_at > USER_NAME_REFRESH_SECONDS:
+            schedule_user_firstname_refresh(user_id)
+        return first_name
+    if user_id in user_name_failures:
         return "Anonymous"
+    try:
+        user_doc = await users_col.find_one({"user_id": user_id}, {"_id": 0, "first_name": 1})
+    except Exception as e:
+        logger.error(f"Error getting user's first name: {e}")
+        user_doc = None
+    first_name = user_doc.get("first_name") if user_doc else None
+    if first_name:
+        user_name_cache[user_id] = (first_name, time.monotonic())
+        return first_name
+    schedule_user_firstname_refresh(user_id)
+    return "Anonymous"
     
 # =========================
 # Token Utilities
 # =========================
 
-def generate_token(user_id):
+async def generate_token(user_id):
     """Generate a new access token for a user."""
     token_id = str(uuid.uuid4())
     expiry = datetime.now(timezone.utc) + timedelta(seconds=TOKEN_VALIDITY_SECONDS)
-    tokens_col.insert_one({
+    await tokens_col.insert_one({
         "token_id": token_id,
         "user_id": user_id,
         "expiry": expiry,
@@ -247,18 +378,13 @@ def generate_token(user_id):
     })
     return token_id
 
-def is_token_valid(token_id, user_id):
+async def is_token_valid(token_id, user_id):
     """Check if a token is valid for a user."""
-    token = tokens_col.find_one({"token_id": token_id, "user_id": user_id})
-    if not token:
-        return False
-    expiry = token["expiry"]
-    if expiry.tzinfo is None:
-        expiry = expiry.replace(tzinfo=timezone.utc)
-    if expiry < datetime.now(timezone.utc):
-        tokens_col.delete_one({"_id": token["_id"]})
-        return False
-    return True
+    token = await tokens_col.find_one(
+        {"token_id": token_id, "user_id": user_id, "expiry": {"$gt": datetime.now(timezone.utc)}},
+        {"_id": 1}
+    )
+    return token is not None
 
 def get_token_link(token_id, bot_username):
     """Generate a Telegram deep link for a token."""
@@ -314,15 +440,14 @@ async def shorten_url(url):
             "format": "text"
         }
 
-        async with aiohttp.ClientSession() as session:
-            async with session.get(api_url, params=params) as response:
-                if response.status == 200:
-                    return (await response.text()).strip()
-                else:
-                    logger.error(
-                        f"URL shortening failed. Status code: {response.status}, Response: {await response.text()}"
-                    )
-                    return url
+        status, text = await http_client.get_text(api_url, "shortener", params=params)
+        if status == 200:
+            return text.strip()
+        else:
+            logger.error(
+                f"URL shortening failed. Status code: {status}, Response: {text}"
+            )
+            return url
     except Exception as e:
         logger.error(f"URL shortening failed: {e}")
         return url
@@ -330,24 +455,52 @@ async def shorten_url(url):
 # =========================
 # File Utilities
 # =========================
-def upsert_file_info(file_info):
+async def upsert_file_info(file_info):
     """Insert or update file info, avoiding duplicates."""
-    files_col.update_one(
+    return await files_col.update_one(
         {"channel_id": file_info["channel_id"], "message_id": file_info["message_id"]},
         {"$set": file_info},
         upsert=True
     )
 
-def upsert_tmdb_info(tmdb_id, tmdb_type, poster_path, name, year, rating, plot, trailer_url, imdb_id):
+async def bulk_upsert_file_info(file_infos):
+    """
+    Upsert many files with one unordered bulk_write.
+    Returns {index: upserted _id} for the documents that were inserted.
+    """
+    ops = [
+        UpdateOne(
+            {"channel_id": file_info["channel_id"], "message_id": file_info["message_id"]},
+            {"$set": file_info},
+            upsert=True
+        )
+        for file_info in file_infos
+    ]
+    try:
+        result = await files_col.bulk_write(ops, ordered=False)
+        return result.upserted_ids
+    except BulkWriteError as e:
+        # Unordered: everything except the failed operations was applied
+        logger.error(f"Bulk upsert failed for {len(e.details.get('writeErrors', []))} of {len(ops)} files.")
+        return {item["index"]: item["_id"] for item in e.details.get("upserted", [])}
+
+async def upsert_tmdb_info(tmdb_id, tmdb_type, poster_path, name, year, rating, plot, trailer_url, imdb_id):
     """
     Insert or update TMDB info in tmdb_col.
     """
-    tmdb_col.update_one(
+    await tmdb_col.update_one(
         {"tmdb_id": tmdb_id, "tmdb_type": tmdb_type},
         {"$set": {"title": name, "poster_path": poster_path, "year": year, "rating": rating, "plot": plot, "trailer_url": trailer_url, "imdb_id": imdb_id}},
         upsert=True
     )
+    tmdb_stored[(tmdb_id, tmdb_type)] = True
+
+def forget_tmdb_entry(tmdb_id, tmdb_type=None):
+    """Drop a deleted TMDB entry from the in-memory resolution memo."""
+    for kind in ([tmdb_type] if tmdb_type else ["movie", "tv"]):
+        tmdb_stored.pop((tmdb_id, kind), None)
 
+@with_priority(BULK)
 async def restore_tmdb_photos(bot, start_id=None):
     """
     Restore all TMDB poster photos from the database.
@@ -356,8 +509,7 @@ async def restore_tmdb_photos(bot, start_id=None):
     query = {}
     if start_id:
         query['_id'] = {'$gt': start_id}
-    cursor = tmdb_col.find(query).sort('_id', 1)
-    docs = list(cursor)
+    docs = await tmdb_col.find(query).sort('_id', 1).to_list(None)
     for doc in docs:
         tmdb_id = doc.get("tmdb_id")
         tmdb_type = doc.get("tmdb_type")
@@ -413,7 +565,7 @@ def extract_file_info(message, channel_id=None):
         file_info["file_size"] = getattr(message.photo, "file_size", None)
         file_info["file_format"] = "image/jpeg"
     if file_info["file_name"]:
-        file_info["file_name"] = remove_extension(re.sub(r"[',]", "", file_info["file_name"].replace("&", "and")))
+        file_info["file_name"] = clean_file_name(file_info["file_name"])
     return file_info
 
 def human_readable_size(size):
@@ -426,19 +578,15 @@ def human_readable_size(size):
 def remove_extension(caption):
     try:
         # Remove the extension and everything after it
-        cleaned_caption = re.sub(r'\.(mkv|mp4|webm).*$', '', caption, flags=re.IGNORECASE)
-        return cleaned_caption
+        return strip_extension(caption)
     except Exception as e:
         logger.error(e)
         return None
     
 def remove_unwanted(caption):
     try:
-        # Match and keep everything up to and including the extension
-        match = re.match(r'^(.*?\.(mkv|mp4|webm))', caption, flags=re.IGNORECASE)
-        if match:
-            return match.group(1)
-        return caption  # Return original if no match
+        # Keep everything up to and including the extension
+        return keep_up_to_extension(caption)
     except Exception as e:
         logger.error(e)
         return None
@@ -447,17 +595,23 @@ def remove_unwanted(caption):
 # Async/Bot Utilities
 # =========================
 async def safe_api_call(coro):
-    """Utility wrapper to add delay before every bot API call."""
+    """
+    Await a bot API call, returning None on failure. Rate limiting and
+    FloodWait retries happen in the scheduler behind Bot.invoke, so a
+    FloodWait reaching here means the scheduler already gave up.
+    """
     try:
         return await coro
     except (UserIsBlocked, InputUserDeactivated, PeerIdInvalid, UserIsBot) as e:
         raise e
     except FloodWait as e:
-        await asyncio.sleep(e.value * 1.2)
+        logger.warning(f"Giving up on API call after FloodWait of {e.value}s")
+        return None
     except Exception as e:
         logger.error(f"An error occurred during an API call: {e}")
         return None
 
+@with_priority(BULK)
 async def delete_after_delay(client, channel_id, message_id, delay=AUTO_DELETE_SECONDS):
     await asyncio.sleep(delay)
     try:
@@ -465,6 +619,7 @@ async def delete_after_delay(client, channel_id, message_id, delay=AUTO_DELETE_S
     except Exception as e:
         logger.error(f"Failed to auto delete message: {e}")
 
+@with_priority(BULK)
 async def auto_delete_message(user_message, bot_message):
     try:        
         await asyncio.sleep(AUTO_DELETE_SECONDS)
@@ -490,49 +645,424 @@ async def extract_tmdb_link(tmdb_url):
     else:
         raise ValueError("Invalid TMDB link. Must be a movie, tv, or collection link.")
     return tmdb_type, tmdb_id
-        
+
+# =========================
+# Bulk Job Utilities
+# =========================
+
+async def load_checkpoint(key):
+    return await checkpoints_col.find_one({"_id": key})
+
+async def save_checkpoint(key, **fields):
+    fields["updated_at"] = datetime.now(timezone.utc)
+    await checkpoints_col.update_one({"_id": key}, {"$set": fields}, upsert=True)
+
+async def clear_checkpoint(key):
+    await checkpoints_col.delete_one({"_id": key})
+
+class PipelineTracker:
+    """
+    Follows the files a bulk job queued until they leave the persist stage,
+    grouped by the batch they came from (keys must be tracked or sealed in
+    increasing order). `persisted_through` is the last key up to which every
+    batch is sealed and stored, which is how far a checkpoint may move.
+    """
+
+    def __init__(self):
+        self._pending = {}  # key -> files still in the pipeline, in key order
+        self._sealed = set()
+        self._failed = set()
+        self._drained = asyncio.Event()
+        self._drained.set()
+        self.persisted_through = None
+
+    def track(self, key):
+        """Count one more file for `key`; returns the callback the pipeline calls when it is done."""
+        self._pending[key] = self._pending.get(key, 0) + 1
+        self._drained.clear()
+        return lambda ok=True: self._done(key, ok)
+
+    def seal(self, key):
+        """No more files will be tracked for `key`."""
+        self._pending.setdefault(key, 0)
+        self._sealed.add(key)
+        self._advance()
+
+    def _done(self, key, ok):
+        self._pending[key] -= 1
+        if not ok:
+            self._failed.add(key)
+        self._advance()
+
+    def _advance(self):
+        while self._pending:
+            key, count = next(iter(self._pending.items()))
+            if count or key not in self._sealed or key in self._failed:
+                break
+            del self._pending[key]
+            self._sealed.discard(key)
+            self.persisted_through = key
+        if not any(self._pending.values()):
+            self._drained.set()
+
+    @property
+    def failed(self):
+        return bool(self._failed)
+
+    def unfinished(self):
+        """Keys not yet covered by persisted_through, in order."""
+        return list(self._pending)
+
+    async def drained(self):
+        """Wait until no tracked file is left in the pipeline."""
+        await self._drained.wait()
+
+class ProgressEditor:
+    """Edits a status message at most once every `interval` seconds."""
+
+    def __init__(self, message, interval=PROGRESS_EDIT_SECONDS, reply_markup=None):
+        self.message = message
+        self.interval = interval
+        self.reply_markup = reply_markup
+        self.last_text = None
+        self.last_edit = 0.0
+
+    async def update(self, text, force=False):
+        now = time.monotonic()
+        if text == self.last_text or (not force and now - self.last_edit < self.interval):
+            return
+        self.last_text = text
+        self.last_edit = now
+        await safe_api_call(self.message.edit_text(text, reply_markup=self.reply_markup))
+
+async def call_with_bucket(bucket, make_call):
+    """
+    Await make_call() under `bucket`. FloodWait is already retried by the
+    RPC scheduler; one that still gets through pauses the bucket, so the
+    rest of the job backs off, and is raised to the caller.
+    """
+    await bucket.acquire()
+    try:
+        return await make_call()
+    except FloodWait as e:
+        bucket.pause(e.value)
+        raise
+
+async def get_messages_batch(client, chat_id, ids, bucket):
+    """
+    get_messages for up to 200 ids under `bucket`, dropping empty messages.
+    Errors are raised, so callers never checkpoint past a batch they did not get.
+    """
+    try:
+        messages = await call_with_bucket(bucket, lambda: client.get_messages(chat_id, ids))
+    except Exception as e:
+        logger.warning(f"Could not get messages in batch {ids[0]}-{ids[-1]}: {e}")
+        raise
+    return [msg for msg in messages if msg and not msg.empty]
+
+async def iter_message_batches(client, chat_id, start_id, end_id, batch_size=INDEX_BATCH_SIZE,
+                               concurrency=INDEX_CONCURRENCY, bucket=None):
+    """
+    Yields (batch_end, messages) for start_id..end_id in order, keeping up to
+    `concurrency` get_messages calls in flight ahead of the consumer. A batch
+    that cannot be fetched raises, after every batch before it was yielded.
+    """
+    bucket = bucket or TokenBucket(INDEX_BATCHES_PER_SECOND)
+    ranges = iter(range(start_id, end_id + 1, batch_size))
+    in_flight = deque()
+
+    def schedule():
+        batch_start = next(ranges, None)
+        if batch_start is None:
+            return
+        batch_end = min(batch_start + batch_size - 1, end_id)
+        ids = list(range(batch_start, batch_end + 1))
+        in_flight.append((batch_end, asyncio.create_task(get_messages_batch(client, chat_id, ids, bucket))))
+
+    try:
+        for _ in range(max(concurrency, 1)):
+            schedule()
+        while in_flight:
+            batch_end, task = in_flight.popleft()
+            messages = await task
+            schedule()
+            yield batch_end, messages
+    finally:
+        for _, task in in_flight:
+            task.cancel()
+
 # =========================
 # Queue System for File Processing
 # =========================
 
-file_queue = asyncio.Queue()
+# file_queue -> dedupe (batched duplicate check) -> metadata_queue -> metadata
+# workers (TMDB lookup) -> persist_queue -> persist workers (bulk upsert,
+# search index, audio). All queues are bounded so /index and /copy get
+# backpressure instead of buffering whole channels in memory.
+# file_queue.task_done() is only called once an item has left the last stage,
+# so file_queue.join() still means "everything queued so far is persisted".
+file_queue = asyncio.Queue(maxsize=FILE_QUEUE_MAXSIZE)
+metadata_queue = asyncio.Queue(maxsize=FILE_QUEUE_MAXSIZE)
+persist_queue = asyncio.Queue(maxsize=FILE_QUEUE_MAXSIZE)
+
+class StageStats:
+    """Counters and recent throughput for one pipeline stage."""
+
+    def __init__(self, name, window=60):
+        self.name = name
+        self.window = window
+        self.processed = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+        self._completed = deque()
+
+    def record(self, started, ok=True):
+        now = time.monotonic()
+        self.busy_seconds += now - started
+        if ok:
+            self.processed += 1
+        else:
+            self.failed += 1
+        self._completed.append(now)
+        while self._completed and self._completed[0] < now - self.window:
+            self._completed.popleft()
+
+    def throughput(self):
+        """Items per second over the last `window` seconds."""
+        now = time.monotonic()
+        while self._completed and self._completed[0] < now - self.window:
+            self._completed.popleft()
+        return len(self._completed) / self.window
+
+    def as_dict(self):
+        return {
+            "processed": self.processed,
+            "failed": self.failed,
+            "busy_seconds": round(self.busy_seconds, 2),
+            "throughput_per_sec": round(self.throughput(), 2),
+        }
+
+class FlushStats:
+    """Size and latency of bulk operations, for tuning batch settings."""
+
+    def __init__(self):
+        self.flushes = 0
+        self.items = 0
+        self.total_seconds = 0.0
+        self.last_size = 0
+        self.last_seconds = 0.0
+
+    def record(self, size, seconds):
+        self.flushes += 1
+        self.items += size
+        self.total_seconds += seconds
+        self.last_size = size
+        self.last_seconds = seconds
+
+    def as_dict(self):
+        return {
+            "flushes": self.flushes,
+            "avg_size": round(self.items / self.flushes, 2) if self.flushes else 0.0,
+            "avg_ms": round(self.total_seconds * 1000 / self.flushes, 2) if self.flushes else 0.0,
+            "last_size": self.last_size,
+            "last_ms": round(self.last_seconds * 1000, 2),
+        }
+
+dedupe_stats = StageStats("dedupe")
+metadata_stats = StageStats("metadata")
+persist_stats = StageStats("persist")
+dedupe_flush_stats = FlushStats()
+persist_flush_stats = FlushStats()
+pending_files = 0
+# Names of files between dedupe and persist. They are not in files_col yet,
+# so the duplicate check has to look here too. Counted, because files queued
+# with duplicate=False may share a name.
+inflight_file_names = Counter()
+
+def _claim_file_name(name):
+    inflight_file_names[name] += 1
+
+def _release_file_name(name):
+    inflight_file_names[name] -= 1
+    if inflight_file_names[name] <= 0:
+        del inflight_file_names[name]
+
+def _file_done(on_done=None, ok=True):
+    """Mark a queued file as having left the pipeline; `ok` is False if it was not stored."""
+    global pending_files
+    pending_files -= 1
+    file_queue.task_done()
+    if on_done is not None:
+        on_done(ok)
 
 def get_queue_size():
-    """Returns the current size of the file processing queue."""
-    return file_queue.qsize()
+    """Returns the number of queued files that have not been persisted yet."""
+    return pending_files
+
+def get_pipeline_stats():
+    """Queue depths and per-stage throughput of the file processing pipeline."""
+    return {
+        "pending": get_queue_size(),
+        "queues": {
+            "dedupe": file_queue.qsize(),
+            "metadata": metadata_queue.qsize(),
+            "persist": persist_queue.qsize(),
+            "overflow": len(file_overflow),
+        },
+        "overflowed": overflowed_files,
+        "workers": {
+            "metadata": FILE_METADATA_WORKERS,
+            "persist": FILE_PERSIST_WORKERS,
+        },
+        "stages": {
+            "dedupe": dedupe_stats.as_dict(),
+            "metadata": metadata_stats.as_dict(),
+            "persist": persist_stats.as_dict(),
+        },
+        "flushes": {
+            "dedupe": dedupe_flush_stats.as_dict(),
+            "persist": persist_flush_stats.as_dict(),
+        },
+    }
 
-async def handle_duplicate_file(bot, file_info):
-    """Checks for duplicate files and logs if found."""
-    existing = files_col.find_one({
-        "file_name": file_info["file_name"]
-    })
-  
-    if existing:
-        telegram_link = generate_c_link(file_info["channel_id"], file_info["message_id"])
-        await safe_api_call(
-            bot.send_message(
-                LOG_CHANNEL_ID,
-                f"⚠️ Duplicate File.\nLink: {telegram_link}",
-                parse_mode=enums.ParseMode.HTML
-            )
+async def collect_batch(queue, max_size=PERSIST_BATCH_SIZE, max_wait_ms=PERSIST_FLUSH_MS):
+    """Wait for one item, then gather more until max_size items or max_wait_ms elapse."""
+    items = [await queue.get()]
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + max_wait_ms / 1000
+    while len(items) < max_size:
+        if not queue.empty():
+            items.append(queue.get_nowait())
+            continue
+        timeout = deadline - loop.time()
+        if timeout <= 0:
+            break
+        try:
+            items.append(await asyncio.wait_for(queue.get(), timeout))
+        except asyncio.TimeoutError:
+            break
+    return items
+
+async def find_duplicate_files(file_infos):
+    """
+    Returns the indexes of `file_infos` whose file_name is already stored,
+    still on its way through the pipeline, or repeats an earlier name in the
+    same batch. One $in query per batch.
+    """
+    names = list({file_info["file_name"] for file_info in file_infos})
+    existing = {name for name in names if name in inflight_file_names}
+    existing.update([
+        doc["file_name"]
+        async for doc in files_col.find({"file_name": {"$in": names}}, {"_id": 0, "file_name": 1})
+    ])
+    duplicates = set()
+    for i, file_info in enumerate(file_infos):
+        if file_info["file_name"] in existing:
+            duplicates.add(i)
+        existing.add(file_info["file_name"])
+    return duplicates
+
+async def log_duplicate_file(bot, file_info):
+    telegram_link = generate_c_link(file_info["channel_id"], file_info["message_id"])
+    await safe_api_call(
+        bot.send_message(
+            LOG_CHANNEL_ID,
+            f"⚠️ Duplicate File.\nLink: {telegram_link}",
+            parse_mode=enums.ParseMode.HTML
         )
-        return True
-    return False
+    )
 
 async def process_audio_file(bot, message):
-    """Processes audio files: downloads, gets thumbnail, sends info, and cleans up."""
+    """Processes audio files: gets the cover art and sends it with the track info."""
     try:
-        audio_path = await bot.download_media(message)
-        thumb_path = await get_audio_thumbnail(audio_path)
-        if thumb_path:
+        cover = await get_audio_cover(bot, message)
+        if cover:
+            photo = io.BytesIO(cover)
+            photo.name = f"cover_{message.id}.jpg"
             file_info_text = f"🎧 <b>Title:</b> {message.audio.title}\n🧑‍🎤 <b>Artist:</b> {message.audio.performer}"
-            await bot.send_photo(UPDATE_CHANNEL_ID2, photo=thumb_path, caption=file_info_text)
-            os.remove(thumb_path)
-        os.remove(audio_path)
+            await bot.send_photo(UPDATE_CHANNEL_ID2, photo=photo, caption=file_info_text)
     except Exception as e:
         logger.error(f"Error processing audio file: {e}")
 
 
+# In-flight TMDB work, so concurrent workers share one lookup per key
+_tmdb_title_inflight = {}
+_tmdb_store_inflight = {}
+
+async def single_flight(inflight, key, factory):
+    """Run factory() once per key at a time; concurrent callers share its result."""
+    future = inflight.get(key)
+    if future is not None:
+        return await asyncio.shield(future)
+    future = asyncio.get_running_loop().create_future()
+    inflight[key] = future
+    try:
+        result = await factory()
+    except BaseException:
+        future.set_result(None)
+        raise
+    else:
+        future.set_result(result)
+        return result
+    finally:
+        inflight.pop(key, None)
+
+async def resolve_tmdb_title(title, year, kind):
+    """
+    Resolve a parsed title to a TMDB search result, memoized by
+    (normalized title, year, kind). Not-found results are left to the
+    persistent TMDB cache so a transient failure is not memoized.
+    """
+    key = (' '.join(title.lower().split()), year, kind)
+    result = tmdb_title_memo.get(key)
+    if result is not None:
+        return result
+
+    async def lookup():
+        if kind == "tv":
+            return await get_tv_id(title, year)
+        return await get_movie_id(title, year)
+
+    result = await single_flight(_tmdb_title_inflight, key, lookup)
+    if result:
+        tmdb_title_memo[key] = result
+    return result
+
+async def store_tmdb_entry(bot, tmdb_id, tmdb_type):
+    """Fetch and store TMDB info and post the update, unless it is already stored."""
+    exists = await tmdb_col.find_one({"tmdb_id": tmdb_id, "tmdb_type": tmdb_type}, {"_id": 1})
+    if exists:
+        tmdb_stored[(tmdb_id, tmdb_type)] = True
+        return
+
+    info = await get_info(tmdb_type, tmdb_id)
+    poster_url = info.get('poster_url')
+    poster_path = info.get('poster_path')
+    trailer_url = info.get('trailer_url')
+    message = info.get('message')
+    name = info.get('title')
+    year = info.get('year')
+    rating = info.get('rating')
+    plot = info.get("plot")
+    imdb_id = info.get("imdb_id")
+
+    keyboard = InlineKeyboardMarkup(
+        [[InlineKeyboardButton("🎥 Trailer", url=trailer_url)]]
+    ) if trailer_url else None
+    
+    await upsert_tmdb_info(tmdb_id, tmdb_type, poster_path, name, year, rating, plot, trailer_url, imdb_id)
+
+    if poster_url and SEND_UPDATES:
+        await safe_api_call(
+            bot.send_photo(
+                UPDATE_CHANNEL_ID,
+                photo=poster_url,
+                caption=message,
+                parse_mode=enums.ParseMode.HTML,
+                reply_markup=keyboard
+            )
+        )
+
 async def process_tmdb_info(bot, file_info):
     """
     Processes TMDB info for a file
@@ -549,10 +1079,8 @@ async def process_tmdb_info(bot, file_info):
         season = parsed_data.get("season")
         episode = parsed_data.get("episode")
 
-        if season or episode:
-            result = await get_tv_id(title, year)
-        else:
-            result = await get_movie_id(title, year)
+        kind = "tv" if season or episode else "movie"
+        result = await resolve_tmdb_title(title, year, kind)
 
         if not result:
             await safe_api_call(bot.send_message(LOG_CHANNEL_ID, f"TMDB Info not found for {file_info['file_name']}"))
@@ -564,36 +1092,12 @@ async def process_tmdb_info(bot, file_info):
         file_info['tmdb_id'] = tmdb_id
         file_info['tmdb_type'] = tmdb_type
 
-        exists = tmdb_col.find_one({"tmdb_id": tmdb_id, "tmdb_type": tmdb_type})
-
-        if not exists:
-            info = await get_info(tmdb_type, tmdb_id)
-            poster_url = info.get('poster_url')
-            poster_path = info.get('poster_path')
-            trailer_url = info.get('trailer_url')
-            message = info.get('message')
-            name = info.get('title')
-            year = info.get('year')
-            rating = info.get('rating')
-            plot = info.get("plot")
-            imdb_id = info.get("imdb_id")
-
-            keyboard = InlineKeyboardMarkup(
-                [[InlineKeyboardButton("🎥 Trailer", url=trailer_url)]]
-            ) if trailer_url else None
-            
-            upsert_tmdb_info(tmdb_id, tmdb_type, poster_path, name, year, rating, plot, trailer_url, imdb_id)
-
-            if poster_url and SEND_UPDATES:
-                await safe_api_call(
-                    bot.send_photo(
-                        UPDATE_CHANNEL_ID,
-                        photo=poster_url,
-                        caption=message,
-                        parse_mode=enums.ParseMode.HTML,
-                        reply_markup=keyboard
-                    )
-                )
+        if (tmdb_id, tmdb_type) not in tmdb_stored:
+            await single_flight(
+                _tmdb_store_inflight,
+                (tmdb_id, tmdb_type),
+                lambda: store_tmdb_entry(bot, tmdb_id, tmdb_type)
+            )
 
         return tmdb_id, tmdb_type
 
@@ -602,65 +1106,200 @@ async def process_tmdb_info(bot, file_info):
         return None
 
 
-async def file_queue_worker(bot):
+@with_priority(DEFAULT)
+async def dedupe_worker(bot):
+    """Stage 1: batched duplicate check."""
     while True:
-        item = await file_queue.get()
-        file_info, _, message, duplicate = item
+        batch = await collect_batch(file_queue)
+        started = time.monotonic()
+        handled = 0
+        forwarded = set()
+        duplicates = set()
         try:
-            if duplicate and await handle_duplicate_file(bot, file_info):
-                continue
-
-            # Process TMDB info and get the result
-            tmdb_result = await process_tmdb_info(bot, file_info)
-
-            # Upsert file_info after TMDB processing
-            upsert_file_info(file_info)
-
-            if message.audio:
-                await process_audio_file(bot, message)
+            checked = [i for i, item in enumerate(batch) if item[3]]
+            if checked:
+                found = await find_duplicate_files([batch[i][0] for i in checked])
+                duplicates = {checked[j] for j in found}
+            dedupe_flush_stats.record(len(batch), time.monotonic() - started)
+
+            for i, (file_info, _, message, _, on_done) in enumerate(batch):
+                if i in duplicates:
+                    await log_duplicate_file(bot, file_info)
+                else:
+                    _claim_file_name(file_info["file_name"])
+                    try:
+                        await metadata_queue.put((file_info, message, on_done))
+                    except BaseException:
+                        _release_file_name(file_info["file_name"])
+                        raise
+                    forwarded.add(i)
+                handled += 1
+                dedupe_stats.record(started)
+        except Exception as e:
+            logger.error(f"❌ Error checking duplicates: {e}")
+            for _ in range(len(batch) - handled):
+                dedupe_stats.record(started, ok=False)
+        finally:
+            # Files forwarded to the next stage are finished by a later stage;
+            # the rest are duplicates (ok) or were dropped by an error
+            for i, item in enumerate(batch):
+                if i not in forwarded:
+                    _file_done(item[4], ok=i in duplicates)
+
+@with_priority(DEFAULT)
+async def metadata_worker(bot):
+    """Stage 2: TMDB resolution."""
+    while True:
+        file_info, message, on_done = await metadata_queue.get()
+        started = time.monotonic()
+        forwarded = False
+        try:
+            # Process TMDB info before the file is persisted
+            await process_tmdb_info(bot, file_info)
+            metadata_stats.record(started)
 
+            await persist_queue.put((file_info, message, on_done))
+            forwarded = True
+        except Exception as e:
+            metadata_stats.record(started, ok=False)
+            logger.error(f"❌ Error resolving file metadata: {e}")
+        finally:
+            metadata_queue.task_done()
+            if not forwarded:
+                _release_file_name(file_info["file_name"])
+                _file_done(on_done, ok=False)
+
+@with_priority(DEFAULT)
+async def persist_worker(bot):
+    """Stage 3: bulk upsert, search index update and audio handling."""
+    while True:
+        batch = await collect_batch(persist_queue)
+        started = time.monotonic()
+        ok = False
+        try:
+            # Upserts are keyed by (channel_id, message_id), so the order in
+            # which workers finish does not matter; keep the last copy of a key
+            latest = {}
+            for file_info, message, _ in batch:
+                latest[(file_info["channel_id"], file_info["message_id"])] = (file_info, message)
+            items = list(latest.values())
+
+            upserted_ids = await bulk_upsert_file_info([file_info for file_info, _ in items])
+            persist_flush_stats.record(len(items), time.monotonic() - started)
+            ok = True
+
+            for i, (file_info, _) in enumerate(items):
+                await search_backend.add({**file_info, "_id": upserted_ids.get(i)})
+            schedule_search_cache_invalidation()
+
+            for file_info, message in items:
+                if message.audio:
+                    await process_audio_file(bot, message)
+            for _ in batch:
+                persist_stats.record(started)
         except Exception as e:
-            logger.error(f"❌ Error saving file: {e}")
+            for _ in batch:
+                persist_stats.record(started, ok=False)
+            logger.error(f"❌ Error saving files: {e}")
         finally:
-            file_queue.task_done()
+            # Stored once the upsert went through, even if a later step failed
+            for file_info, _, on_done in batch:
+                _release_file_name(file_info["file_name"])
+                persist_queue.task_done()
+                _file_done(on_done, ok=ok)
+
+def start_file_workers(bot):
+    """Start the dedupe, metadata and persistence workers on the bot loop."""
+    tasks = [bot.loop.create_task(dedupe_worker(bot))]
+    tasks += [bot.loop.create_task(metadata_worker(bot)) for _ in range(max(FILE_METADATA_WORKERS, 1))]
+    tasks += [bot.loop.create_task(persist_worker(bot)) for _ in range(max(FILE_PERSIST_WORKERS, 1))]
+    return tasks
 
 # =========================
 # Unified File Queueing
 # =========================
 
-async def queue_file_for_processing(message, channel_id=None, reply_func=None, duplicate=True):
-    try:            
+async def queue_file_for_processing(message, channel_id=None, reply_func=None, duplicate=True, on_done=None):
+    """
+    Queue a message's file for the pipeline. `on_done(ok)` is called exactly
+    once: when the file leaves the pipeline, or right away if nothing is queued.
+    """
+    global pending_files
+    queued = False
+    try:
         file_info = extract_file_info(message, channel_id=channel_id)
         if file_info["file_name"]:
-            await file_queue.put((file_info, reply_func, message, duplicate))
+            pending_files += 1
+            try:
+                await file_queue.put((file_info, reply_func, message, duplicate, on_done))
+                queued = True
+            except BaseException:
+                pending_files -= 1
+                raise
     except Exception as e:
         if reply_func:
             await safe_api_call(reply_func(f"❌ Error queuing file: {e}"))
-
-def delete_expired_auth_users():
+    finally:
+        if not queued and on_done is not None:
+            on_done(True)
+
+# Files from channel posts that arrived while file_queue was full, in arrival
+# order. Update handlers must not block on the bounded queue, and channel
+# posts cannot be re-read later like an /index range, so they wait here and
+# a background task feeds them into file_queue as it drains.
+file_overflow = deque()
+overflowed_files = 0
+_overflow_drainer = None
+
+async def _drain_file_overflow():
+    while file_overflow:
+        await file_queue.put(file_overflow[0])
+        file_overflow.popleft()
+
+def queue_file_nowait(message, channel_id=None):
     """
-    Delete expired auth users from auth_users_col using 'expiry' field.
+    Non-blocking queue_file_for_processing for update handlers.
+    Returns False if the message has no file to process.
     """
-    now = datetime.now(timezone.utc)
-    result = auth_users_col.delete_many({"expiry": {"$lt": now}})
-    logger.info(f"Deleted {result.deleted_count} expired auth users.")
-
-def delete_expired_tokens():
-    """
-    Delete expired tokens from tokens_col using 'expiry' field.
-    """
-    now = datetime.now(timezone.utc)
-    result = tokens_col.delete_many({"expiry": {"$lt": now}})
-    logger.info(f"Deleted {result.deleted_count} expired tokens.")
+    global pending_files, overflowed_files, _overflow_drainer
+    file_info = extract_file_info(message, channel_id=channel_id)
+    if not file_info["file_name"]:
+        return False
+    item = (file_info, None, message, True, None)
+    pending_files += 1
+    if not file_overflow:
+        try:
+            file_queue.put_nowait(item)
+            return True
+        except asyncio.QueueFull:
+            pass
+    file_overflow.append(item)
+    overflowed_files += 1
+    if _overflow_drainer is None or _overflow_drainer.done():
+        _overflow_drainer = asyncio.get_running_loop().create_task(_drain_file_overflow())
+    return True
 
-async def periodic_expiry_cleanup(interval_seconds=3600 * 4):
+async def migrate_expiry_fields():
     """
-    Periodically delete expired auth users and tokens.
+    One-off migration of legacy string 'expiry' values in auth_users_col and
+    tokens_col to datetimes, so the TTL indexes can expire them. Values that
+    cannot be parsed were never honoured and are deleted.
     """
-    while True:
-        delete_expired_auth_users()
-        delete_expired_tokens()
-        await asyncio.sleep(interval_seconds)
+    for col in (auth_users_col, tokens_col):
+        converted = removed = 0
+        async for doc in col.find({"expiry": {"$type": "string"}}, {"_id": 1, "expiry": 1}):
+            try:
+                expiry = datetime.fromisoformat(doc["expiry"])
+            except ValueError:
+                await col.delete_one({"_id": doc["_id"]})
+                removed += 1
+                continue
+            if expiry.tzinfo is None:
+                expiry = expiry.replace(tzinfo=timezone.utc)
+            await col.update_one({"_id": doc["_id"]}, {"$set": {"expiry": expiry}})
+            converted += 1
+        if converted or removed:
+            logger.info(f"Migrated expiry in {col.name}: {converted} converted, {removed} removed.")
 
 
 def remove_redandent(filename):
@@ -673,50 +1312,110 @@ def remove_redandent(filename):
     Returns:
         str: Filename with usernames removed
     """
-    filename = filename.replace("\n", "\\n")
+    return strip_uploader_tags(filename)
 
-    patterns = [
-        r"^@[\w\.-]+?(?=_)",
-        r"_@[A-Za-z]+_|@[A-Za-z]+_|[\[\]\s@]*@[^.\s\[\]]+[\]\[\s@]*",  
-        r"^[\w\.-]+?(?=_Uploads_)",  
-        r"^(?:by|from)[\s_-]+[\w\.-]+?(?=_)",  
-        r"^\[[\w\.-]+?\][\s_-]*",  
-        r"^\([\w\.-]+?\)[\s_-]*",  
-    ]
+class MissingChunk(Exception):
+    """Raised by SparseMediaFile when a read needs a chunk that is not loaded yet."""
 
-    result = filename
-    for pattern in patterns:
-        match = re.search(pattern, result)
-        if match:
-            result = re.sub(pattern, " ", result)
-            break  
+    def __init__(self, index):
+        super().__init__(f"Chunk {index} not loaded")
+        self.index = index
 
-    
-    result = re.sub(r"^[_\s-]+|[_\s-]+$", " ", result)
+class SparseMediaFile(io.RawIOBase):
+    """
+    Read-only file object over the chunks of a remote file that have been
+    fetched so far. Reading anything else raises MissingChunk, so the caller
+    can fetch that chunk and parse again.
+    """
 
-    return result
+    def __init__(self, size, chunks, chunk_size=MEDIA_CHUNK_SIZE):
+        self.size = size
+        self.chunks = chunks
+        self.chunk_size = chunk_size
+        self.pos = 0
+
+    def readable(self):
+        return True
 
-async def get_audio_thumbnail(audio_path, output_dir="downloads"):
-    audio = MutagenFile(audio_path)
-    thumbnail_path = os.path.join(output_dir, "audio_thumbnail.jpg")
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.pos
+        elif whence == io.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise OSError("Negative seek position")
+        self.pos = offset
+        return self.pos
+
+    def read(self, size=-1):
+        end = self.size if size is None or size < 0 else min(self.pos + size, self.size)
+        parts = []
+        while self.pos < end:
+            index, offset = divmod(self.pos, self.chunk_size)
+            chunk = self.chunks.get(index)
+            if chunk is None:
+                raise MissingChunk(index)
+            part = chunk[offset:offset + end - self.pos]
+            if not part:
+                break
+            parts.append(part)
+            self.pos += len(part)
+        return b"".join(parts)
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+def get_audio_thumbnail(audio_file):
+    """Returns the embedded cover art of an audio file (path or file object) as bytes."""
+    audio = MutagenFile(audio_file)
 
     if isinstance(audio, MP3):
         if audio.tags and isinstance(audio.tags, ID3):
             for tag in audio.tags.values():
                 if isinstance(tag, APIC):
-                    with open(thumbnail_path, "wb") as img_file:
-                        img_file.write(tag.data)
-                    return thumbnail_path
+                    return tag.data
     elif isinstance(audio, FLAC):
         if audio.pictures:
-            with open(thumbnail_path, "wb") as img_file:
-                img_file.write(audio.pictures[0].data)
-            return thumbnail_path
+            return audio.pictures[0].data
     elif isinstance(audio, MP4):
         if audio.tags and 'covr' in audio.tags:
-            cover = audio.tags['covr'][0]
-            with open(thumbnail_path, "wb") as img_file:
-                img_file.write(cover)
-            return thumbnail_path
+            return bytes(audio.tags['covr'][0])
     
     return None
+
+async def read_embedded_cover(bot, message, max_chunks=AUDIO_COVER_MAX_CHUNKS):
+    """
+    Parse the tags of an audio message while downloading only the chunks
+    mutagen actually reads (ID3 header, FLAC metadata blocks, MP4 moov).
+    """
+    size = message.audio.file_size
+    chunks = {}
+    wanted = 0
+    while len(chunks) < max_chunks:
+        async for chunk in bot.stream_media(message, offset=wanted, limit=1):
+            chunks[wanted] = chunk
+        if wanted not in chunks:
+            return None
+        try:
+            return get_audio_thumbnail(SparseMediaFile(size, chunks))
+        except MissingChunk as e:
+            wanted = e.index
+    logger.info(f"Cover of audio {message.id} needs more than {max_chunks} chunks, skipping.")
+    return None
+
+async def get_audio_cover(bot, message):
+    """Cover art for an audio message: Telegram's thumbnail if present, else the embedded one."""
+    thumbs = message.audio.thumbs
+    if thumbs:
+        thumb = max(thumbs, key=lambda t: (t.width or 0) * (t.height or 0))
+        cover = await bot.download_media(thumb.file_id, in_memory=True)
+        return cover.getvalue()
+    return await read_embedded_cover(bot, message)